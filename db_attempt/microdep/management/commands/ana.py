@@ -1,5 +1,6 @@
 # imports
 import gzip
+import time
 
 from django.utils import timezone
 from django.core import management
@@ -14,14 +15,26 @@ from microdep import utils as microdep_utils
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument('--node', help="only this node's partitions (and --day)")
+        parser.add_argument('--day', help="only this day yyyy-mm-dd (of every node without --node)")
+        parser.add_argument('--stream', type=int, help="only this stream id, default: all streams")
+        parser.add_argument('--page-size', type=int, default=100000, help="rows per keyset page")
+
     def handle(self, *args, **options):
         print(f"\n== COMMAND: {__file__} ==")
 
         ca = microdep_utils.CrudeAnalyzer2(window_size=1000)
 
-        for record in microdep_models.CrudeRecord.objects.filter(stream_id=1)[:3000]:
-            ca.add_record(record)
-            # print(record.__dict__)
+        records = microdep_models.CrudeRecord.objects.all()
+        if options['node'] is not None or options['day'] is not None:
+            records = records.partition(node=options['node'], day=options['day'])
+        if options['stream'] is not None:
+            records = records.filter(stream_id=options['stream'])
+        start = time.perf_counter()
+        rows = ca.replay(records.replay(page_size=options['page_size'])) # tuples in (stream_id, seq) order, constant memory
+        elapsed = time.perf_counter() - start
+        print(f"{rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)")
 
         print(ca)
         print(ca.stats)
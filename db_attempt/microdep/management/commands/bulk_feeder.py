@@ -0,0 +1,63 @@
+# imports
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from microdep import models as microdep_models
+from microdep import utils as microdep_utils
+# End: imports -----------------------------------------------------------------
+
+# Settings:
+REPORT_EVERY: float = 10.0 # seconds between progress lines
+
+
+class Command(BaseCommand):
+    help = "Load crude files into CrudeRecord with bulk_create in chunked transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="crude files (.gz or plain text)")
+        parser.add_argument('--batch-size', type=int, default=5000, help="rows per bulk_create")
+        parser.add_argument('--transaction-size', type=int, default=100000, help="rows per transaction")
+        parser.add_argument('--workers', type=int, default=1, help="files parsed in parallel processes, rows are inserted by this process")
+        parser.add_argument('--node', help="partition node, default: from the path {node}/{yyyy-mm-dd}/crude*.gz")
+        parser.add_argument('--day', help="partition day yyyy-mm-dd, default: from the path")
+
+    def handle(self, *args, **options):
+        print(f"\n== COMMAND: {__file__} ==")
+        self.batch_size: int = options['batch_size']
+        self.transaction_size: int = options['transaction_size']
+        self.rows: int = 0
+        self.bad_lines: int = 0
+        self.start: float = time.perf_counter()
+        self.last_report: float = self.start
+        self.node: str = options['node']
+        self.day: str = options['day']
+
+        workers: int = options['workers'] if options['workers'] > 1 else 0
+        for filename, rows, bad_lines in microdep_utils.read_crude_files(options['files'], chunk_size=self.transaction_size, workers=workers):
+            if rows is None: # file done
+                print(f"{filename}: done")
+                continue
+            self.insert(rows, self.partition(filename)) # one transaction per chunk
+            self.bad_lines += bad_lines
+
+        elapsed = time.perf_counter() - self.start
+        print(f"{self.rows} rows, {self.bad_lines} bad lines in {elapsed:.1f}s ({self.rows / max(elapsed, 1e-9):.0f} rows/s)")
+        # End of handle
+
+    def partition(self, filename) -> tuple:
+        return microdep_utils.crude_partition(filename, node=self.node, day=self.day)
+
+    def insert(self, rows: list[tuple], partition: tuple) -> None:
+        fields = microdep_utils.CRUDE_FIELDS + microdep_utils.PARTITION_FIELDS
+        with transaction.atomic():
+            microdep_models.CrudeRecord.objects.bulk_create(
+                [microdep_models.CrudeRecord(**dict(zip(fields, row + partition))) for row in rows],
+                batch_size=self.batch_size,
+            )
+        self.rows += len(rows)
+        now = time.perf_counter()
+        if now - self.last_report >= REPORT_EVERY:
+            self.last_report = now
+            print(f"{self.rows} rows ({self.rows / (now - self.start):.0f} rows/s)")
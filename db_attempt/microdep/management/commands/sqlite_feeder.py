@@ -0,0 +1,80 @@
+# imports
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from microdep import models as microdep_models
+from microdep import utils as microdep_utils
+# End: imports -----------------------------------------------------------------
+
+# Settings:
+LOAD_PRAGMAS: dict = { # only while loading, previous values are restored afterwards
+    'journal_mode': 'OFF', # no rollback journal, a crash during the load can corrupt the db
+    'synchronous': 'OFF',
+    'cache_size': -256000, # KiB (negative), 250 MiB page cache
+    'temp_store': 'MEMORY',
+}
+
+
+class Command(BaseCommand):
+    help = "Fast load of crude files into the CrudeRecord table through the raw sqlite connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="crude files (.gz or plain text)")
+        parser.add_argument('--chunk-size', type=int, default=500000, help="rows per executemany and transaction")
+        parser.add_argument('--workers', type=int, default=0, help="parser processes (0: parse in this process), rows are inserted by this process")
+        parser.add_argument('--node', help="partition node, default: from the path {node}/{yyyy-mm-dd}/crude*.gz")
+        parser.add_argument('--day', help="partition day yyyy-mm-dd, default: from the path")
+        parser.add_argument('--keep-indexes', action='store_true', help="don't drop and rebuild the table's indexes")
+
+    def handle(self, *args, **options):
+        print(f"\n== COMMAND: {__file__} ==")
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"sqlite_feeder only works on sqlite, not {connection.vendor} (use bulk_feeder)")
+
+        model = microdep_models.CrudeRecord
+        table: str = model._meta.db_table
+        columns: list[str] = [model._meta.get_field(name).column for name in microdep_utils.CRUDE_FIELDS + microdep_utils.PARTITION_FIELDS]
+        insert_sql: str = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        connection.ensure_connection()
+        db = connection.connection # raw sqlite3 connection, autocommit (isolation_level=None)
+        previous = {pragma: db.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in LOAD_PRAGMAS}
+        indexes: list[tuple[str, str]] = [] if options['keep_indexes'] else db.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        ).fetchall() # automatic indexes (sql IS NULL) belong to constraints and can't be dropped
+
+        rows, bad_lines = 0, 0
+        start = time.perf_counter()
+        try:
+            for pragma, value in LOAD_PRAGMAS.items():
+                db.execute(f"PRAGMA {pragma} = {value}")
+            for name, sql in indexes: # deferred index creation, one sort at the end instead of a b-tree update per row
+                db.execute(f"DROP INDEX {name}")
+
+            for filename, chunk, bad in microdep_utils.read_crude_files(options['files'], chunk_size=options['chunk_size'], workers=options['workers']):
+                if chunk is None: # file done
+                    elapsed = time.perf_counter() - start
+                    print(f"{filename}: done, {rows} rows ({rows / max(elapsed, 1e-9):.0f} rows/s)")
+                    continue
+                partition = microdep_utils.crude_partition(filename, node=options['node'], day=options['day'])
+                db.execute("BEGIN")
+                db.executemany(insert_sql, [row + partition for row in chunk])
+                db.execute("COMMIT")
+                rows += len(chunk)
+                bad_lines += bad
+        finally:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            index_start = time.perf_counter()
+            for name, sql in indexes:
+                db.execute(sql)
+            db.execute(f"ANALYZE {table}")
+            print(f"indexes ({len(indexes)}) and ANALYZE in {time.perf_counter() - index_start:.1f}s")
+            for pragma, value in previous.items():
+                db.execute(f"PRAGMA {pragma} = {value}")
+
+        elapsed = time.perf_counter() - start
+        print(f"{rows} rows, {bad_lines} bad lines in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)")
+        # End of handle
@@ -1,6 +1,56 @@
+from typing import Iterator
+
 from django.db import models
 
 # Create your models here.
+class CrudeRecordQuerySet(models.QuerySet):
+    REPLAY_FIELDS: tuple = ('stream_id', 'seq', 'tx', 'rx', 'size', 'hoplimit') # row tuples of replay()
+
+    def partition(self, node=None, day=None):
+        """
+        Rows of one node and day (a crude file). The partition key leads the composite index, so this is a range scan.
+        None is any node / day, only --day is a scan of the whole table.
+        """
+        queryset = self
+        if node is not None:
+            queryset = queryset.filter(node=node)
+        if day is not None:
+            queryset = queryset.filter(day=day)
+        return queryset
+
+    def stream(self, stream_id):
+        """One stream in seq order, read from the (stream_id, seq) index instead of sorting the table"""
+        return self.filter(stream_id=stream_id).order_by('seq', 'pk')
+
+    def between(self, tx_from, tx_to):
+        """Sent in [tx_from, tx_to)"""
+        return self.filter(tx__gte=tx_from, tx__lt=tx_to)
+
+    def replay(self, page_size=100000, chunk_size=2000) -> Iterator[tuple]:
+        """
+        Rows as REPLAY_FIELDS tuples in (stream_id, seq, pk) order, no model instances.
+        Keyset pagination: each page is a short query starting after the last (stream_id, seq, pk) seen,
+        read with iterator(chunk_size), so memory is constant and no cursor stays open for the whole replay.
+        """
+        last: tuple = None
+        while True:
+            page = self.order_by('stream_id', 'seq', 'pk')
+            if last is not None:
+                stream_id, seq, pk = last
+                page = page.filter(
+                    models.Q(stream_id__gt=stream_id)
+                    | models.Q(stream_id=stream_id, seq__gt=seq)
+                    | models.Q(stream_id=stream_id, seq=seq, pk__gt=pk)
+                )
+            rows: int = 0
+            for row in page.values_list(*self.REPLAY_FIELDS, 'pk')[:page_size].iterator(chunk_size=chunk_size):
+                rows += 1
+                last = (row[0], row[1], row[-1])
+                yield row[:-1]
+            if rows < page_size:
+                return
+
+
 class CrudeRecord(models.Model):
     stream_id = models.IntegerField()
     seq = models.IntegerField()
@@ -11,6 +61,19 @@ class CrudeRecord(models.Model):
     size = models.IntegerField()
     hoplimit = models.IntegerField()
 
+    # partition key: node and day of the crude file ({node}/{yyyy-mm-dd}/crude*.gz)
+    node = models.CharField(max_length=100, default='')
+    day = models.DateField(null=True)
+
+    objects = CrudeRecordQuerySet.as_manager() # CrudeRecord.objects.partition(node, day).stream(1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['node', 'day', 'stream_id', 'seq'], name='crude_partition_stream_seq'),
+            models.Index(fields=['stream_id', 'seq'], name='crude_stream_seq'),
+            models.Index(fields=['src', 'dst', 'tx'], name='crude_src_dst_tx'),
+        ]
+
     def __str__(self):
         return f"{self.__class__.__name__} (id={self.id}, seq={self.seq}, src={self.src}, dst={self.dst}, tx={self.tx}, rx={self.rx}, size={self.size}, hoplimit={self.hoplimit})"
 
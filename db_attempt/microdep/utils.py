@@ -1,8 +1,180 @@
+import os
+import copy
+import gzip
+import queue
 import inspect
-from typing import Any
+import multiprocessing
+import datetime as dt_module
+from typing import Any, Iterator, Optional
 from microdep import models as microdep_models
 
+CRUDE_FIELDS: tuple = ('stream_id', 'seq', 'src', 'dst', 'tx', 'rx', 'size', 'hoplimit') # CrudeRecord fields in crude line order
+PARTITION_FIELDS: tuple = ('node', 'day') # CrudeRecord partition key, see crude_partition()
+
+
+def crude_partition(filename: str, node: str=None, day: str=None) -> tuple[str, Optional[str]]:
+    """(node, 'yyyy-mm-dd') of a crude file, from the archive path {node}/{yyyy-mm-dd}/crude*.gz unless given"""
+    date_dir = os.path.dirname(os.path.abspath(filename))
+    if day is None:
+        try:
+            day = dt_module.date.fromisoformat(os.path.basename(date_dir)).isoformat()
+        except ValueError:
+            day = None # not in the archive layout
+    if node is None:
+        node = os.path.basename(os.path.dirname(date_dir)) if day is not None else ''
+    return node, day
+
+
+def strip_port(address: str) -> str:
+    """'ip:port' -> 'ip', also for ipv6 ('[2001:db8::1]:5' or '2001:db8::1:5')"""
+    ip, colon, port = address.rpartition(':')
+    return ip.strip('[]') if colon else address
+
+
+def parse_crude_line(line: str) -> Optional[tuple]:
+    """'ID=1 SEQ=2 SRC=ip:port DST=ip:port Tx=.. Rx=.. SIZE=.. HOPLIMIT=..' -> tuple in CRUDE_FIELDS order, None if the line is broken"""
+    key_values = line.split() # list of key-value pairs # ['ID=1', 'RX=15434', ...]
+    try:
+        # keys have fixed length, slicing is cheaper than split('=')
+        return (
+            int(key_values[0][3:]), # ID=1
+            int(key_values[1][4:]), # SEQ=
+            strip_port(key_values[2][4:]), # SRC=ip:port
+            strip_port(key_values[3][4:]), # DST=ip:port
+            float(key_values[4][3:]), # Tx=
+            float(key_values[5][3:]), # Rx=
+            int(key_values[6][5:]), # SIZE=
+            int(key_values[7][9:]), # HOPLIMIT=
+        )
+    except (IndexError, ValueError):
+        return None
+
+
+def read_crude_chunks(filename: str, chunk_size: int=10000) -> Iterator[tuple[list[tuple], int]]:
+    """Yields (rows, bad_lines) for every #chunk_size lines of a crude file (gzip or plain text)"""
+    opener = gzip.open if str(filename).endswith('.gz') else open
+    with opener(filename, mode='rt') as file:
+        rows: list[tuple] = []
+        bad_lines: int = 0
+        for line in file:
+            row = parse_crude_line(line)
+            if row is None:
+                bad_lines += 1
+            else:
+                rows.append(row)
+            if len(rows) + bad_lines >= chunk_size:
+                yield rows, bad_lines
+                rows, bad_lines = [], 0
+        if rows or bad_lines:
+            yield rows, bad_lines
+
+
+def _parse_crude_file(filename, chunk_size, chunks) -> None:
+    """Runs in a parser process, puts (filename, rows, bad_lines) chunks and finally (filename, None, error or None)"""
+    error: Exception = None
+    try:
+        for rows, bad_lines in read_crude_chunks(filename, chunk_size=chunk_size):
+            chunks.put((filename, rows, bad_lines))
+    except Exception as e:
+        error = e
+    finally:
+        chunks.put((filename, None, error))
+
+
+def read_crude_files(files, chunk_size: int=10000, workers: int=0) -> Iterator[tuple[str, Optional[list[tuple]], int]]:
+    """
+    Yields (filename, rows, bad_lines) chunks of every file and (filename, None, 0) when a file is done.
+    With workers, files are parsed by #workers processes (the order of the chunks of different files is mixed) and
+    this process only gets the rows, eg. to insert them while the next chunks are parsed. A parser error is raised here.
+    """
+    if workers < 1:
+        for filename in files:
+            for rows, bad_lines in read_crude_chunks(filename, chunk_size=chunk_size):
+                yield filename, rows, bad_lines
+            yield filename, None, 0
+        return
+
+    context = multiprocessing.get_context()
+    chunks = context.Queue(maxsize=2 * workers) # backpressure, parsers wait while the consumer is behind
+    pending: list[str] = list(files)
+    running: int = 0
+    processes: list = []
+    try:
+        while pending or running:
+            while pending and running < workers:
+                process = context.Process(target=_parse_crude_file, args=(pending.pop(0), chunk_size, chunks), daemon=True)
+                process.start()
+                processes.append(process)
+                running += 1
+            filename, rows, bad_lines = _get_chunk(chunks, processes)
+            if rows is None: # file done, bad_lines is the parser's error or None
+                running -= 1
+                if bad_lines is not None:
+                    raise Exception(f"[read_crude_files] {filename}: {bad_lines!r}") from bad_lines
+                yield filename, None, 0
+                continue
+            yield filename, rows, bad_lines
+    finally:
+        for process in processes:
+            if process.is_alive() and (pending or running): # stopped early, parsers may wait on the full queue
+                process.terminate()
+            process.join()
+        chunks.cancel_join_thread()
+        chunks.close()
+
+
+def _get_chunk(chunks, processes) -> tuple:
+    """Next chunk, fail instead of hanging if a parser died without sending its end of file"""
+    while True:
+        try:
+            return chunks.get(timeout=1)
+        except queue.Empty:
+            for process in processes:
+                if process.exitcode not in (None, 0):
+                    raise Exception(f"[read_crude_files] parser {process.name} died (exitcode={process.exitcode})")
+
+SCHEMA_ATTRS: tuple = ('required_fields', '_required_fields') # class settings of AnnotatedI, never fields
+
+
+class AnnotatedMeta(type):
+    """
+    Builds the schema of an AnnotatedI class once, when the class is created:
+        _annotations   annotated attrs of the class and its parents (own first), the allowed attrs
+        _required_fields   'required_fields' of the class and its parents
+        _defaults      class level values of annotated attrs, set on every new instance (lists, dicts and sets are copied)
+    Annotated attrs become __slots__, instances have no __dict__. Their class level values are moved to _defaults,
+    a class attribute with the same name as a slot would hide it.
+    Only one base of a class can have fields (slot layouts can't be merged).
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        annotations: dict[str, object] = {attr: value for attr, value in namespace.get('__annotations__', {}).items() if attr not in SCHEMA_ATTRS}
+        inherited: dict[str, object] = {}
+        defaults: dict[str, Any] = {}
+        required: list[str] = []
+        for base in reversed(bases):
+            inherited.update(getattr(base, '_annotations', {}))
+            defaults.update(getattr(base, '_defaults', {}))
+            required.extend(field for field in getattr(base, '_required_fields', ()) if field not in required)
+        all_annotations = dict(annotations)
+        for attr, value in inherited.items():
+            all_annotations.setdefault(attr, value)
+        for attr in all_annotations:
+            if attr in namespace: # own default, or a new default for a parent's attr
+                defaults[attr] = namespace.pop(attr)
+        required.extend(field for field in namespace.get('required_fields', ()) if field not in required)
+
+        namespace['__slots__'] = tuple(attr for attr in all_annotations if attr not in inherited)
+        namespace['_annotations'] = all_annotations
+        namespace['_attr_names'] = frozenset(all_annotations)
+        namespace['_defaults'] = defaults
+        namespace['_copied_defaults'] = tuple(attr for attr, value in defaults.items() if isinstance(value, (list, dict, set)))
+        namespace['_required_fields'] = tuple(required)
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
 class BaseInterface:
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         """Enables kwargs"""
@@ -24,28 +196,34 @@ class BaseInterface:
 
 
 
-class AnnotatedI(BaseInterface):
+class AnnotatedI(BaseInterface, metaclass=AnnotatedMeta):
     """
     This interface will only allow to set attrs that has been annotated. Also support required fields.
-    To solve The Diamond Problem on multiple inheritance, redefine 'required_fields' on the child class.
+    Set 'required_fields' on the child class, they are added to the ones of the parents.
+    The schema (allowed attrs, required fields, defaults) is built once per class by AnnotatedMeta.
 
-    extended classes must define
-    def __init__(self, *args, **kwargs):
-        self._required_fields.extend(__class__.required_fields) # must be called before super().__init__()
-        super().__init__(*args, **kwargs)
+    class Gap(EventI):
+        timestamp: float
+        event_type: str = "gap"
+        required_fields = ['timestamp']
     """
 
-    _required_fields: list[str] = []
     required_fields: list[str] = []
 
     def __init__(self, *args, **kwargs):
-        self._required_fields.extend(AnnotatedI.required_fields) # must be called before super().__init__()
         super().__init__(**kwargs)
+        for attr, value in self._defaults.items():
+            setattr(self, attr, value)
+        for attr in self._copied_defaults: # not shared between instances
+            setattr(self, attr, copy.copy(self._defaults[attr]))
         self._set_allowed_attrs(**kwargs)
         self._check_required_fields(**kwargs)
 
+    def get_all_annotations(self) -> dict[str, object]:
+        return dict(self._annotations)
+
     def _set_allowed_attrs(self, **kwargs):
-        attr_names = self.get_all_attr_names()
+        attr_names = self._attr_names
         for attr, value in kwargs.items():
             if attr in attr_names:
                 setattr(self, attr, value)
@@ -65,19 +243,14 @@ class CrudeAnalyzer2(AnnotatedI):
     """Analyzes crude records per stream-id"""
 
     window_size: int
-    records: dict[str, list[microdep_models.CrudeRecord]] = {} # Queue for each stream-id in CrudeRecord
+    records: dict[str, list[microdep_models.CrudeRecord]] = {} # Queue for each stream-id in CrudeRecord (copied per instance)
     stats: dict[str, dict[str, Any]] = {}
     _stats_init: dict[str, Any] = {
         'counter': 0,
-        'counter': 0,
     }
 
     required_fields: list[str] = ['window_size']
 
-    def __init__(self, *args, **kwargs):
-        self._required_fields.extend(CrudeAnalyzer2.required_fields) # must be called before super().__init__()
-        super().__init__(*args, **kwargs)
-
     def __str__(self) -> str:
         return f"{self.__class__.__name__}, window_size={self.window_size}\n{self.__str_queues__()}"
 
@@ -95,8 +268,25 @@ class CrudeAnalyzer2(AnnotatedI):
         self.records[i].append(record) # finally add record
         self._after_add_record_hook(id=i)
 
+    def add_row(self, row: tuple) -> None:
+        """Same as add_record() for a (stream_id, seq, tx, rx, size, hoplimit) tuple, see CrudeRecordQuerySet.replay()"""
+        i = row[0]
+        if not i in self.records:
+            self.records[i] = []
+        elif len(self.records[i]) == self.window_size:
+            self.records[i].pop(0) # pop row
+        self.records[i].append(row)
+        self._after_add_record_hook(id=i)
+
+    def replay(self, rows: Iterator[tuple]) -> int:
+        """Feeds all rows (eg. CrudeRecord.objects.partition(node, day).replay()), returns the number of rows"""
+        n: int = 0
+        for n, row in enumerate(rows, 1):
+            self.add_row(row)
+        return n
+
     def _after_add_record_hook(self, id: str) -> None:
         if not id in self.stats:
             # init dict if stats for this stream-id doesn't exist
-            self.stats[id] = self._stats_init
+            self.stats[id] = dict(self._stats_init) # own counters per stream
         self.stats[id]['counter'] += 1
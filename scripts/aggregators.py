@@ -0,0 +1,485 @@
+import math
+import random
+import collections
+import datetime as dt_module
+from typing import Any, Union
+
+import emil_types
+import microdep_types
+import sinks
+
+
+class MeanSdv():
+    """Running mean and population standard deviation (Welford), None values are skipped"""
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self, *args, **kwargs):
+        self.n: int = 0
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+
+    def add(self, value) -> None:
+        if value is None:
+            return
+        self.n += 1
+        diff = value - self.mean
+        self.mean += diff / self.n
+        self.m2 += diff * (value - self.mean)
+
+    def get_mean(self) -> Union[float, None]:
+        return self.mean if self.n else None
+
+    def get_sdv(self) -> Union[float, None]:
+        return (self.m2 / self.n) ** 0.5 if self.n else None
+
+
+class LeastSquares():
+    """Running least squares fit y = ax + b, keeps only the sums"""
+    __slots__ = ('n', 'sx', 'sxx', 'sy', 'sxy')
+
+    def __init__(self, *args, **kwargs):
+        self.n: int = 0
+        self.sx: float = 0.0
+        self.sxx: float = 0.0
+        self.sy: float = 0.0
+        self.sxy: float = 0.0
+
+    def add(self, x: float, y: float) -> None:
+        self.n += 1
+        self.sx += x
+        self.sxx += x * x
+        self.sy += y
+        self.sxy += x * y
+
+    def slope(self) -> Union[float, None]:
+        """a, None if less than 2 points or all x are equal"""
+        denominator = self.n * self.sxx - self.sx * self.sx
+        return (self.n * self.sxy - self.sx * self.sy) / denominator if self.n >= 2 and denominator > 0 else None
+
+
+class Reservoir():
+    """
+    Uniform random sample of at most #size items from a stream of unknown length (reservoir sampling, algorithm L).
+    Most items are skipped with one comparison, random numbers are only drawn when an item is kept.
+    """
+    __slots__ = ('size', 'items', 'counter', 'next_index', 'w', 'rng')
+
+    def __init__(self, size=100, rng=None, *args, **kwargs):
+        self.size: int = int(size)
+        self.items: list = []
+        self.counter: int = 0 # items offered
+        self.next_index: int = 0 # counter of the next item to keep when full
+        self.w: float = 1.0
+        self.rng: random.Random = rng if rng is not None else random.Random()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, item) -> None:
+        self.counter += 1
+        if self.counter <= self.size:
+            self.items.append(item)
+            if self.counter == self.size:
+                self.w = math.exp(math.log(self.rng.random()) / self.size)
+                self._skip()
+        elif self.counter == self.next_index:
+            self.items[self.rng.randrange(self.size)] = item
+            self.w *= math.exp(math.log(self.rng.random()) / self.size)
+            self._skip()
+
+    def _skip(self) -> None:
+        if self.w >= 1.0: # random() returned 0.0
+            self.next_index = self.counter + 1
+            return
+        self.next_index = self.counter + int(math.log(self.rng.random() or 1e-300) / math.log(1.0 - self.w)) + 1
+
+
+class SeqBitmap():
+    """
+    Seen sequence numbers of a stream, one bit per seq in a sliding window of #size seqs (size/8 bytes).
+    When a seq is past the window, the window moves forward by at least half its size, so moving is O(1) amortized.
+    Seqs below the window are too old to tell, add() returns None for them.
+    """
+
+    def __init__(self, size=65536, *args, **kwargs):
+        self.size: int = (int(size) + 7) // 8 * 8
+        self.bits: bytearray = bytearray(self.size // 8)
+        self.base: int = None # seq of the first bit, multiple of 8
+
+    def add(self, seq: int) -> Union[bool, None]:
+        """True: first time seen, False: duplicate, None: older than the window"""
+        if self.base is None:
+            self.base = seq // 8 * 8
+        offset = seq - self.base
+        if offset < 0:
+            return None
+        if offset >= self.size:
+            self._move(seq)
+            offset = seq - self.base
+        byte, bit = offset >> 3, 1 << (offset & 7)
+        if self.bits[byte] & bit:
+            return False
+        self.bits[byte] |= bit
+        return True
+
+    def _move(self, seq: int) -> None:
+        """seq ends up in the middle of the window"""
+        new_base = (seq - self.size // 2) // 8 * 8
+        shift = (new_base - self.base) // 8 # bytes
+        if shift >= len(self.bits):
+            self.bits = bytearray(len(self.bits))
+        else:
+            del self.bits[:shift]
+            self.bits.extend(bytes(shift))
+        self.base = new_base
+
+    def reset(self) -> None:
+        self.bits = bytearray(len(self.bits))
+        self.base = None
+
+
+class StreamDay():
+    """GapSum state for one stream and one (utc) day"""
+    GAP_FIELDS: tuple = ('h_ddelay', 'h_delay', 'h_jit', 'h_min_d', 'h_slope_10') # averaged over the gaps of the day, with sdv
+
+    def __init__(self, stream_id, day, src, dst, *args, **kwargs):
+        self.stream_id: int = stream_id
+        self.day: dt_module.date = day
+        self.src: str = src
+        self.dst: str = dst
+        self.first_tx: float = None
+        self.last_tx: float = None
+        self.records: int = 0
+        self.duplicates: int = 0
+        self.reordered: int = 0
+        self.late: int = 0
+        self.late_sec: float = 0.0
+        self.resets: int = 0
+        self.small_gaps: int = 0
+        self.small_time: float = 0.0
+        self.big_gaps: int = 0
+        self.big_time: float = 0.0
+        self.least_delay: float = None
+        self.min_hoplimit: int = None
+        self.max_hoplimit: int = None
+        self.gap_stats: dict[str, MeanSdv] = {field: MeanSdv() for field in self.GAP_FIELDS}
+
+
+class GapSumAggregator():
+    """
+    CrudeAnalyzer plugin: daily summary (microdep_types.GapSum) per stream, in the same pass as gap detection.
+    Days are on send time (tx, the sender's clock is monotonic per stream, rx of late records can be far off).
+    Records are counted as they arrive, so duplicates/reordering/resets are seen before the reorder buffer sorts them.
+        duplicates: seq seen before (SeqBitmap, no records are stored)
+        reordered: seq lower than the highest seq seen
+        small gaps: seq jumps below start_gap_threshold, small_time is the rx time between the two records.
+                    a jump is not counted if reordered records fill it before the next jump
+        big gaps: finished gaps from the stream analyzer, big_time is the sum of tloss
+        late: records with delay (rx - tx) >= late_threshold, late_sec is the sum of their delays
+        resets: seq more than reset_distance below the highest seq (sender restarted)
+        down_ppm: (small_time + big_time) / lasted_sec in parts per million
+        dTTL: max - min hoplimit of the day, -1 when no record had a hoplimit (HOPLIMIT=-1)
+        h_*, h_*_sdv: mean and sdv of the head statistics of the day's gaps
+    The day of a stream is emitted to the sink #grace_records records into the next day (gaps of the old day are finished by then,
+    keep it above window_size + t_limit), the rest at cleanup. Gaps for a day that was already emitted are counted in late_gaps.
+    CrudeAnalyzer.add_batch() calls on_batch(store) instead of on_record() for every record, which is cheaper.
+
+    sink = sinks.JsonLinesSink('gapsums.jsonl')
+    analyzer = utils.CrudeAnalyzer(plugins=[GapSumAggregator(sink=sink)], **constants.CRUDE_ANALYZER_SETTINGS)
+    """
+
+    def __init__(self, sink=None, start_gap_threshold=6, late_threshold=2.0, reset_distance=10000, grace_records=1000, bitmap_size=65536, tz=dt_module.timezone.utc, *args, **kwargs):
+        self.sink: sinks.EventSink = sink if sink is not None else sinks.PrintSink()
+        self.start_gap_threshold: int = int(start_gap_threshold) # same as the stream analyzers
+        self.late_threshold: float = float(late_threshold) # seconds
+        self.reset_distance: int = int(reset_distance)
+        self.grace_records: int = int(grace_records)
+        self.bitmap_size: int = int(bitmap_size)
+        self.tz: dt_module.timezone = tz
+        self.days: dict[int, StreamDay] = {} # stream id -> current day
+        self.closing: dict[int, StreamDay] = {} # stream id -> previous day, waiting for its last gaps
+        self.closing_counter: dict[int, int] = {} # stream id -> records since the day changed
+        self.bitmaps: dict[int, SeqBitmap] = {}
+        self.highest_seq: dict[int, int] = {}
+        self.last_rx: dict[int, float] = {}
+        self.holes: dict[int, list] = {} # stream id -> last small gap [highest seq before, seq after, missing, small_time, StreamDay]
+        self.day_end: dict[int, float] = {} # stream id -> timestamp where the current day ends
+        self.gapsum_counter: int = 0
+        self.late_gaps: int = 0
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] streams={len(self.days)}, gapsums={self.gapsum_counter}, late_gaps={self.late_gaps}"
+
+    def _day(self, timestamp: float) -> dt_module.date:
+        return dt_module.datetime.fromtimestamp(timestamp, self.tz).date()
+
+    def _day_end(self, day: dt_module.date) -> float:
+        return dt_module.datetime.combine(day + dt_module.timedelta(days=1), dt_module.time(), self.tz).timestamp()
+
+    def _new_day(self, stream_id: int, tx: float, src: str, dst: str) -> StreamDay:
+        day = self._day(tx)
+        self.day_end[stream_id] = self._day_end(day)
+        state = self.days[stream_id] = StreamDay(stream_id=stream_id, day=day, src=src, dst=dst)
+        return state
+
+    def on_record(self, record) -> None:
+        """Called after the stream analyzer got the record"""
+        self._add(record.id, record.seq, record.tx, record.rx, record.hoplimit, record, None)
+        self._emit_closed()
+
+    def on_batch(self, store: emil_types.CrudeRecordStore) -> None:
+        """
+        Called before the stream analyzers get the records of the batch, reads the columns instead of record views.
+        Days are only emitted here, before the batch, so all gaps of the records in earlier batches have been seen.
+        """
+        self._emit_closed()
+        add = self._add
+        for index, (stream_id, seq, tx, rx, hoplimit) in enumerate(zip(store.id, store.seq, store.tx, store.rx, store.hoplimit)):
+            add(stream_id, seq, tx, rx, hoplimit, store, index)
+
+    def _emit_closed(self) -> None:
+        for stream_id in [stream_id for stream_id, counter in self.closing_counter.items() if counter >= self.grace_records]:
+            del self.closing_counter[stream_id]
+            self._emit(self.closing.pop(stream_id))
+
+    def _add(self, stream_id, seq, tx, rx, hoplimit, record, index) -> None:
+        """record: a record, or a store and the index of the record"""
+        state = self.days.get(stream_id)
+        if state is None or tx >= self.day_end[stream_id]:
+            if index is not None:
+                record = record[index]
+            if state is None:
+                self.bitmaps[stream_id] = SeqBitmap(size=self.bitmap_size)
+            else: # next day, keep the old one open for its last gaps
+                if stream_id in self.closing:
+                    self._emit(self.closing.pop(stream_id))
+                self.closing[stream_id] = state
+                self.closing_counter[stream_id] = 0
+            state = self._new_day(stream_id, tx, src=record.src, dst=record.dst)
+        elif stream_id in self.closing_counter:
+            self.closing_counter[stream_id] += 1
+
+        state.records += 1
+        if state.first_tx is None:
+            state.first_tx = tx
+        state.last_tx = tx
+
+        # sequence: duplicates, reordering, small gaps, resets
+        highest = self.highest_seq.get(stream_id)
+        if highest is not None and highest - seq > self.reset_distance:
+            state.resets += 1
+            self.bitmaps[stream_id].reset()
+            self.holes.pop(stream_id, None)
+            highest = None
+        new = self.bitmaps[stream_id].add(seq)
+        if new is False:
+            state.duplicates += 1
+        elif highest is None or seq > highest:
+            if highest is not None and 1 < seq - highest < self.start_gap_threshold:
+                # counted now, taken back if reordered records fill the hole
+                small_time = rx - self.last_rx[stream_id]
+                state.small_gaps += 1
+                state.small_time += small_time
+                self.holes[stream_id] = [highest, seq, seq - highest - 1, small_time, state]
+            self.highest_seq[stream_id] = seq
+        elif seq < highest:
+            state.reordered += 1
+            hole = self.holes.get(stream_id)
+            if new and hole is not None and hole[0] < seq < hole[1]:
+                hole[2] -= 1 # missing
+                if hole[2] == 0: # not a gap, just reordered
+                    del self.holes[stream_id]
+                    hole[4].small_gaps -= 1
+                    hole[4].small_time -= hole[3]
+        self.last_rx[stream_id] = rx
+
+        delay = rx - tx
+        if state.least_delay is None or delay < state.least_delay:
+            state.least_delay = delay
+        if delay >= self.late_threshold:
+            state.late += 1
+            state.late_sec += delay
+        if hoplimit >= 0:
+            if state.min_hoplimit is None or hoplimit < state.min_hoplimit:
+                state.min_hoplimit = hoplimit
+            if state.max_hoplimit is None or hoplimit > state.max_hoplimit:
+                state.max_hoplimit = hoplimit
+
+    def on_gap(self, gap: emil_types.Gap) -> None:
+        day = self._day(gap.head[-1].tx if len(gap.head) else gap.timestamp)
+        state = self.days.get(gap.stream_id)
+        if state is None or state.day != day:
+            state = self.closing.get(gap.stream_id)
+        if state is None or state.day != day:
+            self.late_gaps += 1
+            return
+        state.big_gaps += 1
+        tloss = gap.tloss()
+        if tloss is not None:
+            state.big_time += tloss
+        stats = state.gap_stats
+        stats['h_ddelay'].add(gap.ddelay(gap.head_stats))
+        stats['h_delay'].add(gap.head_stats.delay())
+        stats['h_jit'].add(gap.head_stats.jitter())
+        stats['h_min_d'].add(gap.head_stats.min)
+        stats['h_slope_10'].add(gap.slope(n=-10, records=gap.head))
+
+    def on_cleanup(self) -> None:
+        for state in list(self.closing.values()) + list(self.days.values()):
+            self._emit(state)
+        self.closing, self.closing_counter, self.days = {}, {}, {}
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+
+    def _emit(self, state: StreamDay) -> None:
+        self.gapsum_counter += 1
+        self.sink(self.gapsum(state))
+
+    def gapsum(self, state: StreamDay) -> microdep_types.GapSum:
+        lasted_sec = state.last_tx - state.first_tx
+        report_time = dt_module.datetime.fromtimestamp(state.last_tx, self.tz)
+        fields: dict[str, Any] = {
+            'from_': state.src,
+            'from_adr': state.src,
+            'to': state.dst,
+            'to_adr': state.dst,
+            'date': report_time.isoformat(timespec='milliseconds'),
+            'datetime': report_time.isoformat(timespec='milliseconds'),
+            'timestamp': state.last_tx,
+            'big_gaps': state.big_gaps,
+            'big_time': state.big_time,
+            'small_gaps': state.small_gaps,
+            'small_time': state.small_time,
+            'dTTL': state.max_hoplimit - state.min_hoplimit if state.min_hoplimit is not None else -1, # 0: ttl never changed
+            'down_ppm': (state.small_time + state.big_time) / lasted_sec * 1e6 if lasted_sec > 0 else 0,
+            'duplicates': state.duplicates,
+            'lasted': str(dt_module.timedelta(seconds=int(lasted_sec))),
+            'lasted_sec': lasted_sec,
+            'late': state.late,
+            'late_sec': state.late_sec,
+            'least_delay': state.least_delay,
+            'reordered': state.reordered,
+            'resets': state.resets,
+        }
+        for field, stats in state.gap_stats.items():
+            fields[field] = stats.get_mean()
+            fields[f"{field}_sdv"] = stats.get_sdv()
+        return microdep_types.GapSum(**fields)
+
+
+class StreamInterval():
+    """Jitter state for one stream and one interval, fixed size at any packet rate"""
+
+    def __init__(self, stream_id, start, length, src, dst, parts, reservoir_size, last_n, rng, *args, **kwargs):
+        self.stream_id: int = stream_id
+        self.start: float = start
+        self.end: float = start + length
+        self.src: str = src
+        self.dst: str = dst
+        self.stats: emil_types.RunningStats = emil_types.RunningStats() # delay mean/min, jitter
+        self.part_length: float = length / parts
+        self.parts: list[LeastSquares] = [LeastSquares() for i in range(parts)] # delay slope per part of the interval
+        self.reservoir: Reservoir = Reservoir(size=reservoir_size, rng=rng) # (tx, delay) sample
+        self.last: collections.deque = collections.deque(maxlen=last_n) # (tx, delay) of the last records, for h_slope_10
+
+
+class JitterReporter():
+    """
+    CrudeAnalyzer plugin: cuts every stream into fixed intervals of send time (tx) and emits a microdep_types.Jitter per interval.
+        h_n, h_delay, h_min_d, h_jit: records, average/min delay (rx - tx) and jitter of the interval (emil_types.RunningStats)
+        h_ddelay: h_delay minus the least delay seen on the stream so far
+        h_slope_10: delay slope over the last 10 records of the interval
+        slopes: delay slope of each of #parts equal parts of the interval (str, 'None' if the part had less than 2 records)
+        rtx, rdelay: at most #reservoir_size records sampled uniformly from the interval (Reservoir), sorted on tx.
+                     rtx is tx - interval start, rdelay is delay - h_min_d
+    Memory per stream is fixed (reservoir + parts), records are never stored. Intervals are emitted when the stream
+    sends its first record of a later interval, the rest at cleanup.
+
+    analyzer = utils.CrudeAnalyzer(plugins=[JitterReporter(sink=sinks.JsonLinesSink('jitter.jsonl'), interval=300)], **constants.CRUDE_ANALYZER_SETTINGS)
+    """
+
+    def __init__(self, sink=None, interval=300.0, parts=10, reservoir_size=100, seed=None, tz=dt_module.timezone.utc, *args, **kwargs):
+        self.sink: sinks.EventSink = sink if sink is not None else sinks.PrintSink()
+        self.interval: float = float(interval) # seconds
+        self.parts: int = int(parts)
+        self.reservoir_size: int = int(reservoir_size)
+        self.rng: random.Random = random.Random(seed) # seed: reproducible samples
+        self.tz: dt_module.timezone = tz
+        self.intervals: dict[int, StreamInterval] = {} # stream id -> current interval
+        self.least_delay: dict[int, float] = {} # stream id -> least delay so far
+        self.report_counter: int = 0
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] interval={self.interval}s, streams={len(self.intervals)}, reports={self.report_counter}"
+
+    def on_record(self, record) -> None:
+        self._add(record.id, record.tx, record.rx, record, None)
+
+    def on_batch(self, store: emil_types.CrudeRecordStore) -> None:
+        add = self._add
+        for index, (stream_id, tx, rx) in enumerate(zip(store.id, store.tx, store.rx)):
+            add(stream_id, tx, rx, store, index)
+
+    def on_gap(self, gap) -> None:
+        pass
+
+    def on_cleanup(self) -> None:
+        for state in self.intervals.values():
+            self._emit(state)
+        self.intervals = {}
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+
+    def _add(self, stream_id, tx, rx, record, index) -> None:
+        """record: a record, or a store and the index of the record"""
+        state = self.intervals.get(stream_id)
+        if state is None or tx >= state.end:
+            if state is not None:
+                self._emit(state)
+            if index is not None:
+                record = record[index]
+            start = math.floor(tx / self.interval) * self.interval
+            state = self.intervals[stream_id] = StreamInterval(
+                stream_id=stream_id, start=start, length=self.interval, src=record.src, dst=record.dst,
+                parts=self.parts, reservoir_size=self.reservoir_size, last_n=10, rng=self.rng,
+            )
+        delay = rx - tx
+        state.stats.add(tx, rx)
+        x = tx - state.start # small numbers for the sums
+        part = int(x / state.part_length)
+        state.parts[part if 0 <= part < self.parts else (0 if part < 0 else self.parts - 1)].add(x, delay) # late records from an earlier interval go to the first part
+        state.reservoir.add((x, delay))
+        state.last.append((x, delay))
+        least = self.least_delay.get(stream_id)
+        if least is None or delay < least:
+            self.least_delay[stream_id] = delay
+
+    def _emit(self, state: StreamInterval) -> None:
+        self.report_counter += 1
+        self.sink(self.jitter(state))
+
+    def jitter(self, state: StreamInterval) -> microdep_types.Jitter:
+        stats = state.stats
+        last = LeastSquares()
+        for x, delay in state.last:
+            last.add(x, delay)
+        sample = sorted(state.reservoir.items)
+        report_time = dt_module.datetime.fromtimestamp(state.start, self.tz)
+        return microdep_types.Jitter(
+            from_=state.src,
+            from_adr=state.src,
+            to=state.dst,
+            to_adr=state.dst,
+            date=report_time.isoformat(timespec='milliseconds'),
+            datetime=report_time.isoformat(timespec='milliseconds'),
+            timestamp=state.start,
+            h_n=stats.n,
+            h_delay=stats.delay(),
+            h_ddelay=stats.delay() - self.least_delay[state.stream_id] if stats.n else None,
+            h_jit=stats.jitter(),
+            h_min_d=stats.min,
+            h_slope_10=last.slope(),
+            rtx=[x for x, delay in sample],
+            rdelay=[delay - stats.min for x, delay in sample],
+            slopes=[str(part.slope()) for part in state.parts],
+        )
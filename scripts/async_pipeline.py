@@ -0,0 +1,294 @@
+# Many crude feeds in one process with asyncio: a reader and an analyzer task per feed, one event queue and sink.
+# usage: python async_pipeline.py [--files crude.gz ...] [--nodes node_dir ...] [--out gaps.jsonl] [--duration 60] [--metrics 10]
+#
+#   reader task --blocks queue (queue_size)--> analyzer task --events queue (events_size)--> sink task
+#   io executor: decompressing,                cpu executor: parse_block,                    sinks.AsyncSink, writes
+#   CrudeFollower.read() for nodes             CrudeAnalyzer.add_batch, Gap.to_dict()        in its own thread
+#
+# All queues are bounded: a slow analyzer or sink stalls the readers instead of growing memory. Memory per feed is
+# about queue_size * block_size plus the analyzer windows. The analyzers are python, the cpu threads together use about
+# one core; use batch.py (processes) to spread an archive run over all cpus.
+# Node feeds poll (poll_interval), files are read to their end.
+# imports
+import time
+import asyncio
+import argparse
+import concurrent.futures
+from typing import Union
+
+import sinks
+import utils
+import follow
+import constants
+import emil_types
+import crude_reader
+# End: imports -----------------------------------------------------------------
+
+
+class Feed():
+    """
+    One source of crude lines with its own analyzer, host table and blocks queue.
+    read_block() runs in the io executor, process() and finish() in the cpu executor, never two at a time for a feed.
+
+    extended classes must define
+    def read_block(self) -> Union[bytes, None]   (b'' nothing new yet, None at the end)
+    """
+
+    def __init__(self, name, settings=None, queue_size=4, filter=None, *args, **kwargs):
+        self.name: str = str(name)
+        self.queue_size: int = int(queue_size)
+        self.queue: asyncio.Queue = None # created in the running loop
+        self.poll_interval: float = 0.2 # wait when read_block() has nothing new
+        self._events: list = [] # gaps of the running analyzer call
+        self.hosts: emil_types.HostTable = emil_types.HostTable() # a host table per feed, shared by its parser and analyzer stores
+        self.analyzer: utils.CrudeAnalyzer = utils.CrudeAnalyzer(sink=self._events.append, hosts=self.hosts, **(settings or constants.CRUDE_ANALYZER_SETTINGS))
+        self.parser: crude_reader.CrudeReader = crude_reader.CrudeReader(filename=self.name, hosts=self.hosts, filter=filter)
+        self.blocks: int = 0
+        self.records: int = 0
+        self.gaps: int = 0
+        self.max_depth: int = 0 # highest blocks queue depth seen
+        self.last_tx: float = 0.0
+        self.done: bool = False
+        self.error: BaseException = None # why the feed stopped early, see AsyncPipeline.run()
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] {self.name}: depth={self.depth()}/{self.queue_size}, blocks={self.blocks}, records={self.records}, gaps={self.gaps}"
+
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def metrics(self) -> dict:
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'blocks': self.blocks,
+            'records': self.records,
+            'gaps': self.gaps,
+            'lag': time.time() - self.last_tx if self.last_tx else None,
+            'done': self.done,
+            'error': repr(self.error) if self.error is not None else None,
+        }
+
+    def rest(self) -> bytes:
+        """Last data when the feed is stopped"""
+        return b''
+
+    def _take_events(self) -> list[dict]:
+        events, self._events[:] = list(self._events), []
+        self.gaps += len(events)
+        return [dict(sinks.EventSink.serialize(event), feed=self.name) for event in events]
+
+    def process(self, data: bytes) -> list[dict]:
+        batch = self.parser.parse_block(data)
+        if len(batch):
+            self.analyzer.add_batch(batch)
+            self.records += len(batch)
+            self.last_tx = max(self.last_tx, float(batch.tx.max()))
+        return self._take_events()
+
+    def finish(self) -> list[dict]:
+        self.analyzer.cleanup()
+        self.done = True
+        return self._take_events()
+
+
+class FileFeed(Feed):
+    """A finished crude file, read once"""
+
+    def __init__(self, path, block_size=crude_reader.MB, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self._blocks = crude_reader.CrudeReader(filename=path, block_size=block_size).blocks()
+
+    def read_block(self) -> Union[bytes, None]:
+        return next(self._blocks, None)
+
+
+class NodeFeed(Feed):
+    """The live crude files of a node directory (follow.CrudeFollower), until the pipeline stops"""
+
+    def __init__(self, node_dir, poll_interval=0.2, *args, **kwargs):
+        super().__init__(node_dir, *args, **kwargs)
+        self.follower: follow.CrudeFollower = follow.CrudeFollower(node_dir=node_dir, watcher=follow.DirectoryWatcher(use_inotify=False))
+        self.poll_interval = float(poll_interval)
+
+    def read_block(self) -> Union[bytes, None]:
+        return self.follower.read()
+
+    def rest(self) -> bytes:
+        return self.follower.rest()
+
+
+class AsyncPipeline():
+    """
+    pipeline = AsyncPipeline(sink=sinks.JsonLinesSink('gaps.jsonl'))
+    pipeline.add_file(path)
+    pipeline.add_node(node_dir)
+    asyncio.run(pipeline.run(duration=3600)) # files to their end, nodes until duration (or forever), whatever comes first
+    pipeline.metrics() # queue depths, also printed every metrics_interval seconds
+    """
+
+    def __init__(self, sink=None, workers=4, io_workers=8, queue_size=4, events_size=10000, metrics_interval=10.0, *args, **kwargs):
+        if not isinstance(sink, sinks.AsyncSink):
+            sink = sinks.AsyncSink(sink if sink is not None else sinks.PrintSink(), executor=concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        self.sink: sinks.AsyncSink = sink
+        self.cpu_executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=io_workers)
+        self.queue_size: int = int(queue_size)
+        self.events_size: int = int(events_size)
+        self.metrics_interval: float = metrics_interval # None: no reports
+        self.feeds: list[Feed] = []
+        self.events: asyncio.Queue = None
+        self.max_events_depth: int = 0
+        self.started: float = 0.0
+        self.stopped: bool = False
+
+    def __str__(self) -> str:
+        metrics = self.metrics()
+        return f"[{self.__class__.__name__}] feeds={len(self.feeds)}, records={metrics['records']}, gaps={metrics['gaps']}, depth={metrics['depth']} (max feed {metrics['max_depth']}/{self.queue_size}), events_depth={metrics['events_depth']} (max {self.max_events_depth}), {self.sink}"
+
+    def add_feed(self, feed: Feed) -> Feed:
+        self.feeds.append(feed)
+        return feed
+
+    def add_file(self, path, settings=None, filter=None, block_size=crude_reader.MB) -> Feed:
+        return self.add_feed(FileFeed(path, block_size=block_size, settings=settings, queue_size=self.queue_size, filter=filter))
+
+    def add_node(self, node_dir, settings=None, filter=None, poll_interval=0.2) -> Feed:
+        return self.add_feed(NodeFeed(node_dir, poll_interval=poll_interval, settings=settings, queue_size=self.queue_size, filter=filter))
+
+    def metrics(self) -> dict:
+        feeds = {feed.name: feed.metrics() for feed in self.feeds}
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        records = sum(feed['records'] for feed in feeds.values())
+        return {
+            'elapsed': elapsed,
+            'records': records,
+            'records_per_second': records / elapsed if elapsed else 0.0,
+            'gaps': sum(feed['gaps'] for feed in feeds.values()),
+            'depth': sum(feed['depth'] for feed in feeds.values()), # blocks waiting for an analyzer, all feeds
+            'max_depth': max([feed['max_depth'] for feed in feeds.values()], default=0),
+            'events_depth': self.events.qsize() if self.events is not None else 0,
+            'max_events_depth': self.max_events_depth,
+            'feeds': feeds,
+        }
+
+    async def _read(self, feed: Feed) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while not self.stopped and feed.error is None:
+                data = await loop.run_in_executor(self.io_executor, feed.read_block)
+                if data is None:
+                    break
+                if not data:
+                    await asyncio.sleep(feed.poll_interval)
+                    continue
+                await feed.queue.put(data) # waits while the analyzer is queue_size blocks behind
+                feed.blocks += 1
+                feed.max_depth = max(feed.max_depth, feed.queue.qsize())
+            if feed.error is None:
+                rest = await loop.run_in_executor(self.io_executor, feed.rest)
+                if rest:
+                    await feed.queue.put(rest)
+        except Exception as e:
+            feed.error = e
+            raise
+        finally: # the analyzer always gets its end marker
+            await feed.queue.put(None)
+
+    async def _analyze(self, feed: Feed) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await feed.queue.get()
+            try:
+                if data is None:
+                    events = await loop.run_in_executor(self.cpu_executor, feed.finish)
+                else:
+                    events = await loop.run_in_executor(self.cpu_executor, feed.process, data)
+            except Exception as e:
+                feed.error = e # the reader stops, the queue is drained up to its end marker
+                while data is not None:
+                    data = await feed.queue.get()
+                raise
+            for event in events:
+                await self.events.put(event)
+                self.max_events_depth = max(self.max_events_depth, self.events.qsize())
+            if data is None:
+                return
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.events.get(), timeout=self.sink.sink.max_delay)
+                except asyncio.TimeoutError: # nothing new, flush what is due
+                    await self.sink.poll()
+                    continue
+                if event is None:
+                    break
+                await self.sink.emit(event)
+        finally:
+            await self.sink.close()
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            metrics = self.metrics()
+            busy = sorted(self.feeds, key=lambda feed: feed.depth(), reverse=True)[:3]
+            print(f"{self} {metrics['records_per_second']:.0f} records/s, fullest: {', '.join(f'{feed.name}={feed.depth()}' for feed in busy)}")
+
+    async def run(self, duration=None) -> dict:
+        """
+        Until all feeds are done (node feeds never are) or #duration seconds. Returns metrics()
+        A feed that fails (bad file, parse error) stops alone, its error is in feed.error and printed. The sink is always closed.
+        """
+        self.started = time.monotonic()
+        self.events = asyncio.Queue(maxsize=self.events_size)
+        for feed in self.feeds:
+            feed.queue = asyncio.Queue(maxsize=feed.queue_size)
+        writer = asyncio.ensure_future(self._write())
+        reporter = asyncio.ensure_future(self._report()) if self.metrics_interval else None
+        try:
+            readers = [asyncio.ensure_future(self._read(feed)) for feed in self.feeds]
+            analyzers = [asyncio.ensure_future(self._analyze(feed)) for feed in self.feeds]
+            if duration is not None and analyzers:
+                await asyncio.wait(analyzers, timeout=duration)
+                self.stopped = True # readers put their rest and the end marker
+            results = await asyncio.gather(*readers, *analyzers, return_exceptions=True)
+            for feed, result in zip(self.feeds + self.feeds, results):
+                if isinstance(result, BaseException):
+                    feed.error = feed.error or result
+                    print(f"[{self.__class__.__name__}] {feed}: failed [{result!r}]")
+        finally:
+            self.stopped = True
+            if not writer.done():
+                await self.events.put(None)
+            await writer
+            if reporter is not None:
+                reporter.cancel()
+            self.cpu_executor.shutdown()
+            self.io_executor.shutdown()
+        return self.metrics()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gap detection on many crude files / live nodes in one process")
+    parser.add_argument('--files', nargs='*', default=[], help="finished crude files")
+    parser.add_argument('--nodes', nargs='*', default=[], help="node directories to follow, see follow.py")
+    parser.add_argument('--out', help="gaps as json lines, default: print")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--workers', type=int, default=4, help="analyzer threads")
+    parser.add_argument('--queue-size', type=int, default=4, help="blocks in flight per feed")
+    parser.add_argument('--metrics', type=float, default=10.0, help="seconds between metric reports")
+    args = parser.parse_args()
+
+    pipeline = AsyncPipeline(
+        sink=sinks.JsonLinesSink(args.out) if args.out else sinks.PrintSink(),
+        workers=args.workers,
+        queue_size=args.queue_size,
+        metrics_interval=args.metrics,
+    )
+    for path in args.files:
+        pipeline.add_file(path)
+    for node_dir in args.nodes:
+        pipeline.add_node(node_dir)
+    asyncio.run(pipeline.run(duration=args.duration))
+    print(pipeline)
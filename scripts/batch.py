@@ -0,0 +1,108 @@
+# Batch gap detection over the archive: all crude files of the given nodes and days
+# usage: python batch.py --nodes 'ngu-mp*' 'teknobyen-mp*' --from 2021-02-01 --to 2021-02-28 --out gaps/ [--workers 8]
+# Result per crude file: {out}/{node}/{yyyy-mm-dd}/{crude-name}.gaps.jsonl (one gap per line).
+# Files that already have a result are skipped, so an interrupted run can just be started again.
+# --cache keeps the parsed columns (crude_cache.py), re-runs with other settings skip decompressing and parsing.
+# Gaps only: the CrudeAnalyzer plugins (aggregators.GapSumAggregator, JitterReporter) are not run here or in
+# parallel_analyzer.py, run them on a file with utils.CrudeAnalyzer(plugins=[...]) (see bench_gapsum.py).
+# imports
+import os
+import glob
+import time
+import argparse
+import datetime as dt_module
+import concurrent.futures
+
+import sinks
+import constants
+import crude_cache
+import parallel_analyzer
+# End: imports -----------------------------------------------------------------
+RESULT_SUFFIX: str = '.gaps.jsonl'
+
+
+class CrudeFile():
+    """A crude file in the archive: {root}/{node}/{date}/crude*.gz"""
+
+    def __init__(self, path, node, date, *args, **kwargs):
+        self.path: str = path
+        self.node: str = node
+        self.date: str = date
+        self.size: int = os.path.getsize(path)
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] {self.node}/{self.date}/{os.path.basename(self.path)} ({self.size / 1024**2:.1f} MiB)"
+
+    def result_path(self, out) -> str:
+        return os.path.join(out, self.node, self.date, os.path.basename(self.path) + RESULT_SUFFIX)
+
+
+def dates(date_from: str, date_to: str) -> list[str]:
+    """All days from date_from to date_to (inclusive) as yyyy-mm-dd"""
+    first = dt_module.date.fromisoformat(date_from)
+    last = dt_module.date.fromisoformat(date_to)
+    return [(first + dt_module.timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def discover(nodes: list[str], date_from: str, date_to: str, root=constants.DATA_ROOT) -> list[CrudeFile]:
+    """All crude files for node globs and a date range, largest first"""
+    files: dict[str, CrudeFile] = {} # path -> file, node globs may overlap
+    for date in dates(date_from, date_to):
+        for node in nodes:
+            for path in glob.glob(os.path.join(root, constants.CRUDE_GLOB.format(node=node, date=date))):
+                if path not in files:
+                    files[path] = CrudeFile(path=path, node=os.path.basename(os.path.dirname(os.path.dirname(path))), date=date)
+    return sorted(files.values(), key=lambda crude_file: crude_file.size, reverse=True)
+
+
+def analyze(crude_file: CrudeFile, out: str, settings: dict, cache_dir=None) -> tuple[str, int, float]:
+    """Runs in a pool process. Writes the gaps of one crude file, returns (path, gaps, seconds)"""
+    start = time.perf_counter()
+    cache = crude_cache.CrudeCache(cache_dir) if cache_dir else None
+    gaps = parallel_analyzer.ShardedCrudeAnalyzer(workers=1, cache=cache, **settings).analyze(crude_file.path)
+    result_path = crude_file.result_path(out)
+    os.makedirs(os.path.dirname(result_path), exist_ok=True)
+    tmp_path = f"{result_path}.tmp-{os.getpid()}"
+    with sinks.JsonLinesSink(tmp_path, mode='w') as sink:
+        for gap in gaps:
+            sink.emit(gap)
+    os.replace(tmp_path, result_path) # result only exists when complete
+    return crude_file.path, len(gaps), time.perf_counter() - start
+
+
+def run(nodes: list[str], date_from: str, date_to: str, out: str, root=constants.DATA_ROOT, workers=0, settings=None, cache_dir=None) -> dict[str, int]:
+    """Analyze every crude file that doesn't have a result yet. Returns gaps per analyzed file"""
+    settings = settings or constants.CRUDE_ANALYZER_SETTINGS
+    files = discover(nodes=nodes, date_from=date_from, date_to=date_to, root=root)
+    todo = [crude_file for crude_file in files if not os.path.exists(crude_file.result_path(out))]
+    print(f"[batch] {len(files)} crude files, {len(files) - len(todo)} already done, {len(todo)} to analyze ({sum(f.size for f in todo) / 1024**3:.2f} GiB)")
+
+    results: dict[str, int] = {}
+    failed: int = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or None) as pool:
+        futures = {pool.submit(analyze, crude_file, out, settings, cache_dir): crude_file for crude_file in todo} # submitted largest first
+        for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            crude_file = futures[future]
+            try:
+                path, gaps, seconds = future.result()
+                results[path] = gaps
+                print(f"[batch] {i}/{len(todo)} {crude_file}: {gaps} gaps in {seconds:.1f}s")
+            except Exception as e:
+                failed += 1
+                print(f"[batch] {i}/{len(todo)} {crude_file}: failed [{e}]")
+    print(f"[batch] done, {len(results)} analyzed, {failed} failed")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gap detection for all crude files of some nodes and days")
+    parser.add_argument('--nodes', nargs='+', required=True, help="node globs, eg. 'ngu-mp*' '*'")
+    parser.add_argument('--from', dest='date_from', required=True, help="first day, yyyy-mm-dd")
+    parser.add_argument('--to', dest='date_to', help="last day (inclusive), default --from")
+    parser.add_argument('--out', required=True, help="result directory")
+    parser.add_argument('--root', default=constants.DATA_ROOT)
+    parser.add_argument('--workers', type=int, default=0, help="processes, default: all cpus")
+    parser.add_argument('--cache', nargs='?', const=constants.CRUDE_CACHE_DIR, help=f"parse each crude file once into a columnar cache (default dir: {constants.CRUDE_CACHE_DIR})")
+    args = parser.parse_args()
+
+    run(nodes=args.nodes, date_from=args.date_from, date_to=args.date_to or args.date_from, out=args.out, root=args.root, workers=args.workers, cache_dir=args.cache)
@@ -0,0 +1,39 @@
+# Benchmark: construction of AnnotatedI events (microdep_types.Gap / Jitter / GapSum), cost per instance must stay
+# constant over rounds and the class schema must not grow
+# usage: python bench_annotated.py [instances per round] [rounds]
+# imports
+import sys
+import time
+import tracemalloc
+
+import microdep_types
+# End: imports -----------------------------------------------------------------
+
+EVENTS: dict = {
+    microdep_types.Gap: dict(from_='a', to='b', timestamp=1613445013.0, h_n=50, h_delay=0.004, t_n=50, tloss=0.2),
+    microdep_types.Jitter: dict(from_='a', to='b', timestamp=1613445013.0, h_n=1000, h_delay=0.004, rtx=[1.0, 2.0], rdelay=[0.1, 0.2]),
+    microdep_types.GapSum: dict(from_='a', to='b', timestamp=1613445013.0, big_gaps=1, small_gaps=2, least_delay=0.003),
+}
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rounds: int = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for cls, kwargs in EVENTS.items():
+        required = cls._required_fields
+        event = cls(**kwargs)
+        assert not hasattr(event, '__dict__') # slots only
+        assert event.to_dict()['event_type'] == cls._defaults['event_type']
+        times: list[float] = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(n):
+                cls(**kwargs)
+            times.append((time.perf_counter() - start) / n * 1e6)
+        assert cls._required_fields == required # the schema doesn't grow with every instance
+        tracemalloc.start()
+        events = [cls(**kwargs) for _ in range(1000)]
+        size = tracemalloc.get_traced_memory()[0] / len(events)
+        tracemalloc.stop()
+        print(f"{cls.__name__:7} {' '.join(f'{t:6.2f}' for t in times)} us/instance, {size:.0f} bytes/instance")
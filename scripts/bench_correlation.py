@@ -0,0 +1,144 @@
+# Benchmark: correlation.LinkGapCorrelator and RoutingCorrelator vs nested loops over gaps x traps / bgp updates (the same
+# rules), on synthetic gaps, traps and bgp updates of #days, checks that both find the same matches on a small sample.
+# usage: python bench_correlation.py [days] [gaps per day] [traps per day] [bgp updates per day]
+# imports
+import sys
+import time
+import random
+import ipaddress
+from collections import Counter
+
+import correlation
+# End: imports -----------------------------------------------------------------
+
+SITES: list[str] = ['tromso', 'trd', 'oslo', 'bergen', 'volda', 'ntnu', 'hiof', 'uit', 'ask', 'narvik']
+
+
+def synthetic(days, gaps_per_day, traps_per_day, seed=1) -> tuple[list[dict], list[dict], list[dict]]:
+    rng = random.Random(seed)
+    start = 1613347200.0
+    gaps = [
+        {
+            'from': f"{rng.choice(SITES)}-mp.uninett.no",
+            'to': f"{rng.choice(SITES)}-mp.uninett.no",
+            'timestamp': start + rng.random() * days * 86400,
+            'tloss': rng.expovariate(1 / 30),
+        }
+        for _ in range(days * gaps_per_day)
+    ]
+    for gap in gaps:
+        gap['from_ip'], gap['to_ip'] = site_address(gap['from']), site_address(gap['to'])
+    traps = []
+    for _ in range(days * traps_per_day):
+        router = f"{rng.choice(SITES)}-gw{rng.randrange(3)}.uninett.no"
+        traps.append({
+            'event_type': 'snmp_trap',
+            'timestamp': start + rng.random() * days * 86400,
+            'name': router,
+            'trap_source': f"10.0.{SITES.index(router.split('-')[0])}.{router.split('.')[0][-1]}",
+            'trap_type': rng.choice(['linkUp', 'linkDown']),
+            'ifIndex': rng.randrange(4),
+            'ifAlias': 'alias',
+            'logical_name': 'port',
+        })
+    trace_routes = [
+        {'from': f"{a}-mp.uninett.no", 'to': f"{b}-mp.uninett.no", 'timestamp_from': start + day * 86400, 'timestamp_to': start + (day + 1) * 86400 - 1,
+         'routers_used': [f"{rng.choice(SITES)}-gw{rng.randrange(3)}.uninett.no"]}
+        for day in range(days) for a in SITES for b in SITES
+    ]
+    for trace_route in trace_routes:
+        trace_route['stats'] = [{'router': router, 'address': f"10.0.{SITES.index(router.split('-')[0])}.{router.split('.')[0][-1]}"} for router in trace_route['routers_used']]
+    return gaps, traps, trace_routes
+
+
+def site_address(host) -> str:
+    """Measurement points of even sites have ipv6 addresses"""
+    i = SITES.index(host.split('-')[0])
+    return f"2001:700:{i}::4" if i % 2 == 0 else f"158.38.{i}.4"
+
+
+def bgp_updates(days, updates_per_day, prefixes=20000, seed=1) -> list[dict]:
+    """Updates of the site prefixes, their aggregates and #prefixes other prefixes"""
+    rng = random.Random(seed)
+    start = 1613347200.0
+    names = [f"158.38.{i}.0/24" for i in range(len(SITES))] + ['158.38.0.0/16', '10.0.0.0/16', '2001:700::/32'] + [f"2001:700:{i}::/48" for i in range(len(SITES))]
+    names += [f"10.0.{i}.0/24" for i in range(len(SITES))]
+    names += [f"{rng.randrange(11, 200)}.{rng.randrange(256)}.{rng.randrange(256)}.0/{rng.choice([20, 22, 24])}" for _ in range(prefixes)]
+    return [
+        {'prefix': rng.choice(names), 'timestamp': start + rng.random() * days * 86400, 'type': rng.choice('AW'), 'source_id': '1', 'as_path': [224, 2603]}
+        for _ in range(days * updates_per_day)
+    ]
+
+
+def nested_loop_routing(gaps, updates, trace_routes, tolerance) -> list[tuple]:
+    networks = {update['prefix']: ipaddress.ip_network(update['prefix'], strict=False) for update in updates}
+    matches: list[tuple] = []
+    for gap in gaps:
+        ip_list = [gap['from_ip'], gap['to_ip']] + [
+            hop['address'] for route in trace_routes if (route['from'], route['to']) == (gap['from'], gap['to']) and route['timestamp_from'] <= gap['timestamp'] <= route['timestamp_to'] for hop in route['stats']
+        ]
+        longest = set()
+        for address in map(ipaddress.ip_address, ip_list):
+            covering = [network for network in networks.values() if network.version == address.version and address in network]
+            if covering:
+                longest.add(max(covering, key=lambda network: network.prefixlen))
+        for network in longest:
+            near = [update for update in updates if networks[update['prefix']] == network]
+            firsts = [update for update in near if abs(update['timestamp'] - gap['timestamp']) <= tolerance]
+            lasts = [update for update in near if update['type'] == 'A' and abs(update['timestamp'] - gap['timestamp'] - gap['tloss']) <= tolerance]
+            matches += [('bgp_update', gap['timestamp'], update['timestamp']) for update in firsts]
+            matches += [('bgp_update_before_and_after', gap['timestamp'], last['timestamp']) for first in firsts if first['type'] == 'W' for last in lasts if last['timestamp'] >= first['timestamp']]
+    return matches
+
+
+def nested_loop(gaps, traps, trace_routes, tolerance) -> list[tuple]:
+    matches: list[tuple] = []
+    for gap in gaps:
+        routers = [key for route in trace_routes if (route['from'], route['to']) == (gap['from'], gap['to']) and route['timestamp_from'] <= gap['timestamp'] <= route['timestamp_to'] for key in route['routers_used']]
+        keys = {correlation.site(gap['from']), correlation.site(gap['to']), *routers}
+        near = [trap for trap in traps if correlation.trap_keys(trap) & keys]
+        firsts = [trap for trap in near if abs(trap['timestamp'] - gap['timestamp']) <= tolerance]
+        lasts = [trap for trap in near if trap['trap_type'] == 'linkUp' and abs(trap['timestamp'] - gap['timestamp'] - gap['tloss']) <= tolerance]
+        matches += [('before', gap['timestamp'], trap['timestamp']) for trap in firsts]
+        matches += [('after', gap['timestamp'], trap['timestamp']) for trap in lasts]
+        matches += [
+            ('before_and_after', gap['timestamp'], last['timestamp']) for first in firsts for last in lasts
+            if last is not first and last['timestamp'] >= first['timestamp'] and correlation.trap_link(last) == correlation.trap_link(first)
+        ]
+    return matches
+
+
+if __name__ == "__main__":
+    days: int = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    gaps_per_day: int = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    traps_per_day: int = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    updates_per_day: int = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
+
+    gaps, traps, trace_routes = synthetic(1, 500, 3000)
+    correlator = correlation.LinkGapCorrelator(traps, trace_routes=trace_routes, tolerance=120)
+    found = Counter((match.match_type, match.timestamp, match.timestamp_trap) for match in correlator.correlate(gaps))
+    expected = Counter(nested_loop(gaps, traps, trace_routes, 120))
+    assert found == expected, (len(found), len(expected))
+    print(f"sample: {correlator}")
+    updates = bgp_updates(1, 20000, prefixes=50)
+    correlator = correlation.RoutingCorrelator(updates, trace_routes=trace_routes, tolerance=120)
+    found = Counter((match.match_type, match.timestamp, match.bgp_update.timestamp) for match in correlator.correlate(gaps))
+    expected = Counter(nested_loop_routing(gaps, updates, trace_routes, 120))
+    assert found == expected, (len(found), len(expected))
+    print(f"sample: {correlator}")
+
+    gaps, traps, trace_routes = synthetic(days, gaps_per_day, traps_per_day)
+    start = time.perf_counter()
+    correlator = correlation.LinkGapCorrelator(traps, trace_routes=trace_routes)
+    index_seconds = time.perf_counter() - start
+    matches = sum(1 for _ in correlator.correlate(gaps))
+    seconds = time.perf_counter() - start
+    print(f"{days} days: {len(gaps)} gaps x {len(traps)} traps, {matches} matches in {seconds:.1f}s (index {index_seconds:.1f}s), {correlator}")
+
+    updates = bgp_updates(days, updates_per_day)
+    start = time.perf_counter()
+    correlator = correlation.RoutingCorrelator(updates, trace_routes=trace_routes)
+    index_seconds = time.perf_counter() - start
+    matches = sum(1 for _ in correlator.correlate(gaps))
+    seconds = time.perf_counter() - start
+    print(f"{days} days: {len(gaps)} gaps x {len(updates)} bgp updates, {matches} matches in {seconds:.1f}s (index {index_seconds:.1f}s), {correlator}")
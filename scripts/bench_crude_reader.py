@@ -0,0 +1,66 @@
+# Benchmark: per-line parsing (crude_parser.py) vs CrudeReader
+# usage: python bench_crude_reader.py [crude-file.gz or ""] [synthetic_lines]
+# imports
+import os
+import sys
+import gzip
+import time
+import tempfile
+
+import emil_types
+import crude_reader
+import synthetic
+# End: imports -----------------------------------------------------------------
+MILL = 1000000
+
+
+def per_line(filename) -> tuple[int, int, float]:
+    """Same parsing as crude_parser.py, returns (records, bad_lines, checksum)"""
+    records, bad_lines, checksum = 0, 0, 0.0
+    with gzip.open(filename=filename, mode='rt') as file:
+        for line in file:
+            key_values = line.strip().split()
+            try:
+                record = emil_types.CrudeRecord(
+                    id = key_values[0].split('=')[1],
+                    seq = key_values[1].split('=')[1],
+                    src = key_values[2].split('=')[1].split(':')[0],
+                    dst = key_values[3].split('=')[1].split(':')[0],
+                    tx = key_values[4].split('=')[1],
+                    rx = key_values[5].split('=')[1],
+                    size = key_values[6].split('=')[1],
+                    hoplimit = key_values[7].split('=')[1],
+                )
+                records += 1
+                checksum += record.seq + record.transmit_time()
+            except Exception:
+                bad_lines += 1
+    return records, bad_lines, checksum
+
+
+def batched(filename) -> tuple[int, int, float]:
+    reader = crude_reader.CrudeReader(filename=filename)
+    records, checksum = 0, 0.0
+    for batch in reader:
+        records += len(batch)
+        checksum += float(batch.seq.sum()) + float((batch.rx - batch.tx).sum())
+    return records, reader.bad_lines, checksum
+
+
+def timed(name, func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10}: {elapsed:8.3f}s  {result[0] / elapsed / MILL:6.2f}M lines/s  records={result[0]}, bad_lines={result[1]}")
+    return result
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[2]) if len(sys.argv) > 2 else 2*MILL
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] else synthetic.write_crude(os.path.join(tmp, 'crude-bench.gz'), n=n, streams=4, gap_every=5000)
+        print(f"file: {filename}")
+        expected = timed('per-line', per_line, filename)
+        result = timed('batched', batched, filename)
+        assert expected[:2] == result[:2], "record counts differ"
+        assert abs(expected[2] - result[2]) <= 1e-6 * abs(expected[2]), "checksums differ"
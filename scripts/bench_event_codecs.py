@@ -0,0 +1,92 @@
+# Benchmark: round trip of microdep_types events, generic path (json.dumps() of the attrs, cls(**json.loads()))
+# vs the generated codecs of event_codecs.py (json lines and msgpack). Checks that the round trips are equal, and that
+# sink output reads back with event_codecs.read_json_lines().
+# usage: python bench_event_codecs.py [events]
+# imports
+import sys
+import json
+import time
+import random
+import tempfile
+
+import sinks
+import microdep_types
+import event_codecs
+# End: imports -----------------------------------------------------------------
+
+
+def random_events(n, seed=1) -> list:
+    """Gap, GapSum and Jitter events with all numeric attrs set, like the aggregators emit them"""
+    rng = random.Random(seed)
+    events: list = []
+    for i in range(n):
+        cls = (microdep_types.Gap, microdep_types.GapSum, microdep_types.Jitter)[i % 3]
+        kwargs: dict = {}
+        for attr, annotation in cls._annotations.items():
+            if attr in cls._defaults:
+                continue
+            if annotation is float:
+                kwargs[attr] = rng.random()
+            elif annotation is int:
+                kwargs[attr] = rng.randrange(1000)
+            elif annotation is str:
+                kwargs[attr] = f"host-{rng.randrange(100)}.uninett.no"
+            elif attr in ('rtx', 'rdelay'):
+                kwargs[attr] = [rng.random() for _ in range(100)]
+        events.append(cls(**kwargs))
+    return events
+
+
+def generic_dict(event) -> dict:
+    """Set attrs by name, the generic path"""
+    return {attr: getattr(event, attr) for attr in event._annotations if hasattr(event, attr)}
+
+
+def generic_round_trip(events) -> list:
+    lines = [json.dumps(generic_dict(event)) for event in events]
+    return [type(event)(**json.loads(line)) for event, line in zip(events, lines)]
+
+
+def codec_json_round_trip(events) -> list:
+    lines = [event_codecs.to_json(event) for event in events]
+    return [event_codecs.from_json(line) for line in lines]
+
+
+def codec_msgpack_round_trip(events) -> list:
+    data = [event_codecs.to_msgpack(event) for event in events]
+    return [event_codecs.from_msgpack(item) for item in data]
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = random_events(n)
+    expected = [event.to_dict() for event in events]
+    assert all('from' in data and 'from_' not in data for data in expected) # one format, the sinks write it too
+    legacy = dict(expected[0], from_=expected[0]['from'])
+    del legacy['from']
+    assert event_codecs.from_dict(legacy).from_ == events[0].from_ # older sink output, 'from_'
+
+    with tempfile.TemporaryDirectory() as directory: # sink output -> read_json_lines()
+        filename = f"{directory}/events.jsonl"
+        with sinks.JsonLinesSink(filename, mode='w') as sink:
+            for event in events[:3000]:
+                sink.emit(event)
+        assert [event.to_dict() for event in event_codecs.read_json_lines(filename)] == expected[:3000]
+
+    paths = {'generic json': generic_round_trip, 'codec json': codec_json_round_trip}
+    if event_codecs.msgpack is not None:
+        paths['codec msgpack'] = codec_msgpack_round_trip
+    times: dict[str, float] = {}
+    for name, round_trip in paths.items():
+        start = time.perf_counter()
+        result = round_trip(events)
+        times[name] = time.perf_counter() - start
+        assert [event.to_dict() for event in result] == expected, name
+    sizes = {
+        'json': sum(len(event_codecs.to_json(event)) + 1 for event in events[:1000]),
+        'msgpack': sum(len(event_codecs.to_msgpack(event)) for event in events[:1000]) if event_codecs.msgpack is not None else 0,
+    }
+    print(f"{n} events (Gap, GapSum, Jitter), json backend: {'orjson' if event_codecs.orjson is not None else 'json'}")
+    for name, seconds in times.items():
+        print(f"  {name:14} {seconds / n * 1e6:7.2f} us/event round trip ({times['generic json'] / seconds:.1f}x)")
+    print(f"  bytes/event: json {sizes['json'] / 1000:.0f}, msgpack {sizes['msgpack'] / 1000:.0f}")
@@ -0,0 +1,80 @@
+# Benchmark: Gap.slopes() (one prefix sum pass for all sizes) vs one numpy.polyfit per size, checks that the slopes are equal
+# usage: python bench_gap_slopes.py [records per head/tail] [gaps]
+# imports
+import sys
+import time
+import math
+import random
+
+import numpy as np
+
+import emil_types
+# End: imports -----------------------------------------------------------------
+
+
+def random_store(n, seed) -> emil_types.CrudeRecordStore:
+    """n records 10ms apart with a delay that drifts up and jitters, like a queue filling before a gap"""
+    rng = random.Random(seed)
+    store = emil_types.CrudeRecordStore()
+    tx, drift = 1613445013.0, rng.uniform(-0.01, 0.01)
+    for seq in range(n):
+        tx += 0.01 + rng.uniform(-0.001, 0.001)
+        store.append(emil_types.CrudeRecord(id=1, seq=seq, src='10.0.0.1', dst='10.0.0.2', tx=tx, rx=tx + 0.004 + drift * seq * 0.01 + rng.uniform(0, 0.0005), size=64, hoplimit=-1))
+    return store
+
+
+def polyfit_slopes(sizes, records, last=False) -> dict:
+    """Reference: numpy.polyfit on records[-n:] or records[:n], same x and y as Gap.slopes()"""
+    slopes = {}
+    for n in sizes:
+        part = records[-n:] if last else records[:n]
+        if len(part) < 2:
+            slopes[n] = None
+            continue
+        tx = np.array([record.tx for record in part])
+        rx = np.array([record.rx for record in part])
+        slopes[n] = float(np.polyfit(tx - tx[0], rx - tx, 1)[0])
+    return slopes
+
+
+def check(records, last) -> None:
+    sizes = emil_types.Gap.SLOPE_SIZES
+    expected = polyfit_slopes(sizes, records, last=last)
+    result = emil_types.Gap.slopes(sizes=sizes, records=records, last=last)
+    for n in sizes:
+        if expected[n] is None or result[n] is None:
+            assert expected[n] is None and result[n] is None, (n, expected[n], result[n])
+        else:
+            assert math.isclose(result[n], expected[n], rel_tol=1e-6, abs_tol=1e-12), (n, expected[n], result[n])
+        assert emil_types.Gap.slope(n=-n if last else n, records=records) == result[n]
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    gaps: int = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    # correctness: full windows, short windows (fewer records than n), 1 and 0 records, list of records
+    for size in (n, 100, 37, 10, 3, 2, 1, 0):
+        store = random_store(size, seed=size)
+        for last in (False, True):
+            check(store, last=last)
+            check([record.to_record() for record in store], last=last)
+    equal_tx = emil_types.CrudeRecordStore(records=[emil_types.CrudeRecord(1, seq, 'a', 'b', 1.0, 1.0 + seq, 64, -1) for seq in range(5)])
+    assert emil_types.Gap.slopes(sizes=(10,), records=equal_tx)[10] is None # vertical line, no slope
+    print("slopes equal to numpy.polyfit")
+
+    # speed: both head and tail of each gap, all five sizes
+    stores = [random_store(n, seed=i) for i in range(gaps)]
+    start = time.perf_counter()
+    for store in stores:
+        polyfit_slopes(emil_types.Gap.SLOPE_SIZES, store, last=True)
+        polyfit_slopes(emil_types.Gap.SLOPE_SIZES, store)
+    polyfit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for store in stores:
+        emil_types.Gap.slopes(sizes=emil_types.Gap.SLOPE_SIZES, records=store, last=True)
+        emil_types.Gap.slopes(sizes=emil_types.Gap.SLOPE_SIZES, records=store)
+    slopes_time = time.perf_counter() - start
+    print(f"{gaps} gaps, {n} records in head and tail")
+    print(f"  polyfit per size: {polyfit_time / gaps * 1e6:8.1f} us/gap")
+    print(f"  Gap.slopes:       {slopes_time / gaps * 1e6:8.1f} us/gap ({polyfit_time / slopes_time:.1f}x)")
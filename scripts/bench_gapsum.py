@@ -0,0 +1,179 @@
+# Benchmark: aggregators.GapSumAggregator (CrudeAnalyzer plugin) on synthetic streams that cross midnight, with injected
+# duplicates, swaps, small gaps (some filled by reordered records), big gaps, late records and a reset. Checks the GapSums
+# against a brute force count over the records (sets, no bitmap) and the batch path (on_batch) against on_record.
+# usage: python bench_gapsum.py [records per stream] [streams]
+# imports
+import os
+import sys
+import time
+import random
+import tempfile
+import datetime as dt_module
+from collections import defaultdict
+
+import synthetic
+import utils
+import sinks
+import constants
+import aggregators
+import crude_reader
+# End: imports -----------------------------------------------------------------
+MIDNIGHT: float = 1613520000.0 # 2021-02-17 00:00 utc
+INTERVAL: float = 0.01
+RESET_DISTANCE: int = 5000
+
+
+def stream_records(stream_id, n, rng) -> tuple[list[tuple], list[float]]:
+    """
+    (seq, tx, rx, hoplimit) in arrival order, half before midnight, and the tx of the record before each injected big gap.
+    Even streams restart their seqs at 3/4 (reset). Neighbouring drops can add up to a big gap, the stream analyzer also
+    reports the reset as one.
+    """
+    start = MIDNIGHT - n // 2 * INTERVAL
+    records = [[seq, start + seq * INTERVAL, 0.0, 60 + (seq > n // 3) if stream_id == 1 else -1] for seq in range(1, n + 1)]
+    for record in records:
+        record[2] = record[1] + 0.004 + rng.random() * 0.001
+        if rng.random() < 0.002:
+            record[2] += 2.5 # late
+        record[1], record[2] = round(record[1], 6), round(record[2], 6) # as written in the file
+    if stream_id % 2 == 0:
+        for record in records[n * 3 // 4:]:
+            record[0] -= n * 3 // 4 # reset, seq starts at 1 again
+    arrival: list[list] = []
+    big_gaps: list[float] = []
+    i = 0
+    while i < len(records):
+        roll = rng.random()
+        if (roll < 0.001 and abs(records[i][1] - MIDNIGHT) > 0.1 or i == n // 2 - 200) and 0 < i and len(records) - i > 50: # big gap, one 2s before midnight
+            if records[i - 1][0] + 1 == records[i][0]: # not on the reset
+                big_gaps.append(records[i - 1][1])
+                i += 20
+                continue
+        if roll < 0.004 and i + 4 < len(records): # small gap, 1-3 records missing
+            i += rng.randint(1, 3)
+        elif roll < 0.008 and i + 6 < len(records): # small hole, the missing records arrive 1-2 records later
+            missing = records[i:i + rng.randint(1, 3)]
+            i += len(missing)
+            later = rng.randint(1, 2)
+            arrival.extend(records[i:i + later])
+            arrival.extend(missing)
+            i += later
+            continue
+        elif roll < 0.012 and i + 1 < len(records): # swap
+            arrival.extend([records[i + 1], records[i]])
+            i += 2
+            continue
+        arrival.append(records[i])
+        if roll > 0.996 and arrival: # duplicate of a record 1-5 back
+            arrival.append(list(arrival[-rng.randint(1, min(5, len(arrival)))]))
+        i += 1
+    return [tuple(record) for record in arrival], big_gaps
+
+
+def write_streams(filename, n, streams) -> tuple[dict, dict]:
+    """Crude file with the streams interleaved (each in its arrival order) -> arrival records and big gaps per stream"""
+    rng = random.Random(1)
+    arrivals, big_gaps = {}, {}
+    for stream_id in range(1, streams + 1):
+        arrivals[stream_id], big_gaps[stream_id] = stream_records(stream_id, n, rng)
+    with open(filename, 'w') as file:
+        file.writelines(synthetic.CRUDE_HEADER)
+        for i in range(max(len(arrival) for arrival in arrivals.values())):
+            for stream_id, arrival in arrivals.items():
+                if i < len(arrival):
+                    seq, tx, rx, hoplimit = arrival[i]
+                    file.write(synthetic.CRUDE_LINE.format(id=stream_id, seq=seq, src=f"10.0.0.{stream_id}", dst="158.39.1.90", tx=tx, rx=rx, hoplimit=hoplimit))
+    return arrivals, big_gaps
+
+
+def day(timestamp) -> str:
+    return dt_module.datetime.fromtimestamp(timestamp, dt_module.timezone.utc).date().isoformat()
+
+
+def brute_force(arrival, start_gap_threshold, late_threshold) -> dict[str, dict]:
+    """
+    day -> counts of one stream. A record counts on the latest day its stream has reached (tx), a small jump is taken back
+    if all the seqs it skipped arrive before the next small jump.
+    """
+    days: dict[str, dict] = defaultdict(lambda: defaultdict(float))
+    current, seen, highest, last_rx, hole = None, set(), None, None, None
+    hoplimits: dict[str, list] = defaultdict(list)
+    for seq, tx, rx, hoplimit in arrival:
+        current = max(current or day(tx), day(tx))
+        counts = days[current]
+        if highest is not None and highest - seq > RESET_DISTANCE:
+            counts['resets'] += 1
+            seen, highest, hole = set(), None, None
+        if seq in seen:
+            counts['duplicates'] += 1
+        elif highest is None or seq > highest:
+            if highest is not None and 1 < seq - highest < start_gap_threshold:
+                hole = {'day': current, 'missing': set(range(highest + 1, seq)), 'time': rx - last_rx}
+                counts['small_gaps'] += 1
+                counts['small_time'] += hole['time']
+            highest = seq
+        else:
+            counts['reordered'] += 1
+            if hole is not None and seq in hole['missing']:
+                hole['missing'].discard(seq)
+                if not hole['missing']:
+                    days[hole['day']]['small_gaps'] -= 1
+                    days[hole['day']]['small_time'] -= hole['time']
+                    hole = None
+        seen.add(seq)
+        last_rx = rx
+        if rx - tx >= late_threshold:
+            counts['late'] += 1
+            counts['late_sec'] += rx - tx
+        if hoplimit >= 0:
+            hoplimits[current].append(hoplimit)
+    for name, counts in days.items():
+        counts['dTTL'] = max(hoplimits[name]) - min(hoplimits[name]) if hoplimits[name] else -1
+    return days
+
+
+def run(filename, batches) -> tuple[list, list, aggregators.GapSumAggregator, float]:
+    gapsums, gaps = sinks.MemorySink(), sinks.MemorySink()
+    aggregator = aggregators.GapSumAggregator(sink=gapsums, reset_distance=RESET_DISTANCE, start_gap_threshold=constants.CRUDE_ANALYZER_SETTINGS['start_gap_threshold'])
+    analyzer = utils.CrudeAnalyzer(sink=gaps, plugins=[aggregator], **constants.CRUDE_ANALYZER_SETTINGS)
+    start = time.perf_counter()
+    for batch in crude_reader.CrudeReader(filename=filename).batches():
+        if batches:
+            analyzer.add_batch(batch)
+        else:
+            for record in batch.records():
+                analyzer.add_record(record)
+    analyzer.cleanup()
+    return gapsums.events, gaps.events, aggregator, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    streams: int = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'crude-gapsum.txt')
+        arrivals, big_gaps = write_streams(filename, n, streams)
+        gapsums, gaps, aggregator, batch_seconds = run(filename, batches=True)
+        record_gapsums, record_gaps, record_aggregator, record_seconds = run(filename, batches=False)
+
+    assert gapsums == record_gapsums # dicts, MemorySink keeps to_dict()
+    assert aggregator.late_gaps == 0 and len(gapsums) == 2 * streams, aggregator # one per stream and day, gaps before midnight in time
+    fields = ('duplicates', 'reordered', 'small_gaps', 'late', 'resets', 'dTTL')
+    for stream_id, arrival in arrivals.items():
+        expected = brute_force(arrival, constants.CRUDE_ANALYZER_SETTINGS['start_gap_threshold'], aggregator.late_threshold)
+        stream_gapsums = sorted((gapsum for gapsum in gapsums if gapsum['from'] == f"10.0.0.{stream_id}"), key=lambda gapsum: gapsum['timestamp'])
+        assert [gapsum['date'][:10] for gapsum in stream_gapsums] == sorted(expected), stream_id
+        for gapsum in stream_gapsums:
+            counts = expected[gapsum['date'][:10]]
+            assert {field: gapsum[field] for field in fields} == {field: counts[field] for field in fields}, (stream_id, gapsum['date'])
+            assert abs(gapsum['small_time'] - counts['small_time']) < 1e-6 and abs(gapsum['late_sec'] - counts['late_sec']) < 1e-6, (stream_id, gapsum['date'])
+            big = [tx for tx in big_gaps[stream_id] if day(tx) == gapsum['date'][:10]]
+            stream_gaps = [gap for gap in gaps if gap['stream_id'] == stream_id and day(gap['timestamp']) == gapsum['date'][:10]]
+            assert gapsum['big_gaps'] == len(stream_gaps) >= len(big), (stream_id, gapsum['date'], gapsum['big_gaps'], len(big), len(stream_gaps))
+            assert abs(gapsum['big_time'] - sum(gap['tloss'] or 0 for gap in stream_gaps)) < 1e-6
+
+    print(f"{streams} streams x {n} records over midnight, {len(gapsums)} GapSums equal to the brute force count:")
+    for gapsum in gapsums:
+        print(f"  {gapsum['from']} {gapsum['date'][:10]}: " + ", ".join(f"{field}={gapsum[field]}" for field in fields + ('big_gaps',)))
+    print(f"on_batch {batch_seconds:.2f}s, on_record {record_seconds:.2f}s")
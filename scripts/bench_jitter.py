@@ -0,0 +1,133 @@
+# Benchmark: aggregators.JitterReporter (CrudeAnalyzer plugin) on synthetic streams with a drifting delay and swapped
+# records. Checks every report against a brute force computation over the records of its interval (numpy, polyfit for
+# the slopes), the reservoir sample, one report per interval, and the batch path (on_batch) against on_record.
+# usage: python bench_jitter.py [records per stream] [streams] [interval seconds]
+# imports
+import os
+import sys
+import math
+import time
+import random
+import tempfile
+
+import numpy as np
+
+import synthetic
+import utils
+import sinks
+import constants
+import aggregators
+import crude_reader
+# End: imports -----------------------------------------------------------------
+START: float = 1613520000.0
+PARTS: int = 10
+RESERVOIR_SIZE: int = 100
+
+
+def stream_records(n, rng) -> list[tuple]:
+    """(seq, tx, rx) in arrival order, ~100 records/s, the delay drifts (sine) with noise, 1% of the records swapped"""
+    records = []
+    tx = START + rng.random()
+    for seq in range(1, n + 1):
+        tx += 0.01 + rng.uniform(-0.002, 0.002)
+        delay = 0.004 + 0.002 * math.sin(tx / 30) + rng.random() * 0.0005
+        records.append((seq, round(tx, 6), round(tx + delay, 6))) # as written in the file
+    for i in range(0, n - 1):
+        if rng.random() < 0.01:
+            records[i], records[i + 1] = records[i + 1], records[i]
+    return records
+
+
+def write_streams(filename, n, streams) -> dict[int, list[tuple]]:
+    rng = random.Random(1)
+    arrivals = {stream_id: stream_records(n, rng) for stream_id in range(1, streams + 1)}
+    with open(filename, 'w') as file:
+        file.writelines(synthetic.CRUDE_HEADER)
+        for i in range(n):
+            for stream_id, arrival in arrivals.items():
+                seq, tx, rx = arrival[i]
+                file.write(synthetic.CRUDE_LINE.format(id=stream_id, seq=seq, src=f"10.0.0.{stream_id}", dst="158.39.1.90", tx=tx, rx=rx, hoplimit=-1))
+    return arrivals
+
+
+def brute_force(arrival, interval) -> list[dict]:
+    """Reports of one stream: records go to the interval of the highest tx seen so far, in arrival order"""
+    groups: dict[float, list[tuple]] = {}
+    highest = None
+    for seq, tx, rx in arrival:
+        highest = tx if highest is None else max(highest, tx)
+        groups.setdefault(math.floor(highest / interval) * interval, []).append((tx, rx))
+    reports = []
+    least = None
+    for start, records in groups.items():
+        tx = np.array([tx for tx, rx in records])
+        rx = np.array([rx for tx, rx in records])
+        x, delay = tx - start, rx - tx
+        least = delay.min() if least is None else min(least, delay.min())
+        part_length = interval / PARTS
+        parts = np.clip((x / part_length).astype(int), 0, PARTS - 1)
+        reports.append({
+            'timestamp': start,
+            'h_n': len(records),
+            'h_delay': delay.mean(),
+            'h_min_d': delay.min(),
+            'h_jit': np.abs(np.diff(rx)).mean() if len(records) > 1 else None,
+            'h_ddelay': delay.mean() - least,
+            'h_slope_10': np.polyfit(x[-10:], delay[-10:], 1)[0] if len(records) >= 2 else None,
+            'slopes': [np.polyfit(x[parts == part], delay[parts == part], 1)[0] if np.count_nonzero(parts == part) >= 2 else None for part in range(PARTS)],
+            'records': dict(zip(x.tolist(), delay.tolist())),
+        })
+    return reports
+
+
+def close(a, b) -> bool:
+    return (a is None and b is None) or (a is not None and b is not None and math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-9))
+
+
+def run(filename, interval, batches) -> tuple[list, aggregators.JitterReporter, float]:
+    reports = sinks.MemorySink()
+    reporter = aggregators.JitterReporter(sink=reports, interval=interval, parts=PARTS, reservoir_size=RESERVOIR_SIZE, seed=1)
+    analyzer = utils.CrudeAnalyzer(sink=sinks.MemorySink(), plugins=[reporter], **constants.CRUDE_ANALYZER_SETTINGS)
+    start = time.perf_counter()
+    for batch in crude_reader.CrudeReader(filename=filename).batches():
+        if batches:
+            analyzer.add_batch(batch)
+        else:
+            for record in batch.records():
+                analyzer.add_record(record)
+    analyzer.cleanup()
+    return reports.events, reporter, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+    streams: int = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    interval: float = float(sys.argv[3]) if len(sys.argv) > 3 else 60.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'crude-jitter.txt')
+        arrivals = write_streams(filename, n, streams)
+        reports, reporter, batch_seconds = run(filename, interval, batches=True)
+        record_reports, record_reporter, record_seconds = run(filename, interval, batches=False)
+
+    assert reports == record_reports # dicts, MemorySink keeps to_dict()
+    positions: list[float] = [] # sampled tx as a fraction of the interval, full reservoirs
+    for stream_id, arrival in arrivals.items():
+        expected = brute_force(arrival, interval)
+        stream_reports = [report for report in reports if report['from'] == f"10.0.0.{stream_id}"]
+        assert [report['timestamp'] for report in stream_reports] == [report['timestamp'] for report in expected], stream_id # one per interval
+        for report, want in zip(stream_reports, expected):
+            where = (stream_id, report['timestamp'])
+            assert report['h_n'] == want['h_n'], where
+            for field in ('h_delay', 'h_min_d', 'h_jit', 'h_ddelay', 'h_slope_10'):
+                assert close(report[field], want[field]), (where, field, report[field], want[field])
+            assert all(close(None if slope == 'None' else float(slope), polyfit) for slope, polyfit in zip(report['slopes'], want['slopes'])), where
+            assert len(report['rtx']) == len(report['rdelay']) == min(want['h_n'], RESERVOIR_SIZE) <= RESERVOIR_SIZE, where
+            assert report['rtx'] == sorted(report['rtx']), where
+            assert all(close(want['records'][x], rdelay + report['h_min_d']) for x, rdelay in zip(report['rtx'], report['rdelay'])), where
+            if want['h_n'] > 10 * RESERVOIR_SIZE:
+                positions += [x / interval for x in report['rtx']]
+    assert abs(np.mean(positions) - 0.5) < 0.05, np.mean(positions) # spread over the interval, not the first records
+
+    print(f"{streams} streams x {n} records, {len(reports)} reports of {interval:.0f}s equal to the brute force computation, {reporter}")
+    print(f"on_batch {batch_seconds:.2f}s, on_record {record_seconds:.2f}s")
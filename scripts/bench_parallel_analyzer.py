@@ -0,0 +1,34 @@
+# Benchmark: ShardedCrudeAnalyzer with 1..n workers on a multi-stream file, output must equal serial mode
+# usage: python bench_parallel_analyzer.py [crude-file.gz or ""] [workers ...]
+# imports
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+import parallel_analyzer
+import synthetic
+# End: imports -----------------------------------------------------------------
+MILL = 1000000
+SETTINGS: dict = dict(window_size=100, h_limit=5, t_limit=5, start_gap_threshold=6, end_gap_threshold=5)
+
+
+if __name__ == "__main__":
+    cpus: int = multiprocessing.cpu_count()
+    workers: list[int] = [int(arg) for arg in sys.argv[2:]] or sorted({2, 4, cpus} - {1})
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] else synthetic.write_crude(os.path.join(tmp, 'crude-bench.gz'), n=1*MILL, streams=32, gap_every=2000, reorder_every=11)
+        print(f"file: {filename}, cpus: {cpus}")
+
+        start = time.perf_counter()
+        expected = parallel_analyzer.ShardedCrudeAnalyzer(workers=1, **SETTINGS).analyze(filename)
+        serial: float = time.perf_counter() - start
+        print(f"serial:    {serial:7.2f}s  gaps={len(expected)}")
+
+        for n in workers:
+            start = time.perf_counter()
+            gaps = parallel_analyzer.ShardedCrudeAnalyzer(workers=n, **SETTINGS).analyze(filename)
+            elapsed: float = time.perf_counter() - start
+            print(f"workers={n}: {elapsed:7.2f}s  gaps={len(gaps)}  speedup={serial / elapsed:4.2f}x  same_as_serial={gaps == expected}")
+            assert gaps == expected, "parallel output differs from serial"
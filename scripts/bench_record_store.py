@@ -0,0 +1,54 @@
+# Benchmark: memory of per-record python objects vs CrudeRecordStore
+# usage: python bench_record_store.py [records]
+# imports
+import sys
+import tracemalloc
+
+import emil_types
+import utils
+import synthetic
+# End: imports -----------------------------------------------------------------
+
+
+class DictRecord():
+    """CrudeRecord as it was before __slots__ (one __dict__ per record)"""
+
+    def __init__(self, id, seq, src, dst, tx, rx, size, hoplimit):
+        self.id = int(id)
+        self.seq = int(seq)
+        self.src = src
+        self.dst = dst
+        self.tx = float(tx)
+        self.rx = float(rx)
+        self.size = int(size)
+        self.hoplimit = int(hoplimit)
+
+
+def measure(name, build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{name:>22}: {used / 1024:10.1f} KiB  {used / max(len(kept), 1):7.1f} bytes/record")
+    del kept
+    return used
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = list(synthetic.crude_lines(n=n))
+    parse = lambda line: [kv.split('=')[1].split(':')[0] for kv in line.split()] # as in crude_parser.py, new src/dst strings per line
+    old = measure('list[dict record]', lambda: [DictRecord(*parse(line)) for line in lines])
+    measure('list[CrudeRecord]', lambda: [emil_types.CrudeRecord(*parse(line)) for line in lines])
+    new = measure('CrudeRecordStore', lambda: emil_types.CrudeRecordStore(records=(emil_types.CrudeRecord(*parse(line)) for line in lines)))
+    print(f"store uses {old / new:.1f}x less memory than dict records")
+
+    # whole stream analyzer: window + buffer
+    window_size: int = 10000
+    def analyzer():
+        stream_analyzer = utils.CrudeStreamAnalyzer(stream_id=1, h_limit=50, t_limit=50, start_gap_threshold=6, end_gap_threshold=5, window_size=window_size)
+        for line in lines[:3*window_size]:
+            stream_analyzer.add_record(emil_types.CrudeRecord(*parse(line)))
+        return stream_analyzer.window
+    measure(f'analyzer window={window_size}', analyzer)
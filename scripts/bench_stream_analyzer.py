@@ -0,0 +1,39 @@
+# Benchmark: per-record cost of CrudeStreamAnalyzer for growing window sizes (should stay flat)
+# usage: python bench_stream_analyzer.py [window_size ...]
+# imports
+import os
+import sys
+import time
+import tempfile
+
+import utils
+import crude_reader
+import synthetic
+# End: imports -----------------------------------------------------------------
+
+
+def per_record_cost(store, window_size) -> float:
+    """Seconds per record once buffer and window are full"""
+    analyzer = utils.CrudeStreamAnalyzer(stream_id=1, h_limit=5, t_limit=5, start_gap_threshold=6, end_gap_threshold=5, window_size=window_size)
+    warmup: int = 2 * window_size
+    records = iter(store)
+    for i, record in zip(range(warmup), records):
+        analyzer.add_record(record)
+    measured: int = 0
+    start = time.perf_counter()
+    for record in records:
+        analyzer.add_record(record)
+        measured += 1
+    return (time.perf_counter() - start) / measured
+
+
+if __name__ == "__main__":
+    window_sizes: list[int] = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 100000]
+    measured_records: int = 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        # reordered but no gaps, so nothing is printed while measuring
+        filename = synthetic.write_crude(os.path.join(tmp, 'crude-bench.gz'), n=2*max(window_sizes) + measured_records, reorder_every=7)
+        store = crude_reader.CrudeBatch.concatenate(list(crude_reader.CrudeReader(filename=filename))).store()
+    for window_size in window_sizes:
+        cost = per_record_cost(store[:2*window_size + measured_records], window_size)
+        print(f"window_size={window_size:>7}: {cost * 1e6:6.2f} us/record")
@@ -0,0 +1,68 @@
+# Benchmark: traceroute.py on synthetic traceroute files of a node and day (synthetic.write_traceroute), checks the running
+# statistics against numpy on all rtts and compares one process with the process pool.
+# usage: python bench_traceroute.py [targets] [runs per file] [workers]
+# imports
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+import synthetic
+import traceroute
+# End: imports -----------------------------------------------------------------
+
+
+def all_rtts(trace_route_file) -> tuple[dict[tuple, list[float]], dict[int, int]]:
+    """(hop, router, ip) -> every rtt, kept in memory, and hop -> '*' probes of the runs with an answer at the hop"""
+    rtts: dict[tuple, list[float]] = {}
+    lost: dict[int, int] = {}
+    for line in trace_route_file.lines():
+        hop = traceroute.HOP.match(line)
+        if hop is not None and traceroute.HEADER.match(line) is None:
+            probes = traceroute.parse_hop(hop.group('probes'))
+            if any(router is not None for router, rtt in probes):
+                lost[int(hop.group('hop'))] = lost.get(int(hop.group('hop')), 0) + sum(1 for router, rtt in probes if router is None)
+            for router, rtt in probes:
+                if router is not None:
+                    rtts.setdefault((int(hop.group('hop')), *router), []).append(rtt)
+    return rtts, lost
+
+
+if __name__ == "__main__":
+    targets: int = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    runs: int = int(sys.argv[2]) if len(sys.argv) > 2 else 288 # every 5 minutes
+    workers: int = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    with tempfile.TemporaryDirectory() as root:
+        day_dir = os.path.join(root, 'teknobyen-mp.uninett.no', '2021-02-07')
+        os.makedirs(day_dir)
+        for i in range(targets):
+            target = f"158.38.{i // 250}.{i % 250 + 1}"
+            synthetic.write_traceroute(os.path.join(day_dir, f"traceroute_{target}.gz"), runs, target=target, hops=12, paths=3, seed=i)
+        files = traceroute.discover(nodes=['*'], date_from='2021-02-07', date_to='2021-02-07', root=root)
+        assert len(files) == targets
+
+        aggregator = files[0].aggregate()
+        trace_route = aggregator.trace_route()
+        assert aggregator.runs == runs and trace_route.timestamp_to - trace_route.timestamp_from == 86400
+        expected, expected_lost = all_rtts(files[0])
+        assert len(trace_route.stats) == len(expected)
+        for hop in trace_route.stats:
+            rtts = np.array(expected[(hop.hop, hop.router, hop.address)])
+            assert np.isclose(hop.avg, rtts.mean()) and np.isclose(hop.sdv, rtts.std()) and (hop.min, hop.max) == (rtts.min(), rtts.max()), hop.router
+        for hop, lost in expected_lost.items(): # each '*' is charged once, across the routers of the hop
+            assert np.isclose(sum(stats.lost for key, stats in aggregator.stats.items() if key[0] == hop), lost), hop
+        print(f"{aggregator}, stats equal to numpy, {sum(expected_lost.values())} lost probes")
+
+        start = time.perf_counter()
+        serial = [trace_route_file.aggregate().trace_route() for trace_route_file in files]
+        serial_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        parallel = traceroute.run(files, workers=workers)
+        parallel_seconds = time.perf_counter() - start
+        key = lambda trace_route: trace_route.to
+        assert [[vars(hop) for hop in t.stats] for t in sorted(serial, key=key)] == [[vars(hop) for hop in t.stats] for t in sorted(parallel, key=key)]
+        lines = targets * runs * 13
+        print(f"{targets} files, {lines} lines: one process {serial_seconds:.2f}s ({lines / serial_seconds:.0f} lines/s), pool {parallel_seconds:.2f}s ({lines / parallel_seconds:.0f} lines/s)")
@@ -1,2 +1,19 @@
+import os
+
 ICMP_DEST_UNREACHABLE: int = 3
 ICMP_PORT_UNREACHABLE: int = 3
+
+# archive layout, see paths.txt
+DATA_ROOT: str = "/dynga/uninett/data"
+CRUDE_GLOB: str = "{node}/{date}/crude*.gz" # date: yyyy-mm-dd
+CRUDE_CACHE_DIR: str = os.environ.get('MICRODEP_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'microdep', 'crude')) # see crude_cache.py
+
+# settings used by crude_parser.py
+CRUDE_ANALYZER_SETTINGS: dict = dict(window_size=100, h_limit=5, t_limit=5, start_gap_threshold=6, end_gap_threshold=5)
+
+# settings used by correlation.py
+CORRELATION_TOLERANCE: float = 60.0 # seconds, +- between a gap (or gap end) and a trap
+
+# settings used by traceroute.py
+TRACEROUTE_GLOB: str = "{node}/{date}/traceroute_*.gz" # date: yyyy-mm-dd
+TCPTRACEROUTE_GLOB: str = "{node}/{date}/tcptraceroute_*.gz"
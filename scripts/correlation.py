@@ -0,0 +1,443 @@
+# Correlation of gaps with snmp traps (microdep_types.LinkGapMatch: before, before_and_after, after) and with bgp updates
+# (microdep_types.Routing, see RoutingCorrelator).
+# usage: python correlation.py <gaps.jsonl> [--traps traps.jsonl] [--bgp-updates updates.jsonl] [--trace-routes trace_routes.jsonl]
+#                              [--tolerance 60] [--out matches.jsonl]
+# Input files are json lines, or gzip json lines when they end with .gz (sinks.GzipJsonLinesSink).
+#
+# A trap is near a gap when the first part of trap.name is the site of gap.from or gap.to ('tromso' of tromso-gw3.uninett.no
+# and tromso-gw.uninett.no), or trap.name / trap.trap_source is one of the routers of the gap's trace_route (routers_used
+# of the TraceRoute of (from, to) covering the gap):
+#   before            any trap near the gap at gap.timestamp +- tolerance
+#   after             a linkUp trap near the gap at gap.timestamp + gap.tloss +- tolerance
+#   before_and_after  a before trap and a later after trap of the same link (trap_source, ifIndex), a match per pair
+#
+# Traps are sorted by timestamp once per key (site, name, trap_source). The gaps of a key look up their windows with one
+# numpy.searchsorted, O((G + T) log T) plus the matches instead of a G * T loop.
+# Bgp update prefixes are in a PrefixTrie (longest prefix match of the gap's ips) with the updates of each prefix sorted by
+# timestamp, O(address bits + log U) per ip.
+# Gaps, traps and trace routes are dicts or objects with to_dict() (microdep_types and emil_types events).
+# imports
+import bisect
+import functools
+import argparse
+import ipaddress
+from typing import Iterator
+
+import numpy as np
+
+import sinks
+import constants
+import event_codecs
+import microdep_types
+# End: imports -----------------------------------------------------------------
+
+
+def field(data: dict, *keys, default=None):
+    """First key of #keys that is set, eg. field(gap, 'from_', 'from', 'from_adr')"""
+    for key in keys:
+        value = data.get(key)
+        if value is not None:
+            return value
+    return default
+
+
+def site(host) -> str:
+    """'tromso' of 'tromso-gw3.uninett.no'"""
+    return str(host).split('.')[0].split('-')[0].lower() if host else ''
+
+
+ADDRESS_CACHE_SIZE: int = 65536 # parse_address() results kept, addresses and prefixes repeat a lot
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def parse_address(text) -> tuple[int, int, int]:
+    """'10.0.0.0/8' -> (4, 0x0a000000, 8), '2001:db8::1' -> (6, 0x20010db8...1, 128), None if not an ip or prefix"""
+    try:
+        network = ipaddress.ip_network(str(text), strict=False)
+    except ValueError:
+        return None
+    return network.version, int(network.network_address), network.prefixlen
+
+
+def trap_keys(trap: dict) -> set[str]:
+    return {key for key in (site(trap.get('name')), trap.get('name'), trap.get('trap_source')) if key}
+
+
+def trap_link(trap: dict) -> tuple:
+    """The link (interface) a trap is about"""
+    return field(trap, 'trap_source', 'name'), field(trap, 'ifIndex', 'logical_name', 'ifDescr')
+
+
+class TrapIndex():
+    """
+    Positions of #traps by key, sorted by timestamp. Only traps of #trap_type (case insensitive) when given.
+    index.windows(key, starts, ends) -> (lo, hi), index.positions[key][lo[i]:hi[i]] are the traps in [starts[i], ends[i]]
+    """
+
+    def __init__(self, traps: list[dict], trap_type=None, *args, **kwargs):
+        self.traps: list[dict] = traps
+        self.trap_type: str = trap_type
+        self.times: dict[str, np.ndarray] = {}
+        self.positions: dict[str, np.ndarray] = {}
+        by_key: dict[str, list[int]] = {}
+        for position, trap in enumerate(traps):
+            if trap_type is None or str(trap.get('trap_type', '')).lower() == trap_type.lower():
+                for key in trap_keys(trap):
+                    by_key.setdefault(key, []).append(position)
+        for key, positions in by_key.items():
+            positions = np.array(positions, dtype=np.int64)
+            times = np.array([float(traps[position]['timestamp']) for position in positions])
+            order = np.argsort(times, kind='stable')
+            self.times[key], self.positions[key] = times[order], positions[order]
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] trap_type={self.trap_type}, keys={len(self.times)}, traps={sum(len(times) for times in self.times.values())}"
+
+    def __contains__(self, key) -> bool:
+        return key in self.times
+
+    def windows(self, key: str, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        times = self.times[key]
+        return np.searchsorted(times, starts, side='left'), np.searchsorted(times, ends, side='right')
+
+
+class TraceRouteIndex():
+    """
+    The trace route of (from, to) with timestamp_from <= timestamp <= timestamp_to, by path and sorted by timestamp_from.
+    index.lookup(from_, to, timestamps) -> route ids, index.routers[route id] is its routers_used ([] for id 0, no route),
+    index.addresses[route id] the ips of its hops
+    """
+
+    def __init__(self, trace_routes=(), *args, **kwargs):
+        routes: dict[tuple, list[tuple]] = {}
+        for trace_route in map(sinks.EventSink.serialize, trace_routes):
+            stats = [hop if isinstance(hop, dict) else vars(hop) for hop in trace_route.get('stats') or []]
+            routers = trace_route.get('routers_used')
+            if routers is None: # from the hop stats
+                routers = [field(hop, 'router', 'address') for hop in stats]
+            addresses = [address for address in dict.fromkeys([hop.get('address') for hop in stats] + list(routers)) if parse_address(address)]
+            path = (field(trace_route, 'from_', 'from'), trace_route.get('to'))
+            routes.setdefault(path, []).append((float(trace_route['timestamp_from']), float(trace_route['timestamp_to']), [router for router in routers if router], addresses))
+        self.routers: list[list[str]] = [[]]
+        self.addresses: list[list[str]] = [[]]
+        self.paths: dict[tuple, tuple[np.ndarray, np.ndarray, np.ndarray]] = {} # path -> starts, ends, route ids
+        for path, path_routes in routes.items():
+            path_routes.sort(key=lambda route: route[0])
+            ids = np.arange(len(self.routers), len(self.routers) + len(path_routes))
+            self.routers += [route[2] for route in path_routes]
+            self.addresses += [route[3] for route in path_routes]
+            self.paths[path] = np.array([route[0] for route in path_routes]), np.array([route[1] for route in path_routes]), ids
+
+    def __len__(self) -> int:
+        return len(self.routers) - 1
+
+    def routes(self, gaps: list[dict], timestamps: np.ndarray) -> tuple[np.ndarray, dict[tuple, np.ndarray]]:
+        """Route id per gap, and the gaps of each (from, to)"""
+        paths: dict[tuple, list[int]] = {}
+        for i, gap in enumerate(gaps):
+            paths.setdefault((field(gap, 'from_', 'from', 'from_adr'), field(gap, 'to', 'to_adr')), []).append(i)
+        paths = {path: np.array(path_gaps, dtype=np.int64) for path, path_gaps in paths.items()}
+        routes = np.zeros(len(gaps), dtype=np.int64)
+        for (from_, to), path_gaps in paths.items():
+            routes[path_gaps] = self.lookup(from_, to, timestamps[path_gaps])
+        return routes, paths
+
+    def lookup(self, from_, to, timestamps: np.ndarray) -> np.ndarray:
+        if (from_, to) not in self.paths:
+            return np.zeros(len(timestamps), dtype=np.int64)
+        starts, ends, ids = self.paths[(from_, to)]
+        i = np.searchsorted(starts, timestamps, side='right') - 1
+        found = (i >= 0) & (timestamps <= ends[np.maximum(i, 0)])
+        return np.where(found, ids[np.maximum(i, 0)], 0)
+
+
+class LinkGapCorrelator():
+    """
+    correlator = LinkGapCorrelator(traps, trace_routes=trace_routes, tolerance=60)
+    for match in correlator.correlate(gaps): # microdep_types.LinkGapMatch, per gap: before, before_and_after, after
+        ...
+    """
+
+    def __init__(self, traps, trace_routes=(), tolerance=constants.CORRELATION_TOLERANCE, timestamp_zone="GMT", *args, **kwargs):
+        self.traps: list[dict] = [sinks.EventSink.serialize(trap) for trap in traps]
+        self.index: TrapIndex = TrapIndex(self.traps)
+        self.up_index: TrapIndex = TrapIndex(self.traps, trap_type='linkUp')
+        self.trace_routes: TraceRouteIndex = TraceRouteIndex(trace_routes)
+        self.tolerance: float = float(tolerance)
+        self.timestamp_zone: str = timestamp_zone
+        self._from_dict = event_codecs.codec(microdep_types.LinkGapMatch).from_dict
+        self.gap_counter: int = 0
+        self.match_counter: dict[str, int] = {'before': 0, 'before_and_after': 0, 'after': 0}
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] traps={len(self.traps)}, tolerance={self.tolerance}, gaps={self.gap_counter}, matches={self.match_counter}"
+
+    def _join(self, index: TrapIndex, queries: dict[str, np.ndarray], times: np.ndarray) -> dict[int, set[int]]:
+        """Gap -> positions of the traps of #index within tolerance of times[gap], for the keys of the gap"""
+        found: dict[int, set[int]] = {}
+        for key, gaps in queries.items():
+            if key not in index:
+                continue
+            lo, hi = index.windows(key, times[gaps] - self.tolerance, times[gaps] + self.tolerance)
+            positions = index.positions[key]
+            for i in np.flatnonzero(hi > lo):
+                found.setdefault(int(gaps[i]), set()).update(positions[lo[i]:hi[i]].tolist())
+        return found
+
+    def _match(self, match_type: str, gap: dict, trap: dict, routers_used: list[str]) -> microdep_types.LinkGapMatch:
+        self.match_counter[match_type] += 1
+        return self._from_dict({ # the generated decoder, no kwargs checks per match
+            'match_type': match_type,
+            'routers_used': routers_used,
+            'timestamp': gap['timestamp'],
+            'from': field(gap, 'from_', 'from', 'from_adr'),
+            'to': field(gap, 'to', 'to_adr'),
+            'tloss': gap.get('tloss'),
+            'timestamp_zone': gap.get('timestamp_zone') or self.timestamp_zone,
+            'name': trap.get('name'),
+            'timestamp_trap': trap['timestamp'],
+            'logical_name': trap.get('logical_name'),
+            'ifAlias': trap.get('ifAlias'),
+            'trap_type': trap.get('trap_type'),
+            'trap_source': trap.get('trap_source'),
+        })
+
+    def correlate(self, gaps) -> Iterator[microdep_types.LinkGapMatch]:
+        gaps = [sinks.EventSink.serialize(gap) for gap in gaps]
+        self.gap_counter += len(gaps)
+        timestamps = np.array([float(gap['timestamp']) for gap in gaps])
+        ends = timestamps + np.array([float(gap.get('tloss') or 0.0) for gap in gaps])
+        routes, paths = self.trace_routes.routes(gaps, timestamps) # trace route id per gap
+        queries: dict[str, list[np.ndarray]] = {} # key -> gaps
+        for (from_, to), path_gaps in paths.items():
+            path_routes = routes[path_gaps]
+            for route in np.unique(path_routes):
+                keys = {site(from_), site(to), *self.trace_routes.routers[route]}
+                for key in keys:
+                    if key and key in self.index:
+                        queries.setdefault(key, []).append(path_gaps[path_routes == route])
+        queries = {key: np.concatenate(gaps_of_key) for key, gaps_of_key in queries.items()}
+        before = self._join(self.index, queries, timestamps)
+        after = self._join(self.up_index, queries, ends)
+        for i in sorted(before.keys() | after.keys()):
+            gap, routers_used = gaps[i], self.trace_routes.routers[routes[i]]
+            firsts = sorted(before.get(i, ()), key=lambda position: self.traps[position]['timestamp'])
+            lasts = sorted(after.get(i, ()), key=lambda position: self.traps[position]['timestamp'])
+            for first in firsts:
+                yield self._match('before', gap, self.traps[first], routers_used)
+            for first in firsts:
+                link, timestamp = trap_link(self.traps[first]), self.traps[first]['timestamp']
+                for last in lasts:
+                    if last != first and self.traps[last]['timestamp'] >= timestamp and trap_link(self.traps[last]) == link:
+                        yield self._match('before_and_after', gap, self.traps[last], routers_used)
+            for last in lasts:
+                yield self._match('after', gap, self.traps[last], routers_used)
+
+
+class PrefixNode():
+    """A node of PrefixTrie: the first #length bits of #key, #value is set for inserted prefixes"""
+    __slots__ = ('key', 'length', 'children', 'value')
+
+    def __init__(self, key=0, length=0, value=None):
+        self.key: int = key
+        self.length: int = length
+        self.children: list = [None, None]
+        self.value = value
+
+
+class PrefixTrie():
+    """
+    Path compressed binary (patricia) trie of ipv4 and ipv6 prefixes, a root per ip version. Values must not be None.
+    trie.setdefault('10.0.0.0/8', value) -> the value of the prefix (#value if it is new)
+    trie.longest('10.1.2.3') -> the value of the longest prefix with the address, None if there is none
+    Nodes only where prefixes branch, a lookup walks at most 32 / 128 bits.
+    """
+    BITS: dict[int, int] = {4: 32, 6: 128}
+
+    def __init__(self, *args, **kwargs):
+        self.roots: dict[int, PrefixNode] = {version: PrefixNode() for version in self.BITS}
+        self.prefixes: int = 0
+
+    def __len__(self) -> int:
+        return self.prefixes
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] prefixes={self.prefixes}"
+
+    def setdefault(self, prefix, value):
+        parsed = parse_address(prefix)
+        if parsed is None:
+            raise Exception(f"[{self.__class__.__name__}] not an ip prefix: {prefix}")
+        version, key, length = parsed
+        bits = self.BITS[version]
+        node = self.roots[version] # key has the first node.length bits of node
+        while node.length < length:
+            bit = (key >> (bits - 1 - node.length)) & 1
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = PrefixNode(key, length, value)
+                self.prefixes += 1
+                return value
+            common = min(bits - (key ^ child.key).bit_length(), length, child.length)
+            if common == child.length:
+                node = child
+                continue
+            if common == length: # the new prefix goes between node and child
+                new = PrefixNode(key, length, value)
+            else: # branch where they differ
+                new = PrefixNode(key >> (bits - common) << (bits - common), common)
+                new.children[(key >> (bits - 1 - common)) & 1] = PrefixNode(key, length, value)
+            new.children[(child.key >> (bits - 1 - common)) & 1] = child
+            node.children[bit] = new
+            self.prefixes += 1
+            return value
+        if node.value is None:
+            node.value = value
+            self.prefixes += 1
+        return node.value
+
+    def longest(self, address):
+        parsed = parse_address(address)
+        if parsed is None:
+            return None
+        version, key, _ = parsed
+        bits = self.BITS[version]
+        node = self.roots[version]
+        value = node.value
+        while node.length < bits:
+            node = node.children[(key >> (bits - 1 - node.length)) & 1]
+            if node is None or (key ^ node.key) >> (bits - node.length):
+                break
+            if node.value is not None:
+                value = node.value
+        return value
+
+
+class PrefixUpdates():
+    """The bgp updates of a prefix: positions in RoutingCorrelator.updates, sorted by timestamp after sort()"""
+    __slots__ = ('times', 'positions')
+
+    def __init__(self):
+        self.times: list[float] = []
+        self.positions: list[int] = []
+
+    def add(self, timestamp: float, position: int) -> None:
+        self.times.append(timestamp)
+        self.positions.append(position)
+
+    def sort(self) -> None:
+        order = sorted(range(len(self.times)), key=self.times.__getitem__)
+        self.times, self.positions = [self.times[i] for i in order], [self.positions[i] for i in order]
+
+    def window(self, start: float, end: float) -> list[int]:
+        return self.positions[bisect.bisect_left(self.times, start):bisect.bisect_right(self.times, end)]
+
+
+class RoutingCorrelator():
+    """
+    correlator = RoutingCorrelator(bgp_updates, trace_routes=trace_routes, tolerance=60)
+    for match in correlator.correlate(gaps): # microdep_types.Routing, per gap: bgp_update, bgp_update_before_and_after
+        ...
+    The ips of a gap (from_ip / from_adr, to_ip / to_adr and the hop addresses of its trace route, Routing.ip_list) are
+    looked up in a PrefixTrie of the update prefixes, longest prefix match (the prefix the traffic was routed by):
+      bgp_update                   an update of the prefix at gap.timestamp +- tolerance
+      bgp_update_before_and_after  a withdraw (type W) of the prefix at gap.timestamp +- tolerance and a later announce (A)
+                                   at gap.timestamp + gap.tloss +- tolerance, a match per pair with the announce as bgp_update
+    """
+
+    def __init__(self, bgp_updates, trace_routes=(), tolerance=constants.CORRELATION_TOLERANCE, timestamp_zone="GMT", *args, **kwargs):
+        self.updates: list[dict] = [sinks.EventSink.serialize(update) for update in bgp_updates]
+        self.trie: PrefixTrie = PrefixTrie()
+        self.skipped_updates: int = 0 # without a valid prefix
+        prefixes: dict[str, PrefixUpdates] = {}
+        for position, update in enumerate(self.updates):
+            prefix = update.get('prefix')
+            if prefix not in prefixes:
+                if parse_address(prefix) is None:
+                    self.skipped_updates += 1
+                    continue
+                prefixes[prefix] = self.trie.setdefault(prefix, PrefixUpdates()) # '10.0.0.1/8' and '10.0.0.0/8' are the same
+            prefixes[prefix].add(float(update['timestamp']), position)
+        for updates in {id(updates): updates for updates in prefixes.values()}.values():
+            updates.sort()
+        self.trace_routes: TraceRouteIndex = TraceRouteIndex(trace_routes)
+        self.tolerance: float = float(tolerance)
+        self.timestamp_zone: str = timestamp_zone
+        self._from_dict = event_codecs.codec(microdep_types.Routing).from_dict
+        self.gap_counter: int = 0
+        self.match_counter: dict[str, int] = {'bgp_update': 0, 'bgp_update_before_and_after': 0}
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] updates={len(self.updates)}, {self.trie}, tolerance={self.tolerance}, gaps={self.gap_counter}, matches={self.match_counter}"
+
+    def _match(self, match_type: str, gap: dict, from_adr: str, to_adr: str, ip_list: list[str], update: dict) -> microdep_types.Routing:
+        self.match_counter[match_type] += 1
+        return self._from_dict({
+            'match_type': match_type,
+            'from': field(gap, 'from_', 'from', 'from_adr'),
+            'to': field(gap, 'to', 'to_adr'),
+            'from_adr': from_adr,
+            'to_adr': to_adr,
+            'timestamp': gap['timestamp'],
+            'timestamp_zone': gap.get('timestamp_zone') or self.timestamp_zone,
+            'tloss': gap.get('tloss'),
+            'ip_list': ip_list,
+            'bgp_update': update,
+        })
+
+    def correlate(self, gaps) -> Iterator[microdep_types.Routing]:
+        gaps = [sinks.EventSink.serialize(gap) for gap in gaps]
+        self.gap_counter += len(gaps)
+        timestamps = np.array([float(gap['timestamp']) for gap in gaps])
+        routes, _ = self.trace_routes.routes(gaps, timestamps)
+        longest: dict[str, PrefixUpdates] = {} # address -> updates of its longest prefix
+        for i, gap in enumerate(gaps):
+            from_adr = next((address for address in (gap.get('from_ip'), gap.get('from_adr')) if parse_address(address)), None)
+            to_adr = next((address for address in (gap.get('to_ip'), gap.get('to_adr')) if parse_address(address)), None)
+            ip_list = [address for address in dict.fromkeys((from_adr, to_adr, *self.trace_routes.addresses[routes[i]])) if address]
+            prefixes: dict[int, PrefixUpdates] = {}
+            for address in ip_list:
+                if address not in longest:
+                    longest[address] = self.trie.longest(address)
+                if longest[address] is not None:
+                    prefixes[id(longest[address])] = longest[address]
+            timestamp, end = float(timestamps[i]), float(timestamps[i]) + float(gap.get('tloss') or 0.0)
+            for updates in prefixes.values():
+                firsts = updates.window(timestamp - self.tolerance, timestamp + self.tolerance)
+                for first in firsts:
+                    yield self._match('bgp_update', gap, from_adr, to_adr, ip_list, self.updates[first])
+                withdraws = [first for first in firsts if self.updates[first].get('type') == 'W']
+                if not withdraws:
+                    continue
+                announces = [last for last in updates.window(end - self.tolerance, end + self.tolerance) if self.updates[last].get('type') == 'A']
+                for first in withdraws:
+                    for last in announces:
+                        if float(self.updates[last]['timestamp']) >= float(self.updates[first]['timestamp']):
+                            yield self._match('bgp_update_before_and_after', gap, from_adr, to_adr, ip_list, self.updates[last])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gap <-> snmp trap (LinkGapMatch) and bgp update (Routing) correlation")
+    parser.add_argument('gaps', help="gaps as json lines")
+    parser.add_argument('--traps', help="snmp traps (LinkTrap) as json lines")
+    parser.add_argument('--bgp-updates', help="bgp updates (BgpUpdate) as json lines")
+    parser.add_argument('--trace-routes', help="trace_route records (TraceRoute) as json lines, for routers_used and ip_list")
+    parser.add_argument('--tolerance', type=float, default=constants.CORRELATION_TOLERANCE, help="seconds")
+    parser.add_argument('--out', help="matches as json lines, default: print")
+    args = parser.parse_args()
+
+    gaps = list(event_codecs.json_lines(args.gaps))
+    trace_routes = list(event_codecs.json_lines(args.trace_routes)) if args.trace_routes else ()
+    correlators: list = []
+    if args.traps:
+        correlators.append(LinkGapCorrelator(list(event_codecs.json_lines(args.traps)), trace_routes=trace_routes, tolerance=args.tolerance))
+    if args.bgp_updates:
+        correlators.append(RoutingCorrelator(list(event_codecs.json_lines(args.bgp_updates)), trace_routes=trace_routes, tolerance=args.tolerance))
+    matches = (match for correlator in correlators for match in correlator.correlate(gaps))
+    if args.out:
+        event_codecs.write_json_lines(matches, args.out)
+    else:
+        for match in matches:
+            print(event_codecs.to_json(match))
+    for correlator in correlators:
+        print(correlator)
@@ -0,0 +1,162 @@
+# Columnar cache of parsed crude files. The first read parses the .gz once, later reads memory map the columns.
+# usage: python crude_cache.py <crude file> [...]   (builds the cache entries)
+# imports
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from typing import Iterator
+
+import numpy as np
+
+import emil_types
+import constants
+import crude_reader
+# End: imports -----------------------------------------------------------------
+CACHE_VERSION: int = 1 # bump when the layout or the parser changes, old entries are rebuilt
+
+
+class CrudeCache():
+    """
+    One directory per crude file in cache_dir: {basename}-{key}/
+        {column}.bin   raw column of crude_reader.CrudeBatch.DTYPES (native byte order), src/dst index into hosts.json
+        hosts.json     host table of the file
+        meta.json      source path, mtime, size, records, lines, bad_lines
+    The key is a hash of (absolute path, mtime, size, CACHE_VERSION), so a changed file gets a new entry.
+    Entries are written to a temporary directory and renamed when complete.
+
+    cache = CrudeCache()
+    for batch in cache.reader(filename).batches(): # parses on the first call, memory maps afterwards
+        analyzer.add_batch(batch)
+    """
+
+    def __init__(self, cache_dir=None, *args, **kwargs):
+        self.cache_dir: str = str(cache_dir or constants.CRUDE_CACHE_DIR)
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] cache_dir={self.cache_dir}"
+
+    def key(self, filename) -> str:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        return hashlib.sha1(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\0{CACHE_VERSION}".encode('utf-8')).hexdigest()[:16]
+
+    def path(self, filename) -> str:
+        return os.path.join(self.cache_dir, f"{os.path.basename(filename)}-{self.key(filename)}")
+
+    def exists(self, filename) -> bool:
+        return os.path.exists(os.path.join(self.path(filename), 'meta.json'))
+
+    def build(self, filename, batch_size=64*crude_reader.KB) -> str:
+        """Parse the crude file into a cache entry (if it doesn't exist), returns the entry directory"""
+        path = self.path(filename)
+        if self.exists(filename):
+            return path
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        try:
+            stat = os.stat(filename)
+            reader = crude_reader.CrudeReader(filename=filename, batch_size=batch_size, hosts=emil_types.HostTable()) # file local host indexes
+            files = {column: open(os.path.join(tmp_path, f"{column}.bin"), 'wb') for column in crude_reader.CrudeBatch.COLUMNS}
+            records: int = 0
+            try:
+                for batch in reader.batches():
+                    for column, file in files.items():
+                        np.ascontiguousarray(getattr(batch, column), dtype=crude_reader.CrudeBatch.DTYPES[column]).tofile(file)
+                    records += len(batch)
+            finally:
+                for file in files.values():
+                    file.close()
+            with open(os.path.join(tmp_path, 'hosts.json'), 'w') as file:
+                json.dump(reader.hosts.hosts, file)
+            meta = {
+                'version': CACHE_VERSION,
+                'source': os.path.abspath(filename),
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'records': records,
+                'lines': reader.line_counter,
+                'bad_lines': reader.bad_lines,
+            }
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as file: # written last, marks the entry as complete
+                json.dump(meta, file)
+            try:
+                os.replace(tmp_path, path)
+            except OSError: # built by another process meanwhile
+                if not self.exists(filename):
+                    raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return path
+
+    def reader(self, filename, batch_size=64*crude_reader.KB, hosts=None, filter=None) -> 'CachedCrudeReader':
+        """Reader of the cache entry, builds it first if needed"""
+        return CachedCrudeReader(self.build(filename), batch_size=batch_size, hosts=hosts, filter=filter)
+
+
+class CachedCrudeReader():
+    """
+    Same interface as crude_reader.CrudeReader (batches(), records(), hosts, line_counter, bad_lines) on a cache entry.
+    Columns are memory mapped, batches are views into the maps (no copy), except src/dst when the
+    host indexes of the entry differ from the given host table.
+    A crude_reader.CrudeFilter is applied to the columns, batches then only hold the matching records.
+    """
+
+    def __init__(self, path, batch_size=64*crude_reader.KB, hosts=None, filter=None, *args, **kwargs):
+        self.path: str = str(path)
+        self.batch_size: int = int(batch_size)
+        self.filter: crude_reader.CrudeFilter = filter if filter is not None else crude_reader.CrudeFilter()
+        self.hosts: emil_types.HostTable = hosts if hosts is not None else emil_types.HOSTS
+        with open(os.path.join(self.path, 'meta.json')) as file:
+            self.meta: dict = json.load(file)
+        with open(os.path.join(self.path, 'hosts.json')) as file:
+            file_hosts: list[str] = json.load(file)
+        self.filename: str = self.meta['source']
+        self.line_counter: int = self.meta['lines']
+        self.bad_lines: int = self.meta['bad_lines']
+        self.records_total: int = self.meta['records']
+        host_indexes = np.array([self.hosts.intern(host) for host in file_hosts], dtype=np.int32)
+        self.host_map: np.ndarray = None if np.array_equal(host_indexes, np.arange(len(file_hosts))) else host_indexes # file index -> table index
+        self.columns: dict[str, np.ndarray] = {
+            column: self._map(column, dtype) for column, dtype in crude_reader.CrudeBatch.DTYPES.items()
+        }
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] filename={self.filename}, records={self.records_total}, lines={self.line_counter}, bad_lines={self.bad_lines}, hosts={len(self.hosts)}"
+
+    def __iter__(self) -> Iterator[crude_reader.CrudeBatch]:
+        return self.batches()
+
+    def _map(self, column, dtype) -> np.ndarray:
+        if self.records_total == 0: # can't map an empty file
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f"{column}.bin"), dtype=dtype, mode='r', shape=(self.records_total,))
+
+    def batch(self, start: int, stop: int) -> crude_reader.CrudeBatch:
+        columns = {column: values[start:stop] for column, values in self.columns.items()}
+        if self.host_map is not None:
+            columns['src'] = self.host_map[columns['src']]
+            columns['dst'] = self.host_map[columns['dst']]
+        return crude_reader.CrudeBatch(hosts=self.hosts, **columns)
+
+    def batches(self) -> Iterator[crude_reader.CrudeBatch]:
+        for start in range(0, self.records_total, self.batch_size):
+            batch = self.filter.apply(self.batch(start, min(start + self.batch_size, self.records_total)))
+            if len(batch):
+                yield batch
+
+    def records(self) -> Iterator[emil_types.CrudeRecord]:
+        for batch in self.batches():
+            yield from batch.records()
+
+
+if __name__ == "__main__":
+    cache = CrudeCache()
+    for filename in sys.argv[1:]:
+        start = time.perf_counter()
+        path = cache.build(filename)
+        print(f"[CrudeCache] {filename} -> {path} ({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,206 @@
+# Block index for crude files: random access on send time (tx) and parallel decompression.
+# usage: python crude_index.py [--no-sidecar] <crude file> [...]   (builds the indexes)
+#
+# A single member gzip stream can only be decompressed from the start (python's zlib can't resume a deflate stream
+# at an arbitrary bit offset from a saved checkpoint, there is no inflatePrime / Z_BLOCK, so zran style restart points
+# can't be stored). So by default the index build decompresses the file once and re-blocks it into a sidecar of
+# independent gzip members of ~block_size uncompressed bytes, cut at line ends.
+# Each member with records is listed in the index with its offset, length and tx range, so a reader can:
+#   - skip to the blocks of a time window (--from/--to) without decompressing anything before them
+#   - decompress several blocks at the same time in threads (zlib releases the GIL)
+# The sidecar is a second compressed copy of the file (about the size of the original), gzip -dc blocks.gz gives the
+# original file. Without it (sidecar=False, --no-sidecar) only the index is written, block offsets are then positions in
+# the decompressed file: plain files are still read from the blocks of the window, gzip files are decompressed from the
+# start up to the last block of the window, but only the blocks of the window are parsed.
+# imports
+import os
+import sys
+import json
+import gzip
+import time
+import zlib
+import bisect
+import contextlib
+import collections
+import concurrent.futures
+import datetime as dt_module
+from typing import Iterator, Union
+
+import numpy as np
+
+import emil_types
+import crude_reader
+import crude_cache
+# End: imports -----------------------------------------------------------------
+INDEX_VERSION: int = 2
+
+
+class CrudeIndex():
+    """
+    Index of a crude file: sidecar {cache_dir}/{basename}-{key}.blocks.gz (optional) and {...}.index.json
+    blocks: [{'offset', 'length', 'size', 'lines', 'min_tx', 'max_tx'}, ...] in file order, offset and length in the
+    sidecar, or in the decompressed source without one (blocks_path None).
+    Keyed like crude_cache.CrudeCache (path, mtime, size), a changed file gets a new index.
+
+    index = CrudeIndex.build(filename)
+    reader = IndexedCrudeReader(index, tx_from=..., tx_to=..., threads=4)
+    """
+
+    def __init__(self, blocks_path, blocks, source, *args, **kwargs):
+        self.blocks_path: str = blocks_path # None without a sidecar
+        self.blocks: list[dict] = blocks
+        self.source: str = source
+        self._max_tx_prefix: list[float] = list(np.maximum.accumulate([block['max_tx'] for block in blocks])) if blocks else []
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] source={self.source}, sidecar={self.blocks_path is not None}, blocks={len(self.blocks)}, lines={sum(block['lines'] for block in self.blocks)}"
+
+    @staticmethod
+    def paths(filename, cache_dir=None) -> tuple[str, str]:
+        base = crude_cache.CrudeCache(cache_dir).path(filename)
+        return f"{base}.blocks.gz", f"{base}.index.json"
+
+    @classmethod
+    def load(cls, filename, cache_dir=None, sidecar=False) -> Union['CrudeIndex', None]:
+        """The existing index, None if there is none (or it has no sidecar and one is wanted)"""
+        blocks_path, index_path = cls.paths(filename, cache_dir)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path) as file:
+            meta = json.load(file)
+        if meta.get('version') != INDEX_VERSION or (sidecar and not meta['sidecar']):
+            return None
+        return cls(blocks_path=blocks_path if meta['sidecar'] else None, blocks=meta['blocks'], source=meta['source'])
+
+    @classmethod
+    def build(cls, filename, cache_dir=None, block_size=4*crude_reader.MB, compresslevel=6, sidecar=True) -> 'CrudeIndex':
+        """Returns the existing index, or decompresses the file once and writes the index (and the sidecar)"""
+        index = cls.load(filename, cache_dir, sidecar=sidecar)
+        if index is not None:
+            return index
+        blocks_path, index_path = cls.paths(filename, cache_dir)
+        os.makedirs(os.path.dirname(blocks_path), exist_ok=True)
+        tmp_suffix = f".tmp-{os.getpid()}"
+        reader = crude_reader.CrudeReader(filename=filename, block_size=block_size, hosts=emil_types.HostTable())
+        blocks: list[dict] = []
+        offset: int = 0
+        try:
+            with (open(blocks_path + tmp_suffix, 'wb') if sidecar else contextlib.nullcontext()) as file:
+                for data in reader.blocks():
+                    batch = reader.parse_block(data)
+                    length: int = len(data)
+                    if sidecar: # every block, also the ones without records, gzip -dc gives the original file
+                        member = gzip.compress(data, compresslevel=compresslevel)
+                        file.write(member)
+                        length = len(member)
+                    if len(batch):
+                        blocks.append({
+                            'offset': offset,
+                            'length': length,
+                            'size': len(data),
+                            'lines': len(batch),
+                            'min_tx': float(batch.tx.min()),
+                            'max_tx': float(batch.tx.max()),
+                        })
+                    offset += length
+            with open(index_path + tmp_suffix, 'w') as file:
+                json.dump({'version': INDEX_VERSION, 'source': os.path.abspath(filename), 'sidecar': sidecar, 'block_size': block_size, 'blocks': blocks}, file)
+            if sidecar:
+                os.replace(blocks_path + tmp_suffix, blocks_path)
+            elif os.path.exists(blocks_path): # of an older index
+                os.remove(blocks_path)
+            os.replace(index_path + tmp_suffix, index_path) # index last, it marks the sidecar as complete
+        finally:
+            for path in (blocks_path + tmp_suffix, index_path + tmp_suffix):
+                if os.path.exists(path):
+                    os.remove(path)
+        return cls(blocks_path=blocks_path if sidecar else None, blocks=blocks, source=os.path.abspath(filename))
+
+    def select(self, tx_from=None, tx_to=None) -> list[dict]:
+        """Blocks that can contain records with tx_from <= tx < tx_to"""
+        first: int = 0
+        if tx_from is not None: # first block that reaches tx_from, tx is only roughly sorted in the file
+            first = bisect.bisect_left(self._max_tx_prefix, tx_from)
+        return [
+            block for block in self.blocks[first:]
+            if (tx_from is None or block['max_tx'] >= tx_from) and (tx_to is None or block['min_tx'] < tx_to)
+        ]
+
+
+class IndexedCrudeReader(crude_reader.CrudeReader):
+    """
+    CrudeReader on the blocks of a CrudeIndex: only the blocks of [tx_from, tx_to), decompressed by #threads threads
+    (at most 2*threads blocks in flight). The window is added to the reader's CrudeFilter, records outside it are dropped.
+    Without a sidecar the blocks are read from the source in one thread (gzip: decompressed up to the last block).
+    """
+
+    def __init__(self, index: CrudeIndex, tx_from=None, tx_to=None, threads=4, *args, **kwargs):
+        super().__init__(index.source, *args, **kwargs)
+        self.index: CrudeIndex = index
+        self.threads: int = int(threads)
+        if tx_from is not None or tx_to is not None: # the window is a filter condition, the index picks the blocks for it
+            self.filter = self.filter.replace(
+                tx_from=tx_from if tx_from is not None else self.filter.tx_from,
+                tx_to=tx_to if tx_to is not None else self.filter.tx_to,
+            )
+
+    def __str__(self) -> str:
+        return f"{super().__str__()}, tx_from={self.filter.tx_from}, tx_to={self.filter.tx_to}, threads={self.threads}"
+
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        return zlib.decompress(data, wbits=31) # one gzip member
+
+    def blocks(self) -> Iterator[bytes]:
+        selected = self.index.select(self.filter.tx_from, self.filter.tx_to)
+        if self.index.blocks_path is None:
+            yield from self._source_blocks(selected)
+            return
+        with open(self.index.blocks_path, 'rb') as file, concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as pool:
+            pending: collections.deque = collections.deque()
+            for block in selected:
+                file.seek(block['offset'])
+                pending.append(pool.submit(self._decompress, file.read(block['length'])))
+                if len(pending) >= 2 * self.threads:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _source_blocks(self, selected: list[dict]) -> Iterator[bytes]:
+        """Blocks at their offsets in the decompressed source, a forward seek in a gzip file decompresses and drops the bytes"""
+        with self._open() as file:
+            for block in selected:
+                file.seek(block['offset'])
+                data: bytes = file.read(block['length'])
+                yield data if data.endswith(b'\n') else data + b'\n' # last line without trailing newline
+
+
+def parse_time(value: str) -> float:
+    """'1613445013.5', '2021-02-16T03:10' or '2021-02-16 03:10:13' (utc unless an offset is given) -> timestamp"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    datetime = dt_module.datetime.fromisoformat(value)
+    if datetime.tzinfo is None:
+        datetime = datetime.replace(tzinfo=dt_module.timezone.utc)
+    return datetime.timestamp()
+
+
+def open_reader(filename, tx_from=None, tx_to=None, threads=4, cache_dir=None, sidecar=True, **kwargs) -> crude_reader.CrudeReader:
+    """
+    Reader for a time window of a crude file, builds the index (with or without the sidecar) on first use. Without a
+    window: a plain CrudeReader.
+    kwargs go to the reader, eg. filter=crude_reader.CrudeFilter(ids={1})
+    """
+    if tx_from is None and tx_to is None:
+        return crude_reader.CrudeReader(filename=filename, **kwargs)
+    return IndexedCrudeReader(CrudeIndex.build(filename, cache_dir=cache_dir, sidecar=sidecar), tx_from=tx_from, tx_to=tx_to, threads=threads, **kwargs)
+
+
+if __name__ == "__main__":
+    sidecar: bool = '--no-sidecar' not in sys.argv[1:]
+    for filename in [arg for arg in sys.argv[1:] if arg != '--no-sidecar']:
+        start = time.perf_counter()
+        index = CrudeIndex.build(filename, sidecar=sidecar)
+        print(f"{index} -> {index.blocks_path} ({time.perf_counter() - start:.1f}s)")
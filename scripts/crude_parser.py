@@ -1,6 +1,13 @@
+# usage: python crude_parser.py [crude file] [--from 2021-02-16T10:00] [--to 2021-02-16T11:00] [--threads 4] [--no-sidecar] [--stream 1 2] [--src ip ...] [--dst ip ...]
+# --from/--to (tx, utc or epoch) read only that window through the block index (crude_index.py, built on first use,
+# --no-sidecar: without the recompressed copy of the file)
+# --stream/--src/--dst drop other lines before they are parsed (crude_reader.CrudeFilter)
 # imports
-import gzip
-import emil_types
+import argparse
+
+import constants
+import crude_index
+import crude_reader
 import utils
 # End: imports -----------------------------------------------------------------
 MILL = 1000000
@@ -9,37 +16,37 @@ crude_tekno = 'C:/Users/twide/my_projects/git/ml-microdep/secret/dynga_data_temp
 crude_ngu = 'C:/Users/twide/my_projects/git/ml-microdep/secret/dynga_data_temp/uninett/ngu-mp.ngu.no/2021-02-16/crude-00_00_01.gz'
 crude_custom = 'C:/Users/twide/my_projects/git/ml-microdep/scripts/crude_custom.txt'
 
-crude_analyzer = utils.CrudeAnalyzer(window_size=100, h_limit=5, t_limit=5, start_gap_threshold=6, end_gap_threshold=5)
-
-with gzip.open(filename=crude_ngu, mode='rt') as file:
-# with open(file=crude_custom, mode='r') as file:
-    # [file.readline() for i in range(4)] # discard headerlines
-
-    for i, line in enumerate(file, 1):
-        line = line.strip()
-        if i % (1*MILL) == 0:
-            print(f"{i}: {line}")
-
-        if i > 40*MILL:
-            break
-
-        key_values = line.split() # list of key-value pairs # ['ID=1', 'RX=15434', ...]
-
-        try:
-            record = emil_types.CrudeRecord(
-                id = key_values[0].split('=')[1], # ID=1
-                seq = key_values[1].split('=')[1],
-                src = key_values[2].split('=')[1].split(':')[0], # SRC=ip:port
-                dst = key_values[3].split('=')[1].split(':')[0], # DST=ip:port
-                tx = key_values[4].split('=')[1],
-                rx = key_values[5].split('=')[1],
-                size = key_values[6].split('=')[1],
-                hoplimit = key_values[7].split('=')[1],
-            )
-            crude_analyzer.add_record(record)
-        except Exception as e:
-            print(f"{i}: {line}, [{e}]")
-
+parser = argparse.ArgumentParser(description="Gap detection on one crude file")
+parser.add_argument('filename', nargs='?', default=crude_ngu)
+parser.add_argument('--from', dest='tx_from', type=crude_index.parse_time, help="first send time, eg. 2021-02-16T10:00 (utc) or epoch")
+parser.add_argument('--to', dest='tx_to', type=crude_index.parse_time, help="end send time (exclusive)")
+parser.add_argument('--no-sidecar', dest='sidecar', action='store_false', help="index without the recompressed copy of the file")
+parser.add_argument('--threads', type=int, default=4, help="decompression threads with --from/--to")
+parser.add_argument('--stream', type=int, nargs='+', help="only these stream ids")
+parser.add_argument('--src', nargs='+', help="only these source ips")
+parser.add_argument('--dst', nargs='+', help="only these destination ips")
+args = parser.parse_args()
+
+crude_analyzer = utils.CrudeAnalyzer(**constants.CRUDE_ANALYZER_SETTINGS)
+
+# bulk parsing, header and broken lines are counted in reader.bad_lines
+crude_filter = crude_reader.CrudeFilter(ids=args.stream, src=args.src, dst=args.dst)
+reader = crude_index.open_reader(filename=args.filename, tx_from=args.tx_from, tx_to=args.tx_to, threads=args.threads, sidecar=args.sidecar, filter=crude_filter)
+# reader = crude_reader.CrudeReader(filename=crude_custom)
+
+n: int = 0 # records added
+for batch in reader.batches():
+    if n + len(batch) > 40*MILL:
+        batch = batch[:40*MILL - n]
+    if (n + len(batch)) // MILL > n // MILL:
+        print(f"{n + len(batch)} records")
+    n += len(batch)
+
+    crude_analyzer.add_batch(batch)
+    if n >= 40*MILL:
+        break
+
+print(reader)
 
 # print(crude_analyzer.__str__(show_records=5))
 crude_analyzer.cleanup()
@@ -0,0 +1,419 @@
+import io
+import gzip
+from typing import Iterator
+
+import numpy as np
+
+import emil_types
+
+
+KB: int = 1024
+MB: int = 1024 * KB
+
+NEWLINE: int = ord('\n')
+SPACE: int = ord(' ')
+EQUALS: int = ord('=')
+DOT: int = ord('.')
+LINE_START: int = ord('I') # every record line starts with 'ID='
+
+FIELDS_PER_LINE: int = 8 # ID SEQ SRC DST Tx Rx SIZE HOPLIMIT
+EQUALS_TRANSLATION: bytes = bytes.maketrans(b'=', b' ') # 'ID=1 SEQ=2' -> 'ID 1 SEQ 2'
+
+# dtype used by np.loadtxt after '=' has been translated to ' '. src/dst are still 'ip:port'.
+LINE_DTYPE: np.dtype = np.dtype([
+    ('id', np.int32),
+    ('seq', np.int64),
+    ('src', 'S48'), # longest ipv6 + port fits
+    ('dst', 'S48'),
+    ('tx', np.float64),
+    ('rx', np.float64),
+    ('size', np.int32),
+    ('hoplimit', np.int16),
+])
+LINE_USECOLS: tuple = (1, 3, 5, 7, 9, 11, 13, 15) # value columns, key columns are skipped
+FIELD_KEYS: tuple = (b'ID=', b'SEQ=', b'SRC=', b'DST=', b'Tx=', b'Rx=', b'SIZE=', b'HOPLIMIT=')
+DIGIT_0: int = ord('0')
+DIGIT_9: int = ord('9')
+
+
+class CrudeBatch():
+    """
+    Columnar batch of crude records (struct-of-arrays).
+    src and dst are indexes into 'hosts' (interned ip strings), all other columns are the parsed values.
+    """
+
+    COLUMNS: tuple = ('id', 'seq', 'src', 'dst', 'tx', 'rx', 'size', 'hoplimit')
+    DTYPES: dict = {
+        'id': np.int32,
+        'seq': np.int64,
+        'src': np.int32,
+        'dst': np.int32,
+        'tx': np.float64,
+        'rx': np.float64,
+        'size': np.int32,
+        'hoplimit': np.int16,
+    }
+
+    def __init__(self, id, seq, src, dst, tx, rx, size, hoplimit, hosts, *args, **kwargs):
+        self.id: np.ndarray = id
+        self.seq: np.ndarray = seq
+        self.src: np.ndarray = src
+        self.dst: np.ndarray = dst
+        self.tx: np.ndarray = tx
+        self.rx: np.ndarray = rx
+        self.size: np.ndarray = size
+        self.hoplimit: np.ndarray = hoplimit
+        self.hosts: emil_types.HostTable = hosts # shared with the reader, only grows
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] records={len(self)}, streams={len(np.unique(self.id))}, hosts={len(self.hosts)}"
+
+    def __len__(self) -> int:
+        return len(self.seq)
+
+    def __getitem__(self, key) -> 'CrudeBatch':
+        """Slice or mask every column. Slices are views, masks are copies"""
+        return CrudeBatch(hosts=self.hosts, **{column: getattr(self, column)[key] for column in self.COLUMNS})
+
+    @classmethod
+    def empty(cls, hosts: emil_types.HostTable) -> 'CrudeBatch':
+        return cls(hosts=hosts, **{column: np.empty(0, dtype=dtype) for column, dtype in cls.DTYPES.items()})
+
+    @classmethod
+    def concatenate(cls, batches: list['CrudeBatch']) -> 'CrudeBatch':
+        """All batches must share the same hosts"""
+        return cls(hosts=batches[0].hosts, **{column: np.concatenate([getattr(batch, column) for batch in batches]) for column in cls.COLUMNS})
+
+    def columns(self) -> dict[str, np.ndarray]:
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    def store(self) -> emil_types.CrudeRecordStore:
+        """Copy into a compact CrudeRecordStore, records are then available as views"""
+        return emil_types.CrudeRecordStore.from_columns(hosts=self.hosts, **self.columns())
+
+    def records(self) -> Iterator[emil_types.CrudeRecord]:
+        """Per-record objects for code that still wants them. Avoid on hot paths"""
+        hosts = self.hosts
+        for id, seq, src, dst, tx, rx, size, hoplimit in zip(*(getattr(self, column).tolist() for column in self.COLUMNS)):
+            yield emil_types.CrudeRecord(id=id, seq=seq, src=hosts[src], dst=hosts[dst], tx=tx, rx=rx, size=size, hoplimit=hoplimit)
+
+
+class CrudeFilter():
+    """
+    Predicates for CrudeReader: stream ids, src ips, dst ips (sets, any of) and a tx window [tx_from, tx_to).
+    None means no condition. keep_lines() runs on the raw bytes of a block, before anything is converted or interned:
+    prefix compares of the ID/SRC/DST values and the integer seconds of Tx. It only drops lines that can't match,
+    mask() on the parsed batch is exact.
+
+    reader = CrudeReader(filename, filter=CrudeFilter(ids={3}, tx_from=1613445013, tx_to=1613448613))
+    """
+
+    def __init__(self, ids=None, src=None, dst=None, tx_from=None, tx_to=None, *args, **kwargs):
+        self.ids: set[int] = {int(id) for id in ids} if ids is not None else None
+        self.src: set[str] = set(src) if src is not None else None
+        self.dst: set[str] = set(dst) if dst is not None else None
+        self.tx_from: float = float(tx_from) if tx_from is not None else None
+        self.tx_to: float = float(tx_to) if tx_to is not None else None
+        self._id_patterns: list[bytes] = [b'%d ' % id for id in sorted(self.ids)] if self.ids is not None else None # value and the space after it
+        self._src_patterns: list[bytes] = self._host_patterns(self.src)
+        self._dst_patterns: list[bytes] = self._host_patterns(self.dst)
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] ids={self.ids}, src={self.src}, dst={self.dst}, tx_from={self.tx_from}, tx_to={self.tx_to}"
+
+    def __bool__(self) -> bool:
+        """False when there is no condition at all"""
+        return any(value is not None for value in (self.ids, self.src, self.dst, self.tx_from, self.tx_to))
+
+    def replace(self, **changes) -> 'CrudeFilter':
+        """Copy with some conditions changed"""
+        conditions = {'ids': self.ids, 'src': self.src, 'dst': self.dst, 'tx_from': self.tx_from, 'tx_to': self.tx_to}
+        conditions.update(changes)
+        return CrudeFilter(**conditions)
+
+    @staticmethod
+    def _host_patterns(hosts) -> list[bytes]:
+        """'10.0.0.1' -> [b'10.0.0.1:'], ipv6 also in brackets: '::1' -> [b'::1:', b'[::1]:']"""
+        if hosts is None:
+            return None
+        patterns: list[bytes] = []
+        for host in sorted(hosts):
+            patterns.append(host.encode('ascii') + b':')
+            if ':' in host:
+                patterns.append(b'[' + host.encode('ascii') + b']:')
+        return patterns
+
+    @staticmethod
+    def _prefix_mask(buf: np.ndarray, positions: np.ndarray, limits: np.ndarray, patterns: list[bytes]) -> np.ndarray:
+        """Lines where buf[position:limit] starts with one of the patterns. Compares byte by byte on the lines still matching"""
+        mask = np.zeros(len(positions), dtype=bool)
+        for pattern in patterns:
+            candidates = np.flatnonzero(limits - positions >= len(pattern)) # also keeps positions + k inside the line
+            for k, byte in enumerate(pattern):
+                candidates = candidates[buf[positions[candidates] + k] == byte]
+                if len(candidates) == 0:
+                    break
+            mask[candidates] = True
+        return mask
+
+    @staticmethod
+    def _seconds(buf: np.ndarray, positions: np.ndarray, limits: np.ndarray) -> np.ndarray:
+        """Integer part of the decimals at buf[position:limit], -1 where the value isn't plain digits (eg. '-1.5', '1e9')"""
+        seconds = np.zeros(len(positions), dtype=np.int64)
+        valid = limits > positions
+        active = valid.copy() # still in the integer part
+        k: int = 0
+        while active.any():
+            inside = active & (positions + k < limits)
+            byte = buf[np.where(inside, positions + k, 0)]
+            digit = inside & (byte >= DIGIT_0) & (byte <= DIGIT_9)
+            seconds = np.where(digit, seconds * 10 + (byte.astype(np.int64) - DIGIT_0), seconds)
+            valid &= ~inside | digit | (byte == DOT)
+            active = digit
+            k += 1
+        return np.where(valid, seconds, -1)
+
+    def keep_lines(self, buf: np.ndarray, starts: np.ndarray, spaces: np.ndarray) -> np.ndarray:
+        """
+        buf: block of well formed crude lines, starts: first byte of each line, spaces: (lines, 7) positions of the spaces.
+        Returns the lines that may match, each condition only looks at the lines the previous ones kept.
+        """
+        rows = np.arange(len(starts))
+        def value(field: int, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            """First byte and end (the space after it) of the value of a field"""
+            start = starts[rows] if field == 0 else spaces[rows, field-1] + 1
+            return start + len(FIELD_KEYS[field]), spaces[rows, field]
+        if self._id_patterns is not None:
+            positions, limits = value(0, rows)
+            rows = rows[self._prefix_mask(buf, positions, limits + 1, self._id_patterns)] # the space ends the id
+        if self._src_patterns is not None:
+            positions, limits = value(2, rows)
+            rows = rows[self._prefix_mask(buf, positions, limits, self._src_patterns)]
+        if self._dst_patterns is not None:
+            positions, limits = value(3, rows)
+            rows = rows[self._prefix_mask(buf, positions, limits, self._dst_patterns)]
+        if self.tx_from is not None or self.tx_to is not None:
+            seconds = self._seconds(buf, *value(4, rows))
+            keep = seconds < 0 # can't tell, parse it
+            if self.tx_from is not None and self.tx_to is not None:
+                keep |= (seconds > self.tx_from - 1) & (seconds < self.tx_to)
+            elif self.tx_from is not None:
+                keep |= seconds > self.tx_from - 1
+            else:
+                keep |= seconds < self.tx_to
+            rows = rows[keep]
+        keep = np.zeros(len(starts), dtype=bool)
+        keep[rows] = True
+        return keep
+
+    def mask(self, batch: CrudeBatch) -> np.ndarray:
+        """Exact conditions on a parsed batch"""
+        mask = np.ones(len(batch), dtype=bool)
+        if self.ids is not None:
+            mask &= np.isin(batch.id, np.fromiter(self.ids, dtype=np.int64))
+        if self.src is not None:
+            mask &= np.isin(batch.src, self._host_indexes(self.src, batch.hosts))
+        if self.dst is not None:
+            mask &= np.isin(batch.dst, self._host_indexes(self.dst, batch.hosts))
+        if self.tx_from is not None:
+            mask &= batch.tx >= self.tx_from
+        if self.tx_to is not None:
+            mask &= batch.tx < self.tx_to
+        return mask
+
+    def apply(self, batch: CrudeBatch) -> CrudeBatch:
+        if not self or len(batch) == 0:
+            return batch
+        mask = self.mask(batch)
+        return batch if mask.all() else batch[mask]
+
+    @staticmethod
+    def _host_indexes(hosts: set[str], table: emil_types.HostTable) -> np.ndarray:
+        indexes = [table.get(host) for host in hosts]
+        return np.array([index for index in indexes if index is not None], dtype=np.int32)
+
+
+class CrudeReader():
+    """
+    Bulk reader for crude files (gzip or plain text).
+    Reads the file in large blocks and parses each block with numpy, yielding fixed size CrudeBatch'es.
+    Lines that don't look like crude records (eg. header lines) are skipped and counted in 'bad_lines'.
+    With a CrudeFilter, lines that can't match are dropped before parsing and counted in 'skipped_lines'
+    (bad values in dropped lines are never seen, so they don't count in 'bad_lines').
+
+    reader = CrudeReader(filename=crude_ngu, batch_size=65536)
+    for batch in reader:
+        batch.seq, batch.tx, ...
+    """
+
+    def __init__(self, filename, batch_size=64*KB, block_size=16*MB, hosts=None, filter=None, *args, **kwargs):
+        self.filename: str = str(filename)
+        self.batch_size: int = int(batch_size)
+        self.block_size: int = int(block_size)
+        self.filter: CrudeFilter = filter if filter is not None else CrudeFilter()
+        self.line_counter: int = 0
+        self.bad_lines: int = 0
+        self.skipped_lines: int = 0 # well formed lines dropped by the filter
+        self.hosts: emil_types.HostTable = hosts if hosts is not None else emil_types.HOSTS # src/dst columns are indexes into this table
+        self._host_index: dict[bytes, int] = {} # b'ip:port' -> index in hosts
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] filename={self.filename}, lines={self.line_counter}, bad_lines={self.bad_lines}, skipped_lines={self.skipped_lines}, hosts={len(self.hosts)}"
+
+    def __iter__(self) -> Iterator[CrudeBatch]:
+        return self.batches()
+
+    def _open(self):
+        if self.filename.endswith('.gz'):
+            return gzip.open(filename=self.filename, mode='rb')
+        return open(file=self.filename, mode='rb')
+
+    def blocks(self) -> Iterator[bytes]:
+        """Yields ~block_size chunks of the file, always cut after a newline"""
+        remainder: bytes = b''
+        with self._open() as file:
+            while True:
+                chunk: bytes = file.read(self.block_size)
+                if not chunk:
+                    break
+                cut: int = chunk.rfind(b'\n') + 1
+                if cut == 0: # no newline in chunk, keep reading
+                    remainder += chunk
+                    continue
+                yield remainder + chunk[:cut]
+                remainder = chunk[cut:]
+        if remainder:
+            yield remainder + b'\n' # last line without trailing newline
+
+    def batches(self) -> Iterator[CrudeBatch]:
+        """Yields batches of exactly batch_size records, except the last one"""
+        pending: list[CrudeBatch] = []
+        pending_n: int = 0
+        for block in self.blocks():
+            parsed = self.parse_block(block)
+            if len(parsed) == 0:
+                continue
+            pending.append(parsed)
+            pending_n += len(parsed)
+            if pending_n < self.batch_size:
+                continue
+            merged = CrudeBatch.concatenate(pending) if len(pending) > 1 else pending[0]
+            full: int = (pending_n // self.batch_size) * self.batch_size
+            for start in range(0, full, self.batch_size):
+                yield merged[start:start+self.batch_size]
+            pending = [merged[full:]] if full < pending_n else []
+            pending_n -= full
+        if pending_n > 0:
+            yield CrudeBatch.concatenate(pending) if len(pending) > 1 else pending[0]
+
+    def records(self) -> Iterator[emil_types.CrudeRecord]:
+        for batch in self.batches():
+            yield from batch.records()
+
+    def parse_block(self, data: bytes) -> CrudeBatch:
+        """Parse a block of complete lines (must end with a newline)"""
+        buf = np.frombuffer(data, dtype=np.uint8)
+        ends = np.flatnonzero(buf == NEWLINE)
+        if len(ends) == 0:
+            return CrudeBatch.empty(hosts=self.hosts)
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        self.line_counter += len(ends)
+
+        # cheap structural check: 'ID=.. SEQ=.. SRC=.. DST=.. Tx=.. Rx=.. SIZE=.. HOPLIMIT=..'
+        # whole block first, per line counts only when the block contains bad lines
+        is_space = buf == SPACE
+        is_equals = buf == EQUALS
+        ok_start = buf[starts] == LINE_START
+        ok: np.ndarray = None # lines to parse, None: all of them
+        if np.count_nonzero(is_space) != len(ends) * (FIELDS_PER_LINE-1) or np.count_nonzero(is_equals) != len(ends) * FIELDS_PER_LINE or not ok_start.all():
+            spaces = np.add.reduceat(is_space, starts, dtype=np.int32)
+            equals = np.add.reduceat(is_equals, starts, dtype=np.int32)
+            ok = (spaces == FIELDS_PER_LINE-1) & (equals == FIELDS_PER_LINE) & ok_start
+            self.bad_lines += int(len(ok) - np.count_nonzero(ok))
+
+        if self.filter: # drop lines on their raw bytes, before np.loadtxt and interning
+            space_positions = np.flatnonzero(is_space)
+            rows = np.arange(len(ends)) if ok is None else np.flatnonzero(ok)
+            if ok is not None: # only the spaces of well formed lines, 7 per line
+                space_positions = space_positions[ok[np.searchsorted(starts, space_positions, side='right') - 1]]
+            keep = self.filter.keep_lines(buf, starts[rows], space_positions.reshape(len(rows), FIELDS_PER_LINE-1))
+            self.skipped_lines += int(len(keep) - np.count_nonzero(keep))
+            ok = np.zeros(len(ends), dtype=bool)
+            ok[rows[keep]] = True
+
+        if ok is not None and not ok.all():
+            data = buf[np.repeat(ok, ends - starts + 1)].tobytes()
+            if not data:
+                return CrudeBatch.empty(hosts=self.hosts)
+
+        data = data.translate(EQUALS_TRANSLATION)
+        try:
+            lines = np.loadtxt(io.BytesIO(data), dtype=LINE_DTYPE, delimiter=' ', usecols=LINE_USECOLS, ndmin=1)
+        except ValueError: # a value that isn't a number, find the bad lines one by one
+            lines = self._parse_lines(data.splitlines())
+
+        batch = CrudeBatch(
+            id=lines['id'],
+            seq=lines['seq'],
+            src=self._intern_column(lines['src']),
+            dst=self._intern_column(lines['dst']),
+            tx=lines['tx'],
+            rx=lines['rx'],
+            size=lines['size'],
+            hoplimit=lines['hoplimit'],
+            hosts=self.hosts,
+        )
+        if not self.filter:
+            return batch
+        filtered = self.filter.apply(batch) # exact conditions on what the byte checks let through
+        self.skipped_lines += len(batch) - len(filtered)
+        return filtered
+
+    def _parse_lines(self, lines: list[bytes]) -> np.ndarray:
+        """Slow path, only used for blocks where np.loadtxt fails"""
+        rows: list[tuple] = []
+        for line in lines:
+            values = line.split()[1::2]
+            try:
+                rows.append((int(values[0]), int(values[1]), values[2], values[3], float(values[4]), float(values[5]), int(values[6]), int(values[7])))
+            except (ValueError, IndexError):
+                self.bad_lines += 1
+        return np.array(rows, dtype=LINE_DTYPE)
+
+    def _intern(self, value: bytes) -> int:
+        """b'ip:port' -> index in hosts"""
+        index = self._host_index.get(value)
+        if index is None:
+            ip: str = value.rsplit(b':', 1)[0].decode('ascii').strip('[]') # SRC=ip:port or SRC=[ipv6]:port
+            index = self._host_index[value] = self.hosts.intern(ip)
+        return index
+
+    def _intern_column(self, column: np.ndarray) -> np.ndarray:
+        """Map a column of b'ip:port' to host indexes without touching every row in python"""
+        if len(column) == 0:
+            return np.empty(0, dtype=np.int32)
+        changes = np.flatnonzero(column[1:] != column[:-1]) + 1 # rows where the value differs from the previous row
+        if len(changes) < len(column) // 8: # long runs of the same value (single stream or few streams)
+            run_starts = np.concatenate(([0], changes))
+            run_indexes = np.array([self._intern(value) for value in column[run_starts].tolist()], dtype=np.int32)
+            return np.repeat(run_indexes, np.diff(np.append(run_starts, len(column))))
+        # interleaved streams: unique on a hash of the fixed width bytes, sorting ints is much cheaper than sorting strings
+        column = np.ascontiguousarray(column)
+        words = column.view(np.uint64).reshape(len(column), -1)
+        hashes = words[:, 0].copy()
+        for i in range(1, words.shape[1]):
+            hashes = hashes * np.uint64(1099511628211) ^ words[:, i]
+        uniques, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if not np.array_equal(column[first][inverse], column): # hash collision, fall back to sorting the strings
+            uniques, first, inverse = np.unique(column, return_index=True, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        indexes = np.array([self._intern(value) for value in column[first].tolist()], dtype=np.int32)
+        return indexes[inverse]
+
+
+def read_batches(filename, batch_size=64*KB, *args, **kwargs) -> Iterator[CrudeBatch]:
+    """Shortcut for CrudeReader(filename, batch_size).batches()"""
+    return CrudeReader(filename=filename, batch_size=batch_size, **kwargs).batches()
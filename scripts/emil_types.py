@@ -1,10 +1,17 @@
 import json
+import array
+import heapq
 import inspect
-from typing import Any, Union
+import threading
+import collections
+from typing import Any, Iterator, Union
 import datetime as dt_module
 
+import numpy as np
+
 
 class CrudeRecord():
+    __slots__ = ('id', 'seq', 'src', 'dst', 'tx', 'rx', 'size', 'hoplimit')
 
     def __init__(self, id, seq, src, dst, tx, rx, size, hoplimit, *args, **kwargs):
         """All attrs are str"""
@@ -28,6 +35,440 @@ class CrudeRecord():
         return self.rx - self.tx
 
 
+class HostTable():
+    """
+    Interned host strings (ips). Records store the index instead of repeating the string on every row.
+    Thread safe: interning a new host takes a lock, known hosts are a dict lookup.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.hosts: list[str] = []
+        self._index: dict[str, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.hosts)
+
+    def __getitem__(self, index: int) -> str:
+        return self.hosts[index]
+
+    def intern(self, host: str) -> int:
+        index = self._index.get(host)
+        if index is None:
+            with self._lock:
+                index = self._index.get(host) # another thread may have interned it meanwhile
+                if index is None:
+                    self.hosts.append(host)
+                    index = self._index[host] = len(self.hosts) - 1
+        return index
+
+    def get(self, host: str, default=None):
+        """Index of host without interning it"""
+        return self._index.get(host, default)
+
+
+HOSTS: HostTable = HostTable() # default table, shared by every store in the process
+
+
+class CrudeRecordView():
+    """Attribute access to one row of a CrudeRecordStore. Only valid until rows are inserted/deleted before it"""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store: CrudeRecordStore = store
+        self.index: int = index
+
+    def __str__(self):
+        return f"[CrudeRecord] (id={self.id}, seq={self.seq}, src={self.src}, dst={self.dst}, tx={self.tx}, rx={self.rx}, size={self.size}, hoplimit={self.hoplimit})"
+
+    def __lt__(self, other):
+        """Used when sorting"""
+        return self.seq < other.seq
+
+    @property
+    def id(self) -> int:
+        return self.store.id[self.index]
+
+    @property
+    def seq(self) -> int:
+        return self.store.seq[self.index]
+
+    @property
+    def src(self) -> str:
+        return self.store.hosts[self.store.src[self.index]]
+
+    @property
+    def dst(self) -> str:
+        return self.store.hosts[self.store.dst[self.index]]
+
+    @property
+    def tx(self) -> float:
+        return self.store.tx[self.index]
+
+    @property
+    def rx(self) -> float:
+        return self.store.rx[self.index]
+
+    @property
+    def size(self) -> int:
+        return self.store.size[self.index]
+
+    @property
+    def hoplimit(self) -> int:
+        return self.store.hoplimit[self.index]
+
+    def transmit_time(self) -> float:
+        return self.store.rx[self.index] - self.store.tx[self.index]
+
+    def to_record(self) -> CrudeRecord:
+        """Detached copy"""
+        return CrudeRecord(id=self.id, seq=self.seq, src=self.src, dst=self.dst, tx=self.tx, rx=self.rx, size=self.size, hoplimit=self.hoplimit)
+
+
+class CrudeRecordStore():
+    """
+    Compact container for crude records (struct-of-arrays).
+    One typed array per field, src/dst are indexes into a HostTable. ~42 bytes per record instead of a python object per record.
+    Behaves like an append only list of records: len(), iteration, store[-1].seq, store[a:b] (copy), append(), extend()
+    """
+    COLUMNS: tuple = ('id', 'seq', 'src', 'dst', 'tx', 'rx', 'size', 'hoplimit')
+    TYPECODES: dict = { # array typecodes, also valid numpy dtypes
+        'id': 'i',
+        'seq': 'q',
+        'src': 'I',
+        'dst': 'I',
+        'tx': 'd',
+        'rx': 'd',
+        'size': 'i',
+        'hoplimit': 'h',
+    }
+
+    def __init__(self, records=None, hosts=None, *args, **kwargs):
+        self.hosts: HostTable = hosts if hosts is not None else HOSTS
+        self.id: array.array = array.array(self.TYPECODES['id'])
+        self.seq: array.array = array.array(self.TYPECODES['seq'])
+        self.src: array.array = array.array(self.TYPECODES['src'])
+        self.dst: array.array = array.array(self.TYPECODES['dst'])
+        self.tx: array.array = array.array(self.TYPECODES['tx'])
+        self.rx: array.array = array.array(self.TYPECODES['rx'])
+        self.size: array.array = array.array(self.TYPECODES['size'])
+        self.hoplimit: array.array = array.array(self.TYPECODES['hoplimit'])
+        if records is not None:
+            self.extend(records)
+
+    def __str__(self):
+        return f"[{self.__class__.__name__}] records={len(self)}, nbytes={self.nbytes()}"
+
+    def __len__(self) -> int:
+        return len(self.seq)
+
+    def __iter__(self) -> Iterator[CrudeRecordView]:
+        for index in range(len(self.seq)):
+            yield CrudeRecordView(self, index)
+
+    def __getitem__(self, key) -> Union[CrudeRecordView, 'CrudeRecordStore']:
+        if isinstance(key, slice):
+            store = CrudeRecordStore(hosts=self.hosts)
+            for column in self.COLUMNS:
+                setattr(store, column, getattr(self, column)[key])
+            return store
+        length = len(self.seq)
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError(f"[{self.__class__.__name__}] index out of range")
+        return CrudeRecordView(self, key)
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).itemsize * len(getattr(self, column)) for column in self.COLUMNS)
+
+    def append_values(self, id, seq, src, dst, tx, rx, size, hoplimit) -> None:
+        """src/dst are indexes into self.hosts"""
+        self.id.append(id)
+        self.seq.append(seq)
+        self.src.append(src)
+        self.dst.append(dst)
+        self.tx.append(tx)
+        self.rx.append(rx)
+        self.size.append(size)
+        self.hoplimit.append(hoplimit)
+
+    def _values(self, record) -> tuple:
+        """Row values of any record like object (CrudeRecord, CrudeRecordView)"""
+        if isinstance(record, CrudeRecordView) and record.store.hosts is self.hosts: # no need to look up the ips again
+            store, i = record.store, record.index
+            return (store.id[i], store.seq[i], store.src[i], store.dst[i], store.tx[i], store.rx[i], store.size[i], store.hoplimit[i])
+        return (record.id, record.seq, self.hosts.intern(record.src), self.hosts.intern(record.dst), record.tx, record.rx, record.size, record.hoplimit)
+
+    def append(self, record) -> None:
+        self.append_values(*self._values(record))
+
+    def extend(self, records) -> None:
+        if isinstance(records, CrudeRecordStore) and records.hosts is self.hosts:
+            for column in self.COLUMNS:
+                getattr(self, column).extend(getattr(records, column))
+            return
+        for record in records:
+            self.append(record)
+
+    @classmethod
+    def from_columns(cls, hosts=None, **columns) -> 'CrudeRecordStore':
+        """From numpy arrays (eg. crude_reader.CrudeBatch.columns()), src/dst must already be indexes into hosts"""
+        store = cls(hosts=hosts)
+        for column in cls.COLUMNS:
+            getattr(store, column).frombytes(columns[column].astype(cls.TYPECODES[column]).tobytes())
+        return store
+
+
+class CrudeRingBuffer(CrudeRecordStore):
+    """
+    Fixed capacity CrudeRecordStore. Appending to a full buffer overwrites the oldest record in O(1).
+    Indexes are logical (0 is the oldest record), slices return a CrudeRecordStore copy.
+    """
+
+    def __init__(self, capacity, hosts=None, *args, **kwargs):
+        super().__init__(hosts=hosts)
+        self.capacity: int = int(capacity)
+        self.start: int = 0 # physical index of the oldest record
+        self.count: int = 0
+        for column in self.COLUMNS: # preallocate, the arrays never change size
+            getattr(self, column).extend([0] * self.capacity)
+
+    def __str__(self):
+        return f"[{self.__class__.__name__}] records={len(self)}, capacity={self.capacity}, nbytes={self.nbytes()}"
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[CrudeRecordView]:
+        for i in range(self.count):
+            yield CrudeRecordView(self, (self.start + i) % self.capacity)
+
+    def __getitem__(self, key) -> Union[CrudeRecordView, CrudeRecordStore]:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.count)
+            store = CrudeRecordStore(hosts=self.hosts)
+            n = len(range(start, stop, step))
+            if n == 0:
+                return store
+            if step != 1:
+                for index in range(start, stop, step):
+                    store.append(CrudeRecordView(self, (self.start + index) % self.capacity))
+                return store
+            first = (self.start + start) % self.capacity
+            for column in self.COLUMNS:
+                values = getattr(self, column)
+                if first + n <= self.capacity:
+                    setattr(store, column, values[first:first+n])
+                else: # wraps around
+                    setattr(store, column, values[first:] + values[:n-(self.capacity-first)])
+            return store
+        if key < 0:
+            key += self.count
+        if not 0 <= key < self.count:
+            raise IndexError(f"[{self.__class__.__name__}] index out of range")
+        return CrudeRecordView(self, (self.start + key) % self.capacity)
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).itemsize * self.capacity for column in self.COLUMNS)
+
+    def append_values(self, id, seq, src, dst, tx, rx, size, hoplimit) -> None:
+        if self.capacity == 0:
+            return
+        if self.count < self.capacity:
+            i = (self.start + self.count) % self.capacity
+            self.count += 1
+        else: # full, overwrite oldest
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.id[i] = id
+        self.seq[i] = seq
+        self.src[i] = src
+        self.dst[i] = dst
+        self.tx[i] = tx
+        self.rx[i] = rx
+        self.size[i] = size
+        self.hoplimit[i] = hoplimit
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+
+class ReorderBuffer():
+    """
+    Min-heap of crude records keyed on seq, O(log n) push/pop.
+    Records with equal seq are popped in insertion order (same order as bisect.insort + pop(0) on a list).
+    Rows live in a columnar slot pool, the heap only holds packed int keys: seq | insertion counter | slot
+    """
+    SLOT_BITS: int = 24
+    COUNTER_BITS: int = 40
+    SLOT_MASK: int = (1 << SLOT_BITS) - 1
+    COUNTER_MASK: int = (1 << COUNTER_BITS) - 1
+
+    def __init__(self, hosts=None, *args, **kwargs):
+        self.rows: CrudeRecordStore = CrudeRecordStore(hosts=hosts) # slot pool
+        self.hosts: HostTable = self.rows.hosts
+        self.heap: list[int] = []
+        self.free: list[int] = [] # free slots in rows
+        self.counter: int = 0
+
+    def __str__(self):
+        return f"[{self.__class__.__name__}] records={len(self)}, slots={len(self.rows)}"
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __iter__(self) -> Iterator[CrudeRecordView]:
+        """Records in pop order, O(n log n)"""
+        for key in sorted(self.heap):
+            yield CrudeRecordView(self.rows, key & self.SLOT_MASK)
+
+    def __getitem__(self, key: int) -> CrudeRecordView:
+        if key != 0:
+            raise IndexError(f"[{self.__class__.__name__}] only the first record (lowest seq) can be accessed")
+        return CrudeRecordView(self.rows, self.heap[0] & self.SLOT_MASK)
+
+    def push(self, record) -> None:
+        values = self.rows._values(record)
+        if self.free:
+            slot = self.free.pop()
+            rows = self.rows
+            rows.id[slot], rows.seq[slot], rows.src[slot], rows.dst[slot], rows.tx[slot], rows.rx[slot], rows.size[slot], rows.hoplimit[slot] = values
+        else:
+            slot = len(self.rows)
+            self.rows.append_values(*values)
+        key = (values[1] << (self.COUNTER_BITS + self.SLOT_BITS)) | ((self.counter & self.COUNTER_MASK) << self.SLOT_BITS) | slot
+        self.counter += 1
+        heapq.heappush(self.heap, key)
+
+    def pop_into(self, store: CrudeRecordStore) -> None:
+        """Move the record with the lowest seq to the end of store"""
+        slot = heapq.heappop(self.heap) & self.SLOT_MASK
+        store.append(CrudeRecordView(self.rows, slot))
+        self.free.append(slot)
+
+
+class RunningStats():
+    """
+    Statistics of a sequence of records, updated in O(1) per record (Welford for mean/variance).
+    delay: transmit time (rx - tx). jitter: mean |rx[i] - rx[i+1]| between consecutive records, so records must be added in order.
+    """
+    __slots__ = ('n', 'mean', 'm2', 'min', 'jitter_sum', 'last_rx')
+
+    def __init__(self, records=(), *args, **kwargs):
+        self.n: int = 0
+        self.mean: float = 0.0
+        self.m2: float = 0.0 # sum of squared differences from the mean
+        self.min: float = None
+        self.jitter_sum: float = 0.0
+        self.last_rx: float = None
+        self.extend(records)
+
+    def __str__(self):
+        return f"[{self.__class__.__name__}] n={self.n}, delay={self.delay()}, sdv={self.sdv()}, min={self.min}, jitter={self.jitter()}"
+
+    def __len__(self) -> int:
+        return self.n
+
+    def add(self, tx: float, rx: float) -> None:
+        delay = rx - tx
+        self.n += 1
+        diff = delay - self.mean
+        self.mean += diff / self.n
+        self.m2 += diff * (delay - self.mean)
+        if self.min is None or delay < self.min:
+            self.min = delay
+        if self.last_rx is not None:
+            self.jitter_sum += abs(self.last_rx - rx)
+        self.last_rx = rx
+
+    def add_record(self, record) -> None:
+        self.add(record.tx, record.rx)
+
+    def extend(self, records) -> None:
+        if type(records) is CrudeRecordStore: # read the columns, no views (not a ring buffer, its arrays are in physical order)
+            add = self.add
+            for tx, rx in zip(records.tx, records.rx):
+                add(tx, rx)
+        else:
+            for record in records:
+                self.add(record.tx, record.rx)
+
+    def delay(self) -> Union[float, None]:
+        return self.mean if self.n else None
+
+    def variance(self) -> Union[float, None]:
+        """Population variance of the delay"""
+        return self.m2 / self.n if self.n else None
+
+    def sdv(self) -> Union[float, None]:
+        return self.variance() ** 0.5 if self.n else None
+
+    def jitter(self) -> Union[float, None]:
+        return self.jitter_sum / (self.n - 1) if self.n > 1 else None
+
+
+class RollingBaseline():
+    """
+    Delay (rx - tx) baseline of the last #size records of a stream, O(1) amortized per record:
+    least delay from a monotonic deque (increasing delays, the front is the minimum), mean/sdv from add/remove Welford updates.
+    """
+
+    def __init__(self, size=1000, *args, **kwargs):
+        self.size: int = int(size)
+        self.delays: collections.deque = collections.deque() # last #size delays, oldest first
+        self.minima: collections.deque = collections.deque() # (record number, delay), increasing delays
+        self.counter: int = 0 # records added
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+
+    def __str__(self):
+        return f"[{self.__class__.__name__}] size={self.size}, n={len(self.delays)}, least_delay={self.least_delay()}, mean={self.delay()}, sdv={self.sdv()}"
+
+    def __len__(self) -> int:
+        return len(self.delays)
+
+    def add(self, tx: float, rx: float) -> None:
+        delay = rx - tx
+        if len(self.delays) == self.size:
+            self._remove(self.delays.popleft())
+        self.delays.append(delay)
+        n = len(self.delays)
+        diff = delay - self.mean
+        self.mean += diff / n
+        self.m2 += diff * (delay - self.mean)
+
+        while self.minima and self.minima[-1][1] >= delay: # can never be the minimum again
+            self.minima.pop()
+        self.minima.append((self.counter, delay))
+        if self.minima[0][0] <= self.counter - self.size: # left the window
+            self.minima.popleft()
+        self.counter += 1
+
+    def add_record(self, record) -> None:
+        self.add(record.tx, record.rx)
+
+    def _remove(self, delay: float) -> None:
+        n = len(self.delays) # delays already popped
+        if n == 0:
+            self.mean, self.m2 = 0.0, 0.0
+            return
+        diff = delay - self.mean
+        self.mean -= diff / n
+        self.m2 = max(self.m2 - diff * (delay - self.mean), 0.0) # rounding can go below 0
+
+    def least_delay(self) -> Union[float, None]:
+        return self.minima[0][1] if self.minima else None
+
+    def delay(self) -> Union[float, None]:
+        return self.mean if self.delays else None
+
+    def sdv(self) -> Union[float, None]:
+        """Population standard deviation of the delay"""
+        return (self.m2 / len(self.delays)) ** 0.5 if self.delays else None
+
+
 class Gap:
     """Gap a la Emil"""
     XS: str = 'tiny'
@@ -43,8 +484,10 @@ class Gap:
         LG: {'from': 10, 'to': 50},
         XL: {'from': 50, 'to': None},
     }
+    SLOPE_SIZES: tuple = (10, 20, 30, 40, 50) # h_slope_10..50, t_slope_10..50
 
-    def __init__(self, from_adr, from_ip, to_adr, to_ip, datetime, timestamp, tz=dt_module.timezone.utc, fastest_record=None, *args, **kwargs):
+    def __init__(self, from_adr, from_ip, to_adr, to_ip, datetime, timestamp, tz=dt_module.timezone.utc, fastest_record=None, stream_id=None, least_delay=None, delay_sdv=None, hosts=None, *args, **kwargs):
+        self.stream_id: int = stream_id
         self.from_adr: str = from_adr
         self.from_ip: str = from_ip
         self.to_adr: str = to_adr
@@ -53,8 +496,12 @@ class Gap:
         self.timestamp: float = timestamp
         self.tz: dt_module.timezone = tz
         self.fastest_record: CrudeRecord = fastest_record
-        self.head: list[CrudeRecord] = []
-        self.tail: list[CrudeRecord] = []
+        self.least_delay: float = least_delay if least_delay is not None or fastest_record is None else fastest_record.transmit_time() # baseline for h/t_ddelay
+        self.delay_sdv: float = delay_sdv # sdv of the delay over the baseline records
+        self.head: CrudeRecordStore = CrudeRecordStore(hosts=hosts) # same host table as the analyzer's window, rows are copied as indexes
+        self.tail: CrudeRecordStore = CrudeRecordStore(hosts=hosts)
+        self.head_stats: RunningStats = RunningStats() # kept up to date by add_record(s)_to_head/tail
+        self.tail_stats: RunningStats = RunningStats()
         self.event_type: str = 'gap'
 
     def __str__(self):
@@ -83,7 +530,13 @@ class Gap:
 
 
     def to_json(self, **kwargs):
-        obj = {
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_dict(self) -> dict:
+        h_slopes = self.slopes(sizes=self.SLOPE_SIZES, records=self.head, last=True)
+        t_slopes = self.slopes(sizes=self.SLOPE_SIZES, records=self.tail)
+        return {
+            'stream_id': self.stream_id,
             'from_adr': self.from_adr,
             'from_ip': self.from_ip,
             'to_adr': self.to_adr,
@@ -95,44 +548,55 @@ class Gap:
             # 'timestamp_zone': dt_module.timezone.tzname(dt=self.tz),
 
             'h_n': len(self.head),
-            'h_ddelay': self.avg_delay(records=self.head) - self.fastest_record.transmit_time() if self.fastest_record else 0,
-            'h_delay': self.avg_delay(records=self.head),
-            'h_jit': self.jitter(records=self.head),
-            'h_min_d': self.min_delay(records=self.head),
-            'h_slope_10': self.slope(n=-10, records=self.head),
-            'h_slope_20': self.slope(n=-20, records=self.head),
-            'h_slope_30': self.slope(n=-30, records=self.head),
-            'h_slope_40': self.slope(n=-40, records=self.head),
-            'h_slope_50': self.slope(n=-50, records=self.head),
+            'h_ddelay': self.ddelay(self.head_stats),
+            'h_delay': self.head_stats.delay(),
+            'h_jit': self.head_stats.jitter(),
+            'h_min_d': self.head_stats.min,
+            'h_slope_10': h_slopes[10],
+            'h_slope_20': h_slopes[20],
+            'h_slope_30': h_slopes[30],
+            'h_slope_40': h_slopes[40],
+            'h_slope_50': h_slopes[50],
 
             'tloss': self.tloss(),
             't_n': len(self.tail),
 
             't_n': len(self.tail),
-            't_ddelay': Gap.avg_delay(records=self.tail) - self.fastest_record.transmit_time() if self.fastest_record else 0,
-            't_delay': Gap.avg_delay(records=self.tail),
-            't_jit': Gap.jitter(records=self.tail),
-            't_min_d': Gap.min_delay(records=self.tail),
-            't_slope_10': Gap.slope(n=10, records=self.tail),
-            't_slope_20': Gap.slope(n=20, records=self.tail),
-            't_slope_30': Gap.slope(n=30, records=self.tail),
-            't_slope_40': Gap.slope(n=40, records=self.tail),
-            't_slope_50': Gap.slope(n=50, records=self.tail),
+            't_ddelay': self.ddelay(self.tail_stats),
+            't_delay': self.tail_stats.delay(),
+            't_jit': self.tail_stats.jitter(),
+            't_min_d': self.tail_stats.min,
+            't_slope_10': t_slopes[10],
+            't_slope_20': t_slopes[20],
+            't_slope_30': t_slopes[30],
+            't_slope_40': t_slopes[40],
+            't_slope_50': t_slopes[50],
+            'least_delay': self.least_delay,
+            'delay_sdv': self.delay_sdv,
             'event_type': self.event_type,
         }
-        return json.dumps(obj, **kwargs)
+
+    def ddelay(self, stats: RunningStats) -> Union[float, None]:
+        """Average delay above the baseline (least delay before the gap), 0 without a baseline"""
+        if self.least_delay is None:
+            return 0
+        return stats.delay() - self.least_delay if stats.n else None
 
     def add_record_to_head(self, record: CrudeRecord) -> None:
         self.head.append(record)
+        self.head_stats.add_record(record)
 
     def add_records_to_head(self, records: list[CrudeRecord]) -> None:
         self.head.extend(records)
+        self.head_stats.extend(records)
 
     def add_record_to_tail(self, record: CrudeRecord) -> None:
         self.tail.append(record)
+        self.tail_stats.add_record(record)
 
     def add_records_to_tail(self, records: list[CrudeRecord]) -> None:
         self.tail.extend(records)
+        self.tail_stats.extend(records)
 
     @staticmethod
     def avg_delay(records: list[CrudeRecord]) -> Union[float, None]:
@@ -160,8 +624,35 @@ class Gap:
             n (positive): first n records
             n (negative): last n records
         """
-        # TODO: implement
-        pass
+        return Gap.slopes(sizes=(abs(n),), records=records, last=n < 0)[abs(n)]
+
+    @staticmethod
+    def slopes(sizes: tuple, records: list[CrudeRecord], last: bool=False) -> dict[int, Union[float, None]]:
+        """
+        Least squares slope of delay (y = rx - tx) over send time (x = tx) for the first (last=True: last) n records, for every n in sizes.
+        One pass: prefix sums of x, x², y and xy give every fit in O(1), O(len(records)) in total.
+        Fewer than n records: fit on all of them like records[:n]. None if less than 2 records or all tx are equal.
+        """
+        if type(records) is CrudeRecordStore: # the columns, no views
+            tx, rx = np.asarray(records.tx), np.asarray(records.rx)
+        else:
+            tx = np.array([record.tx for record in records], dtype=np.float64)
+            rx = np.array([record.rx for record in records], dtype=np.float64)
+        if last:
+            tx, rx = tx[::-1], rx[::-1] # prefix of the reversed records = last n, the slope is the same in any order
+        if len(tx) < 2:
+            return {n: None for n in sizes}
+
+        x = tx - tx[0] # small numbers, no cancellation in n*sxx - sx²
+        y = rx - tx
+        sx, sxx, sy, sxy = np.cumsum(x), np.cumsum(x * x), np.cumsum(y), np.cumsum(x * y)
+        slopes: dict[int, Union[float, None]] = {}
+        for n in sizes:
+            m = min(n, len(x)) # records in the fit
+            i = m - 1
+            denominator = m * sxx[i] - sx[i] * sx[i]
+            slopes[n] = float((m * sxy[i] - sx[i] * sy[i]) / denominator) if m >= 2 and denominator > 0 else None
+        return slopes
 
     def tloss(self) -> Union[float, None]:
         """Return time lost in the gap. Difference between last packet before gap and first packet after gap"""
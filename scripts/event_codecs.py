@@ -0,0 +1,269 @@
+# Serialization of microdep_types events: json lines and msgpack, with encoders/decoders generated once per class.
+# usage: python event_codecs.py <events.jsonl[.gz] | events.msgpack> [out.jsonl | out.msgpack]   (reads and converts a file)
+#
+# The code of each codec is generated from the class annotations (one statement per attr, no loops or lookups
+# per event), compiled with exec() and cached per class:
+#   to_dict / from_dict   {'from': .., 'to': .., ...} keys are the attr names, except python keywords ('from_' -> 'from')
+#   to_row / from_row     [set_mask, value, value, ...] only the set attrs, in annotation order (msgpack, compact)
+# Attrs annotated with an annotated class (TraceRoute.stats: list[HopStats], RawTraceRoute.trace_route: list[Hop], ...)
+# are encoded with the codec of that class, dicts are kept as they are.
+# Decoding bypasses __init__ (no kwargs), but sets defaults and checks required fields like AnnotatedI does.
+# Unknown keys are ignored, the attr name is read when the key is missing ('from_', older sink output).
+# AnnotatedI.to_dict() (and so every sink) writes this format.
+# msgpack and orjson are optional, json lines use orjson when installed (NaN becomes null with orjson).
+# imports
+import sys
+import copy
+import gzip
+import json
+import typing
+import keyword
+from typing import Any, Callable, Iterator
+
+import microdep_types
+
+try:
+    import msgpack # optional, for the binary format
+except ImportError:
+    msgpack = None
+try:
+    import orjson # optional, faster json lines
+except ImportError:
+    orjson = None
+# End: imports -----------------------------------------------------------------
+MISSING = object()
+INTERFACES: tuple = (microdep_types.EventI, microdep_types.CorrelationEventI) # never decoded to
+
+
+def key_name(attr: str) -> str:
+    """'from_' -> 'from', other attrs are kept"""
+    return attr[:-1] if attr.endswith('_') and keyword.iskeyword(attr[:-1]) else attr
+
+
+def class_annotations(cls) -> dict[str, object]:
+    """Annotated attrs of a class and its parents (own first), like AnnotatedI.get_all_annotations()"""
+    if hasattr(cls, '_annotations'):
+        return cls._annotations
+    annotations: dict[str, object] = {}
+    for parent in cls.__mro__:
+        for attr, annotation in getattr(parent, '__annotations__', {}).items():
+            annotations.setdefault(attr, annotation)
+    return annotations
+
+
+def nested_class(annotation) -> tuple[str, type]:
+    """('one', cls) for an annotated class, ('list', cls) for list[annotated class], (None, None) for plain values"""
+    if typing.get_origin(annotation) is list:
+        args = typing.get_args(annotation)
+        kind, cls = nested_class(args[0]) if args else (None, None)
+        return ('list', cls) if kind == 'one' else (None, None)
+    if isinstance(annotation, type) and getattr(annotation, '__annotations__', None) and annotation.__module__ == microdep_types.__name__:
+        return 'one', annotation
+    return None, None
+
+
+class EventCodec():
+    """
+    Generated encoders/decoders of one class, see codec(cls).
+    fields: [(attr, key, kind, nested codec)] in annotation order
+    """
+
+    def __init__(self, cls, *args, **kwargs):
+        self.cls: type = cls
+        self.fields: list[tuple] = []
+        for attr, annotation in class_annotations(cls).items():
+            kind, nested = nested_class(annotation)
+            self.fields.append((attr, key_name(attr), kind, codec(nested) if nested is not None else None))
+        if len(self.fields) > 64: # the set mask of a row is one msgpack integer
+            raise Exception(f"[{self.__class__.__name__}] {cls.__name__} has more than 64 attrs")
+        self.defaults: dict[str, Any] = dict(getattr(cls, '_defaults', {}))
+        self.copied_defaults: tuple = tuple(getattr(cls, '_copied_defaults', ()))
+        self.required_fields: tuple = tuple(getattr(cls, '_required_fields', ()))
+        self.to_dict: Callable[[Any], dict] = None
+        self.from_dict: Callable[[dict], Any] = None
+        self.to_row: Callable[[Any], list] = None
+        self.from_row: Callable[[list], Any] = None
+        self._compile()
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] {self.cls.__name__}: fields={len(self.fields)}, nested={[attr for attr, key, kind, nested in self.fields if kind]}"
+
+    def _compile(self) -> None:
+        namespace: dict[str, Any] = {'cls': self.cls, 'MISSING': MISSING, 'copy': copy.copy, 'new': object.__new__}
+        for i, (attr, key, kind, nested) in enumerate(self.fields):
+            if nested is not None:
+                namespace.update({f"enc_{i}": nested.to_dict, f"dec_{i}": nested.from_dict, f"row_{i}": nested.to_row, f"unrow_{i}": nested.from_row})
+        for attr, value in self.defaults.items():
+            namespace[f"default_{attr}"] = value
+
+        def encode(i, kind, value, row=False) -> str:
+            """Expression that encodes a value"""
+            encoder = f"{'row' if row else 'enc'}_{i}"
+            if kind == 'one':
+                return f"(v if v is None or type(v) is dict else {encoder}(v))"
+            if kind == 'list':
+                return f"(v if v is None else [x if x is None or type(x) is dict else {encoder}(x) for x in v])"
+            return value
+
+        def decode(i, kind, value, row=False) -> str:
+            decoder = f"{'unrow' if row else 'dec'}_{i}"
+            if kind == 'one':
+                return f"(v if v is None else {decoder}(v))"
+            if kind == 'list':
+                return f"(v if v is None else [x if x is None else {decoder}(x) for x in v])"
+            return value
+
+        new_object = ["    obj = new(cls)"]
+        new_object += [f"    obj.{attr} = copy(default_{attr})" if attr in self.copied_defaults else f"    obj.{attr} = default_{attr}" for attr in self.defaults]
+        check_required = [
+            f"    if not hasattr(obj, {field!r}):\n        raise NotImplementedError({f'[{self.cls.__name__}] requires attr {field!r}'!r})"
+            for field in self.required_fields
+        ]
+
+        lines: list[str] = ["def to_dict(obj):", "    data = {}"]
+        for i, (attr, key, kind, nested) in enumerate(self.fields):
+            lines += [f"    try:\n        v = obj.{attr}\n    except AttributeError:\n        pass", f"    else:\n        data[{key!r}] = {encode(i, kind, 'v')}"]
+        lines += ["    return data", "", "def from_dict(data):"] + new_object
+        for i, (attr, key, kind, nested) in enumerate(self.fields):
+            lines += [f"    v = data.get({key!r}, MISSING)"]
+            if key != attr: # dicts written before AnnotatedI.to_dict used this format have the attr name ('from_')
+                lines += [f"    if v is MISSING:\n        v = data.get({attr!r}, MISSING)"]
+            lines += [f"    if v is not MISSING:\n        obj.{attr} = {decode(i, kind, 'v')}"]
+        lines += check_required + ["    return obj", "", "def to_row(obj):", "    mask = 0", "    row = [0]"]
+        for i, (attr, key, kind, nested) in enumerate(self.fields):
+            lines += [f"    try:\n        v = obj.{attr}\n    except AttributeError:\n        pass", f"    else:\n        mask |= {1 << i}\n        row.append({encode(i, kind, 'v', row=True)})"]
+        lines += ["    row[0] = mask", "    return row", "", "def from_row(row):"] + new_object + ["    mask = row[0]", "    n = 1"]
+        for i, (attr, key, kind, nested) in enumerate(self.fields):
+            lines += [f"    if mask & {1 << i}:\n        v = row[n]\n        obj.{attr} = {decode(i, kind, 'v', row=True)}\n        n += 1"]
+        lines += check_required + ["    return obj"]
+        exec(compile("\n".join(lines), f"<codec {self.cls.__name__}>", 'exec'), namespace)
+        self.to_dict, self.from_dict, self.to_row, self.from_row = namespace['to_dict'], namespace['from_dict'], namespace['to_row'], namespace['from_row']
+
+
+CODECS: dict[type, EventCodec] = {} # class -> codec, built on first use
+
+
+def codec(cls) -> EventCodec:
+    if cls not in CODECS:
+        CODECS[cls] = EventCodec(cls)
+    return CODECS[cls]
+
+
+def event_classes() -> dict[tuple, type]:
+    """(event_type, match_type) -> class, match_type None when the class doesn't set one"""
+    classes: dict[tuple, type] = {
+        ('snmp_trap', None): microdep_types.LinkTrap, # LinkTrap has no default event_type
+        ('correlation_match', 'bgp_update_before_and_after'): microdep_types.Routing, # see correlation.RoutingCorrelator
+    }
+    for cls in vars(microdep_types).values():
+        if isinstance(cls, type) and issubclass(cls, microdep_types.EventI) and cls not in INTERFACES and 'event_type' in cls._defaults:
+            classes.setdefault((cls._defaults['event_type'], cls._defaults.get('match_type')), cls)
+    return classes
+
+
+EVENT_CLASSES: dict[tuple, type] = event_classes()
+CLASS_NAMES: dict[str, type] = {cls.__name__: cls for cls in EVENT_CLASSES.values()}
+
+
+def event_class(data: dict) -> type:
+    """Class of an event dict from its event_type (and match_type for correlation matches)"""
+    event_type = data.get('event_type')
+    cls = EVENT_CLASSES.get((event_type, data.get('match_type'))) or EVENT_CLASSES.get((event_type, None))
+    if cls is None:
+        raise Exception(f"[event_codecs] unknown event_type={event_type}, match_type={data.get('match_type')}")
+    return cls
+
+
+def to_dict(event) -> dict:
+    return codec(type(event)).to_dict(event)
+
+
+def from_dict(data: dict, cls=None):
+    return codec(cls or event_class(data)).from_dict(data)
+
+
+def to_json(event) -> str:
+    data = codec(type(event)).to_dict(event)
+    return orjson.dumps(data).decode('utf-8') if orjson is not None else json.dumps(data)
+
+
+def from_json(line, cls=None):
+    data = orjson.loads(line) if orjson is not None else json.loads(line)
+    return codec(cls or event_class(data)).from_dict(data)
+
+
+def require_msgpack() -> None:
+    if msgpack is None:
+        raise Exception("[event_codecs] msgpack is not installed (pip install msgpack), use the json lines functions")
+
+
+def to_msgpack(event) -> bytes:
+    """[class name, mask, values...]"""
+    require_msgpack()
+    row = codec(type(event)).to_row(event)
+    row.insert(0, type(event).__name__)
+    return msgpack.packb(row)
+
+
+def from_msgpack(data: bytes):
+    require_msgpack()
+    return _from_row(msgpack.unpackb(data))
+
+
+def _from_row(row: list):
+    cls = CLASS_NAMES.get(row[0])
+    if cls is None:
+        raise Exception(f"[event_codecs] unknown class {row[0]}")
+    return codec(cls).from_row(row[1:])
+
+
+def write_json_lines(events, filename, mode='w') -> int:
+    n: int = 0
+    with open(filename, mode=mode, encoding='utf-8') as file:
+        for n, event in enumerate(events, 1):
+            file.write(to_json(event))
+            file.write('\n')
+    return n
+
+
+def json_lines(filename) -> Iterator[dict]:
+    """Dicts of a json lines file, gzip when the name ends with .gz (sinks.GzipJsonLinesSink output)"""
+    opener = gzip.open if str(filename).endswith('.gz') else open
+    loads = orjson.loads if orjson is not None else json.loads
+    with opener(filename, mode='rt', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield loads(line)
+
+
+def read_json_lines(filename, cls=None) -> Iterator[Any]:
+    for data in json_lines(filename):
+        yield codec(cls or event_class(data)).from_dict(data)
+
+
+def write_msgpack(events, filename, mode='wb') -> int:
+    require_msgpack()
+    n: int = 0
+    packer = msgpack.Packer()
+    with open(filename, mode=mode) as file:
+        for n, event in enumerate(events, 1):
+            row = codec(type(event)).to_row(event)
+            row.insert(0, type(event).__name__)
+            file.write(packer.pack(row))
+    return n
+
+
+def read_msgpack(filename) -> Iterator[Any]:
+    require_msgpack()
+    with open(filename, 'rb') as file:
+        for row in msgpack.Unpacker(file, use_list=True, raw=False):
+            yield _from_row(row)
+
+
+if __name__ == "__main__":
+    read = read_msgpack if sys.argv[1].endswith('.msgpack') else read_json_lines
+    events = list(read(sys.argv[1]))
+    print(f"[event_codecs] {len(events)} events from {sys.argv[1]}: {sorted({type(event).__name__ for event in events})}")
+    if len(sys.argv) > 2:
+        write = write_msgpack if sys.argv[2].endswith('.msgpack') else write_json_lines
+        print(f"[event_codecs] {write(events, sys.argv[2])} events to {sys.argv[2]}")
@@ -0,0 +1,274 @@
+# Live gap detection: follows the crude file a node is writing and analyzes the new lines as they arrive.
+# usage: python follow.py <node dir> [--out gaps.jsonl] [--poll 0.2] [--max-delay 0.5] [--duration 60] [--stream 1 2]
+#        python synthetic.py live <node dir> [--rate 1000] [--rotate 60]   (local writer for testing)
+# The node dir holds one directory per day with the crude files of that day: {node dir}/{yyyy-mm-dd}/crude*.gz
+# When a newer file shows up (rotation or a new day) the current one is read to its end and the newer one is followed.
+# Stream analyzers are kept across files, streams continue over rotations.
+#
+# Changes are picked up with inotify when the optional inotify_simple package is installed, otherwise by polling.
+# A gap is emitted when its tail is complete, latency after the last tail line is written is at most about
+#   window_size / packets per second per stream (records wait in the analyzer window) + poll + the sink's max_delay
+# imports
+import os
+import glob
+import time
+import zlib
+import argparse
+
+import sinks
+import utils
+import constants
+import crude_reader
+# End: imports -----------------------------------------------------------------
+READ_SIZE: int = 4 * crude_reader.MB # compressed bytes read from the file per call
+
+
+class CrudeTail():
+    """
+    Incremental reader of one growing crude file (gzip or plain text).
+    read() returns the complete lines appended since the last call, a partial last line is kept for the next call.
+    A gzip file is decompressed as it grows (the writer has to flush), also over concatenated gzip members.
+    """
+
+    def __init__(self, path, *args, **kwargs):
+        self.path: str = str(path)
+        self.is_gzip: bool = self.path.endswith('.gz')
+        self.offset: int = 0 # bytes of the file consumed
+        self.line_counter: int = 0
+        self._decompressor = zlib.decompressobj(wbits=31) if self.is_gzip else None
+        self._remainder: bytes = b'' # partial last line
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] path={self.path}, offset={self.offset}, lines={self.line_counter}"
+
+    def _reset(self) -> None:
+        """The file was replaced or truncated, start again from the beginning"""
+        self.offset = 0
+        self._decompressor = zlib.decompressobj(wbits=31) if self.is_gzip else None
+        self._remainder = b''
+
+    def _decompress(self, data: bytes) -> bytes:
+        out: list[bytes] = []
+        while data:
+            out.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            data = self._decompressor.unused_data # next gzip member
+            self._decompressor = zlib.decompressobj(wbits=31)
+        return b''.join(out)
+
+    def read(self, max_bytes=READ_SIZE) -> bytes:
+        try:
+            size: int = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return b''
+        if size < self.offset:
+            self._reset()
+        if size == self.offset:
+            return b''
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data: bytes = file.read(max_bytes)
+        self.offset += len(data)
+        if self.is_gzip:
+            data = self._decompress(data)
+        data = self._remainder + data
+        cut: int = data.rfind(b'\n') + 1
+        self._remainder = data[cut:]
+        self.line_counter += data.count(b'\n', 0, cut)
+        return data[:cut]
+
+    def finish(self) -> bytes:
+        """The file won't grow anymore: the last line without a newline"""
+        data, self._remainder = self._remainder, b''
+        return data + b'\n' if data.strip() else b''
+
+
+class DirectoryWatcher():
+    """
+    Blocks until something changes in the watched directories, or the timeout passes.
+    inotify (inotify_simple) when available, otherwise it just sleeps the timeout (polling).
+    """
+
+    def __init__(self, use_inotify=True, *args, **kwargs):
+        self.inotify = None
+        self.watched: set[str] = set()
+        if use_inotify:
+            try:
+                import inotify_simple # optional dependency, polling without it
+                self._flags = inotify_simple.flags.MODIFY | inotify_simple.flags.CREATE | inotify_simple.flags.MOVED_TO | inotify_simple.flags.CLOSE_WRITE
+                self.inotify = inotify_simple.INotify()
+            except (ImportError, OSError):
+                self.inotify = None
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] mode={'inotify' if self.inotify is not None else 'polling'}, watched={len(self.watched)}"
+
+    def watch(self, path) -> None:
+        if self.inotify is None or path in self.watched or not os.path.isdir(path):
+            return
+        self.inotify.add_watch(path, self._flags)
+        self.watched.add(path)
+
+    def wait(self, timeout: float) -> None:
+        if self.inotify is None:
+            time.sleep(timeout)
+            return
+        self.inotify.read(timeout=int(timeout * 1000)) # returns on the first event
+
+    def close(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+class CrudeFollower():
+    """
+    Follows the crude files of a node directory in order and feeds the new lines to a utils.CrudeAnalyzer.
+
+    follower = CrudeFollower(node_dir, analyzer=utils.CrudeAnalyzer(sink=sinks.JsonLinesSink('gaps.jsonl', max_delay=0.5), **settings))
+    follower.run() # from the newest file on, until stop() or ctrl-c, then the analyzer is cleaned up
+    """
+
+    def __init__(self, node_dir, analyzer=None, pattern='crude*', poll_interval=0.2, filter=None, watcher=None, *args, **kwargs):
+        self.node_dir: str = str(node_dir)
+        self.analyzer: utils.CrudeAnalyzer = analyzer
+        self.pattern: str = pattern
+        self.poll_interval: float = float(poll_interval) # longest wait between two reads
+        self.reader: crude_reader.CrudeReader = crude_reader.CrudeReader(filename=self.node_dir, filter=filter) # only used to parse blocks
+        self.watcher: DirectoryWatcher = watcher if watcher is not None else DirectoryWatcher()
+        self.tail: CrudeTail = None
+        self.files: list[str] = [] # followed so far
+        self.record_counter: int = 0
+        self.last_tx: float = 0.0 # highest tx fed to the analyzer
+        self.stopped: bool = False
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] files={len(self.files)}, records={self.record_counter}, lag={self.lag():.2f}s, tail={self.tail}, {self.watcher}"
+
+    def lag(self) -> float:
+        """Seconds between now and the newest record fed to the analyzer"""
+        return time.time() - self.last_tx if self.last_tx else 0.0
+
+    def crude_files(self) -> list[str]:
+        """All crude files of the node, oldest first (day directories and file names sort by time)"""
+        return sorted(glob.glob(os.path.join(self.node_dir, '*', self.pattern)))
+
+    def next_file(self) -> str:
+        """The newest file to start with, then the file after the followed one. None if there is none (yet)"""
+        paths = self.crude_files()
+        if self.tail is None:
+            return paths[-1] if paths else None
+        for path in paths:
+            if path > self.tail.path:
+                return path
+        return None
+
+    def _feed(self, data: bytes) -> int:
+        if not data:
+            return 0
+        batch = self.reader.parse_block(data)
+        if len(batch) == 0:
+            return 0
+        self.analyzer.add_batch(batch)
+        self.record_counter += len(batch)
+        self.last_tx = max(self.last_tx, float(batch.tx.max()))
+        return len(batch)
+
+    def _poll_sinks(self) -> None:
+        """Flushes events older than the sinks' max_delay, while no new events come to do it"""
+        for sink in [self.analyzer.sink] + [getattr(plugin, 'sink', None) for plugin in self.analyzer.plugins]:
+            if hasattr(sink, 'poll'):
+                sink.poll()
+
+    def _open(self, path) -> None:
+        self.tail = CrudeTail(path)
+        self.files.append(path)
+        self.watcher.watch(os.path.dirname(path))
+        print(f"[{self.__class__.__name__}] following {path}")
+
+    def read(self) -> bytes:
+        """
+        Complete lines that are new since the last call (at most ~READ_SIZE compressed bytes), b'' when there is nothing.
+        Moves on to the next file when the current one is done. Without an analyzer, for callers that parse themselves.
+        """
+        self.watcher.watch(self.node_dir) # new day directories
+        if self.tail is None:
+            path = self.next_file()
+            if path is None:
+                return b''
+            self._open(path)
+        data: bytes = self.tail.read()
+        if data:
+            return data
+        path = self.next_file()
+        if path is None:
+            return b''
+        data = self.tail.read() + self.tail.finish() # rotated: the writer has moved on, the current file is complete
+        self._open(path)
+        return data + self.tail.read()
+
+    def rest(self) -> bytes:
+        """What is left of the current file, when following stops"""
+        if self.tail is None:
+            return b''
+        parts: list[bytes] = []
+        while True:
+            data = self.tail.read()
+            if not data:
+                break
+            parts.append(data)
+        parts.append(self.tail.finish())
+        return b''.join(parts)
+
+    def step(self) -> int:
+        """Feeds everything that is new to the analyzer. Returns records fed"""
+        records: int = 0
+        while True:
+            data = self.read()
+            if not data:
+                break
+            records += self._feed(data)
+        self._poll_sinks()
+        return records
+
+    def run(self, duration=None) -> None:
+        """Follows until stop(), ctrl-c or #duration seconds, then cleans up the analyzer (unfinished gaps, sinks)"""
+        end: float = time.monotonic() + duration if duration is not None else None
+        try:
+            while not self.stopped and (end is None or time.monotonic() < end):
+                if self.step() == 0:
+                    self.watcher.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._feed(self.rest())
+            self.analyzer.cleanup()
+            self.watcher.close()
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live gap detection on the crude files of one node")
+    parser.add_argument('node_dir', help="eg. /dynga/uninett/data/ngu-mp.ngu.no")
+    parser.add_argument('--out', help="gaps as json lines, default: print")
+    parser.add_argument('--poll', type=float, default=0.2, help="seconds between reads when nothing changes")
+    parser.add_argument('--max-delay', type=float, default=0.5, help="seconds a finished gap may wait in the sink buffer")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--no-inotify', action='store_true', help="poll even if inotify_simple is installed")
+    parser.add_argument('--stream', type=int, nargs='+', help="only these stream ids")
+    args = parser.parse_args()
+
+    sink = sinks.JsonLinesSink(args.out, max_delay=args.max_delay) if args.out else sinks.PrintSink(max_delay=args.max_delay)
+    analyzer = utils.CrudeAnalyzer(sink=sink, **constants.CRUDE_ANALYZER_SETTINGS)
+    follower = CrudeFollower(
+        node_dir=args.node_dir,
+        analyzer=analyzer,
+        poll_interval=args.poll,
+        filter=crude_reader.CrudeFilter(ids=args.stream),
+        watcher=DirectoryWatcher(use_inotify=not args.no_inotify),
+    )
+    follower.run(duration=args.duration)
+    sink.close()
+    print(follower)
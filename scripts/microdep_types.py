@@ -1,10 +1,52 @@
 # from typing import List, Any
+import copy
 import json
 import inspect
 from typing import Any, Union
 import datetime as dt_module
 
+SCHEMA_ATTRS: tuple = ('required_fields', '_required_fields') # class settings of AnnotatedI, never fields
+
+
+class AnnotatedMeta(type):
+    """
+    Builds the schema of an AnnotatedI class once, when the class is created:
+        _annotations   annotated attrs of the class and its parents (own first), the allowed attrs
+        _required_fields   'required_fields' of the class and its parents
+        _defaults      class level values of annotated attrs, set on every new instance (lists, dicts and sets are copied)
+    Annotated attrs become __slots__, instances have no __dict__. Their class level values are moved to _defaults,
+    a class attribute with the same name as a slot would hide it.
+    Only one base of a class can have fields (slot layouts can't be merged).
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        annotations: dict[str, object] = {attr: value for attr, value in namespace.get('__annotations__', {}).items() if attr not in SCHEMA_ATTRS}
+        inherited: dict[str, object] = {}
+        defaults: dict[str, Any] = {}
+        required: list[str] = []
+        for base in reversed(bases):
+            inherited.update(getattr(base, '_annotations', {}))
+            defaults.update(getattr(base, '_defaults', {}))
+            required.extend(field for field in getattr(base, '_required_fields', ()) if field not in required)
+        all_annotations = dict(annotations)
+        for attr, value in inherited.items():
+            all_annotations.setdefault(attr, value)
+        for attr in all_annotations:
+            if attr in namespace: # own default, or a new default for a parent's attr
+                defaults[attr] = namespace.pop(attr)
+        required.extend(field for field in namespace.get('required_fields', ()) if field not in required)
+
+        namespace['__slots__'] = tuple(attr for attr in all_annotations if attr not in inherited)
+        namespace['_annotations'] = all_annotations
+        namespace['_attr_names'] = frozenset(all_annotations)
+        namespace['_defaults'] = defaults
+        namespace['_copied_defaults'] = tuple(attr for attr, value in defaults.items() if isinstance(value, (list, dict, set)))
+        namespace['_required_fields'] = tuple(required)
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
 class BaseInterface:
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         """Enables kwargs"""
@@ -26,28 +68,34 @@ class BaseInterface:
 
 
 
-class AnnotatedI(BaseInterface):
+class AnnotatedI(BaseInterface, metaclass=AnnotatedMeta):
     """
     This interface will only allow to set attrs that has been annotated. Also support required fields.
-    To solve The Diamond Problem on multiple inheritance, redefine 'required_fields' on the child class.
+    Set 'required_fields' on the child class, they are added to the ones of the parents.
+    The schema (allowed attrs, required fields, defaults) is built once per class by AnnotatedMeta.
 
-    extended classes must define
-    def __init__(self, *args, **kwargs):
-        self._required_fields.extend(__class__.required_fields) # must be called before super().__init__()
-        super().__init__(*args, **kwargs)
+    class Gap(EventI):
+        timestamp: float
+        event_type: str = "gap"
+        required_fields = ['timestamp']
     """
 
-    _required_fields: list[str] = []
     required_fields: list[str] = []
 
     def __init__(self, *args, **kwargs):
-        self._required_fields.extend(AnnotatedI.required_fields) # must be called before super().__init__()
         super().__init__(**kwargs)
+        for attr, value in self._defaults.items():
+            setattr(self, attr, value)
+        for attr in self._copied_defaults: # not shared between instances
+            setattr(self, attr, copy.copy(self._defaults[attr]))
         self._set_allowed_attrs(**kwargs)
         self._check_required_fields(**kwargs)
 
+    def get_all_annotations(self) -> dict[str, object]:
+        return dict(self._annotations)
+
     def _set_allowed_attrs(self, **kwargs):
-        attr_names = self.get_all_attr_names()
+        attr_names = self._attr_names
         for attr, value in kwargs.items():
             if attr in attr_names:
                 setattr(self, attr, value)
@@ -61,6 +109,11 @@ class AnnotatedI(BaseInterface):
             if not hasattr(self, field):
                 raise NotImplementedError(f"[{self.__class__.__name__}] requires attr '{field}'")
 
+    def to_dict(self) -> dict[str, Any]:
+        """Annotated attrs that are set (or have a default), eg. for sinks.EventSink. The event_codecs format ('from_' -> 'from')"""
+        import event_codecs # imports this module
+        return event_codecs.codec(type(self)).to_dict(self)
+
 
 
 class EventI(AnnotatedI):
@@ -71,10 +124,6 @@ class EventI(AnnotatedI):
     event_type: str # if not set, raise exception. [snmp_trap, trace_route, correlation_match, gap, unique_correlation_match, jitter]
     required_fields = ['event_type']
 
-    def __init__(self, *args, **kwargs):
-        self._required_fields.extend(EventI.required_fields)
-        super().__init__(*args, **kwargs)
-
 
 class CorrelationEventI(EventI):
     """
@@ -84,10 +133,6 @@ class CorrelationEventI(EventI):
     match_type: str # [before, before_and_after, after, trace_route_stats, raw_trace_route, trace_route, route_changed]
     required_fields = ['match_type']
 
-    def __init__(self, *args, **kwargs):
-        self._required_fields.extend(CorrelationEventI.required_fields)
-        super().__init__(*args, **kwargs)
-
 
 # ------------------------------------------------------------------------------
 
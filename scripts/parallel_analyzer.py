@@ -0,0 +1,143 @@
+import queue
+import heapq
+import multiprocessing
+from typing import Iterator
+
+import numpy as np
+
+import emil_types
+import utils
+import sinks
+import crude_reader
+import crude_cache
+
+
+class ShardedCrudeAnalyzer():
+    """
+    CrudeAnalyzer spread over worker processes.
+    This process reads and parses the file in batches and shards the records on stream id (id % workers).
+    Each worker runs its own CrudeAnalyzer (one CrudeStreamAnalyzer per stream) and returns its gaps.
+    Gaps from all workers are merged on (timestamp, stream_id, order in stream), same result as analyze_serial().
+    No CrudeAnalyzer plugins (GapSumAggregator, JitterReporter), gaps only.
+
+    analyzer = ShardedCrudeAnalyzer(workers=4, window_size=100, h_limit=5, t_limit=5, start_gap_threshold=6, end_gap_threshold=5)
+    gaps = analyzer.analyze(filename)
+    """
+
+    def __init__(self, workers=0, batch_size=64*crude_reader.KB, queue_size=8, cache=None, filter=None, *args, **kwargs):
+        self.workers: int = int(workers) or multiprocessing.cpu_count()
+        self.batch_size: int = int(batch_size)
+        self.queue_size: int = int(queue_size) # batches in flight per worker, bounds memory when workers are slower than the reader
+        self.cache: crude_cache.CrudeCache = cache # read parsed columns from the cache instead of parsing the file
+        self.filter: crude_reader.CrudeFilter = filter # only these streams / hosts / tx window
+        self.kwargs: dict = kwargs # passed on to CrudeAnalyzer / CrudeStreamAnalyzer
+        self.reader: crude_reader.CrudeReader = None
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] workers={self.workers}, {self.reader}"
+
+    def batches(self, filename) -> Iterator[crude_reader.CrudeBatch]:
+        if self.cache is not None:
+            self.reader = self.cache.reader(filename, batch_size=self.batch_size, filter=self.filter)
+        else:
+            self.reader = crude_reader.CrudeReader(filename=filename, batch_size=self.batch_size, filter=self.filter)
+        return self.reader.batches()
+
+    def analyze(self, filename) -> list[dict]:
+        """Returns all gaps of the file as dicts (Gap.to_dict()), sorted on timestamp"""
+        if self.workers == 1:
+            return self.analyze_serial(filename)
+
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue(maxsize=self.queue_size) for i in range(self.workers)]
+        results = context.Queue()
+        processes = [context.Process(target=_worker, args=(inbox, results, self.kwargs), daemon=True) for inbox in inboxes]
+        for process in processes:
+            process.start()
+
+        hosts_sent: int = 0
+        try:
+            for batch in self.batches(filename):
+                new_hosts: list[str] = batch.hosts.hosts[hosts_sent:] # workers build the same host table
+                hosts_sent += len(new_hosts)
+                shards = batch.id % self.workers
+                for worker, inbox in enumerate(inboxes):
+                    mask = shards == worker
+                    columns = batch[mask].columns() if np.count_nonzero(mask) else None
+                    if columns is None and not new_hosts:
+                        continue
+                    self._put(inbox, (new_hosts, columns), processes)
+            for inbox in inboxes:
+                self._put(inbox, None, processes) # done, cleanup and send gaps
+            gaps_per_worker = [self._get_result(results, processes) for process in processes]
+        finally:
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+            for inbox in inboxes: # batches a dead worker never read would block the exit (queue feeder thread)
+                inbox.cancel_join_thread()
+                inbox.close()
+
+        return [gap for key, gap in heapq.merge(*gaps_per_worker)]
+
+    @staticmethod
+    def _check_workers(processes) -> None:
+        for process in processes:
+            if process.exitcode not in (None, 0):
+                raise Exception(f"[ShardedCrudeAnalyzer] worker {process.name} died (exitcode={process.exitcode})")
+
+    @classmethod
+    def _put(cls, inbox, message, processes) -> None:
+        """Wait for room in a worker inbox, fail instead of hanging if a worker died (its inbox never empties)"""
+        while True:
+            try:
+                return inbox.put(message, timeout=1)
+            except queue.Full:
+                cls._check_workers(processes)
+
+    @classmethod
+    def _get_result(cls, results, processes) -> list:
+        """Wait for the next worker result, fail instead of hanging if a worker died"""
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                cls._check_workers(processes)
+
+    def analyze_serial(self, filename) -> list[dict]:
+        """Same as analyze() in this process only"""
+        sink = sinks.MemorySink()
+        analyzer = utils.CrudeAnalyzer(sink=sink, **self.kwargs)
+        for batch in self.batches(filename):
+            analyzer.add_batch(batch)
+        analyzer.cleanup()
+        return [gap for key, gap in sorted(_keyed(sink.events))]
+
+
+def _keyed(gaps: list[dict]) -> list[tuple]:
+    """(sort key, gap) pairs. The key keeps the order within each stream when sorting/merging on timestamp"""
+    return [((gap['timestamp'], gap['stream_id'], i), gap) for i, gap in enumerate(gaps)]
+
+
+def _worker(inbox, results, kwargs) -> None:
+    """Runs in a worker process: feeds its shard of every batch to its own CrudeAnalyzer"""
+    sink = sinks.MemorySink()
+    analyzer = utils.CrudeAnalyzer(sink=sink, **kwargs)
+    hosts: emil_types.HostTable = emil_types.HOSTS
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        new_hosts, columns = message
+        for host in new_hosts: # same order as in the reader -> same indexes
+            hosts.intern(host)
+        if columns is not None:
+            analyzer.add_batch(emil_types.CrudeRecordStore.from_columns(hosts=hosts, **columns))
+    analyzer.cleanup()
+    results.put(sorted(_keyed(sink.events)))
+
+
+def analyze_file(filename, workers=0, *args, **kwargs) -> list[dict]:
+    """Shortcut for ShardedCrudeAnalyzer(workers, **kwargs).analyze(filename)"""
+    return ShardedCrudeAnalyzer(workers=workers, **kwargs).analyze(filename)
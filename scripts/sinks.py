@@ -0,0 +1,263 @@
+import sys
+import asyncio
+import json
+import gzip
+import time
+import sqlite3
+import datetime as dt_module
+from typing import Any, Callable
+
+
+class EventSink():
+    """
+    Buffered destination for finished events (gaps, gapsums, ...).
+    Events are serialized on emit (to_dict() if they have it) and written in batches,
+    when max_events are buffered or the oldest buffered event is max_delay seconds old.
+    A sink is callable, so it can be passed anywhere an event callback is expected (eg. CrudeStreamAnalyzer(sink=...)).
+
+    extended classes must define
+    def _write(self, events: list[dict]) -> None
+    """
+
+    def __init__(self, max_events=1000, max_delay=1.0, *args, **kwargs):
+        self.max_events: int = int(max_events)
+        self.max_delay: float = float(max_delay) # seconds
+        self.buffer: list[dict] = []
+        self.buffered_since: float = 0.0 # time.monotonic() of oldest buffered event
+        self.event_counter: int = 0
+        self.flush_counter: int = 0
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] events={self.event_counter}, flushes={self.flush_counter}, buffered={len(self.buffer)}"
+
+    def __call__(self, event) -> None:
+        self.emit(event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @staticmethod
+    def serialize(event) -> dict:
+        return event.to_dict() if hasattr(event, 'to_dict') else event
+
+    def emit(self, event) -> None:
+        if not self.buffer:
+            self.buffered_since = time.monotonic()
+        self.buffer.append(self.serialize(event))
+        self.event_counter += 1
+        if len(self.buffer) >= self.max_events or time.monotonic() - self.buffered_since >= self.max_delay:
+            self.flush()
+
+    def poll(self) -> None:
+        """Flush if the oldest buffered event is older than max_delay. For callers that idle between events"""
+        if self.buffer and time.monotonic() - self.buffered_since >= self.max_delay:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        events, self.buffer = self.buffer, []
+        self._write(events)
+        self.flush_counter += 1
+
+    def close(self) -> None:
+        self.flush()
+
+    def _write(self, events: list[dict]) -> None:
+        raise NotImplementedError(f"[{self.__class__.__name__}] must define _write()")
+
+
+class MemorySink(EventSink):
+    """Keeps all events in self.events"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events: list[dict] = []
+
+    def _write(self, events: list[dict]) -> None:
+        self.events.extend(events)
+
+
+class PrintSink(EventSink):
+    """Newline delimited json to stdout (or any text stream), one write per flush"""
+
+    def __init__(self, stream=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stream = stream if stream is not None else sys.stdout
+
+    def _write(self, events: list[dict]) -> None:
+        self.stream.write("".join(json.dumps(event) + "\n" for event in events))
+        self.stream.flush()
+
+
+class JsonLinesSink(EventSink):
+    """Newline delimited json file, appends if the file exists"""
+
+    def __init__(self, filename, mode='a', *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filename: str = str(filename)
+        self.file = self._open(mode=mode)
+
+    def __str__(self) -> str:
+        return f"{super().__str__()}, filename={self.filename}"
+
+    def _open(self, mode):
+        return open(self.filename, mode=mode + 't')
+
+    def _write(self, events: list[dict]) -> None:
+        self.file.write("".join(json.dumps(event) + "\n" for event in events))
+        self.file.flush()
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+
+class GzipJsonLinesSink(JsonLinesSink):
+    """Gzipped newline delimited json. Each flush is written as its own gzip member, readable by gzip.open()"""
+
+    def __init__(self, filename, mode='a', compresslevel=6, *args, **kwargs):
+        self.compresslevel: int = int(compresslevel)
+        super().__init__(filename, mode, *args, **kwargs)
+
+    def _open(self, mode):
+        return open(self.filename, mode=mode + 'b')
+
+    def _write(self, events: list[dict]) -> None:
+        data = "".join(json.dumps(event) + "\n" for event in events).encode('utf-8')
+        self.file.write(gzip.compress(data, compresslevel=self.compresslevel))
+        self.file.flush()
+
+
+class SqliteSink(EventSink):
+    """
+    Events as json in a sqlite table (event_type, timestamp, body), one transaction per flush.
+    select json_extract(body, '$.tloss') from events where event_type = 'gap'
+    """
+
+    def __init__(self, filename, table='events', *args, **kwargs):
+        if not str(table).isidentifier(): # the name goes into the sql, values don't
+            raise Exception(f"[{self.__class__.__name__}] table name must be an identifier, got {table!r}")
+        super().__init__(*args, **kwargs)
+        self.filename: str = str(filename)
+        self.table: str = table
+        self.connection: sqlite3.Connection = sqlite3.connect(self.filename, check_same_thread=False) # AsyncSink writes from an executor thread, one flush at a time
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" (event_type TEXT, timestamp REAL, body TEXT)')
+        self.connection.commit()
+
+    def _write(self, events: list[dict]) -> None:
+        with self.connection: # commit or rollback
+            self.connection.executemany(
+                f'INSERT INTO "{self.table}" (event_type, timestamp, body) VALUES (?, ?, ?)',
+                [(event.get('event_type'), event.get('timestamp'), json.dumps(event)) for event in events],
+            )
+
+    def close(self) -> None:
+        super().close()
+        self.connection.close()
+
+
+class DjangoSink(EventSink):
+    """
+    Django model rows through bulk_create, one transaction per flush. Django must be set up by the caller.
+    to_fields maps an event dict to model kwargs. Default: keys that are model fields, 'datetime' is filled from 'timestamp'.
+    Gap events of the analyzer need gap_fields() for microdep.models.Gap (NOT NULL columns the gap dicts don't fill):
+
+    sink = DjangoSink(microdep_models.Gap, to_fields=gap_fields)
+    """
+
+    def __init__(self, model, to_fields: Callable[[dict], dict]=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model = model
+        self.to_fields: Callable[[dict], dict] = to_fields or self._model_fields
+        self.field_names: set[str] = {field.name for field in model._meta.concrete_fields if not field.primary_key}
+
+    def _model_fields(self, event: dict) -> dict[str, Any]:
+        fields = {name: value for name, value in event.items() if name in self.field_names}
+        if 'datetime' in self.field_names and 'datetime' not in fields and event.get('timestamp') is not None:
+            fields['datetime'] = dt_module.datetime.fromtimestamp(event['timestamp'], dt_module.timezone.utc)
+        return fields
+
+    def _write(self, events: list[dict]) -> None:
+        from django.db import transaction # optional dependency, only needed for this sink
+        with transaction.atomic():
+            self.model.objects.bulk_create([self.model(**self.to_fields(event)) for event in events], batch_size=self.max_events)
+
+
+GAP_FLOAT_FIELDS: tuple = (
+    'h_ddelay', 'h_delay', 'h_jit', 'h_min_d', 'h_slope_10', 'h_slope_20', 'h_slope_30', 'h_slope_40', 'h_slope_50',
+    't_ddelay', 't_delay', 't_jit', 't_min_d', 't_slope_10', 't_slope_20', 't_slope_30', 't_slope_40', 't_slope_50',
+    'tloss',
+) # NOT NULL float columns of microdep.models.Gap
+
+
+def gap_fields(event: dict) -> dict[str, Any]:
+    """
+    DjangoSink to_fields for gap events (emil_types.Gap.to_dict()) -> microdep.models.Gap kwargs.
+    None (slopes of short heads / tails, no baseline) is stored as 0.0, type is the gap_type, overlap isn't computed by
+    the analyzer (0).
+    """
+    fields: dict[str, Any] = {name: event.get(name) or '' for name in ('from_ip', 'from_adr', 'to_ip', 'to_adr')}
+    fields.update({name: event[name] if event.get(name) is not None else 0.0 for name in GAP_FLOAT_FIELDS})
+    fields['timestamp'] = event['timestamp']
+    fields['datetime'] = dt_module.datetime.fromtimestamp(event['timestamp'], dt_module.timezone.utc)
+    fields['h_n'] = event.get('h_n') or 0
+    fields['t_n'] = event.get('t_n') or 0
+    fields['overlap'] = event.get('overlap') or 0
+    fields['type'] = event.get('gap_type') or ''
+    fields['event_type'] = event.get('event_type') or 'gap'
+    return fields
+
+
+class AsyncSink():
+    """
+    asyncio front for an EventSink: events are buffered the same way (max_events / max_delay),
+    the blocking _write() of a flush runs in an executor so a slow disk or database doesn't stall the event loop.
+    One flush at a time, emit() waits while a full buffer is being written (backpressure on the producer).
+    The executor should have a single thread for sinks that are bound to their thread (sqlite).
+
+    sink = AsyncSink(JsonLinesSink('gaps.jsonl'))
+    await sink.emit(gap)
+    await sink.close()
+    """
+
+    def __init__(self, sink: EventSink, executor=None, *args, **kwargs):
+        self.sink: EventSink = sink
+        self.executor = executor # None: the loop's default executor
+        self._lock: asyncio.Lock = None # created in the running loop
+        self.write_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] {self.sink}, write_seconds={self.write_seconds:.2f}"
+
+    async def emit(self, event) -> None:
+        sink = self.sink
+        if not sink.buffer:
+            sink.buffered_since = time.monotonic()
+        sink.buffer.append(sink.serialize(event))
+        sink.event_counter += 1
+        if len(sink.buffer) >= sink.max_events or time.monotonic() - sink.buffered_since >= sink.max_delay:
+            await self.flush()
+
+    async def poll(self) -> None:
+        if self.sink.buffer and time.monotonic() - self.sink.buffered_since >= self.sink.max_delay:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.sink.buffer:
+                return
+            events, self.sink.buffer = self.sink.buffer, []
+            start = time.monotonic()
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.sink._write, events)
+            self.write_seconds += time.monotonic() - start
+            self.sink.flush_counter += 1
+
+    async def close(self) -> None:
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.sink.close)
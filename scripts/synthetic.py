@@ -0,0 +1,156 @@
+import os
+import sys
+import gzip
+import time
+import random
+import argparse
+import datetime as dt_module
+from typing import Iterator
+
+# Synthetic crude lines for benchmarks and local experiments. Same format as crude_custom.txt
+# Synthetic traceroute output (traceroute_{ip}.gz, format see traceroute.py): traceroute_lines(), write_traceroute()
+# usage: python synthetic.py live <node dir> [--rate 1000] [--streams 4] [--rotate 60] [--gap-every 500]   (writer for follow.py)
+CRUDE_LINE: str = "ID={id} SEQ={seq} SRC={src}:3218 DST={dst}:10001 Tx={tx:.6f} Rx={rx:.6f} SIZE=64 HOPLIMIT={hoplimit}\n"
+CRUDE_HEADER: list[str] = [
+    "# crude synthetic\n",
+    "# generated by synthetic.py\n",
+    "# \n",
+    "# \n",
+]
+
+
+def crude_lines(n, streams=1, interval=0.01, start_tx=1613445013.0, gap_every=0, gap_size=20, reorder_every=0, seed=1, *args, **kwargs) -> Iterator[str]:
+    """
+    Yields n crude lines spread round robin over #streams stream ids (1, 2, ...).
+        gap_every: drop #gap_size packets every #gap_every packets of a stream
+        reorder_every: swap two neighbouring packets every #reorder_every packets of a stream
+    """
+    rand = random.Random(seed)
+    seqs: list[int] = [0] * streams
+    delayed: list = [None] * streams # packet held back to be sent after the next one (reordering)
+    for i in range(n):
+        stream: int = i % streams
+        seqs[stream] += 1
+        seq: int = seqs[stream]
+        if gap_every and seq % gap_every == 0:
+            seqs[stream] += gap_size
+        tx: float = start_tx + (i // streams) * interval
+        line: str = CRUDE_LINE.format(
+            id=stream+1,
+            seq=seq,
+            src=f"10.0.{stream // 250}.{stream % 250 + 1}",
+            dst="158.39.1.90",
+            tx=tx,
+            rx=tx + 0.004 + rand.random() * 0.001,
+            hoplimit=-1,
+        )
+        if delayed[stream] is not None:
+            yield line
+            yield delayed[stream]
+            delayed[stream] = None
+        elif reorder_every and seq % reorder_every == 0:
+            delayed[stream] = line
+        else:
+            yield line
+    for line in delayed:
+        if line is not None:
+            yield line
+
+
+def write_crude(filename, n, header=True, *args, **kwargs) -> str:
+    """Write #n synthetic lines to filename (gzip if it ends with .gz), kwargs are passed to crude_lines()"""
+    opener = gzip.open if str(filename).endswith('.gz') else open
+    with opener(filename, mode='wt') as file:
+        if header:
+            file.writelines(CRUDE_HEADER)
+        file.writelines(crude_lines(n=n, **kwargs))
+    return str(filename)
+
+
+def traceroute_lines(runs, target="128.39.19.150", hops=8, interval=300.0, start=1612656000.0, probes=3, loss=0.05, paths=2, seed=1, *args, **kwargs) -> Iterator[str]:
+    """
+    Yields #runs traceroute runs every #interval seconds, each with the unix time on its header line.
+        paths: routes the hops alternate between (hop i of path p is router r{i}-{p}), loss: share of probes answered with '*'
+    """
+    rand = random.Random(seed)
+    for run in range(runs):
+        yield f"{start + run * interval:.0f} traceroute to {target} ({target}), 30 hops max, 60 byte packets\n"
+        path = rand.randrange(paths)
+        for hop in range(1, hops + 1):
+            branch = path if hop not in (1, hops) else 0 # the first and last hop are shared
+            router = f"r{hop}-{branch}"
+            address = f"10.{branch}.{hop}.1" if hop < hops else target
+            name = f"{router}.uninett.no" if hop < hops else target
+            probe_texts, shown = [], False
+            for _ in range(probes):
+                if rand.random() < loss:
+                    probe_texts.append("*")
+                    continue
+                rtt = hop * 0.8 + rand.random() * 0.5
+                probe_texts.append(f"{rtt:.3f} ms" if shown else f"{name} ({address})  {rtt:.3f} ms")
+                shown = True
+            yield f"{hop:2d}  {'  '.join(probe_texts)}\n"
+
+
+def write_traceroute(filename, runs, *args, **kwargs) -> str:
+    """Write #runs synthetic traceroute runs to filename (gzip if it ends with .gz), kwargs are passed to traceroute_lines()"""
+    opener = gzip.open if str(filename).endswith('.gz') else open
+    with opener(filename, mode='wt') as file:
+        file.writelines(traceroute_lines(runs=runs, **kwargs))
+    return str(filename)
+
+
+def write_live(node_dir, rate=1000, streams=4, rotate=60.0, flush_interval=0.1, duration=None, *args, **kwargs) -> None:
+    """
+    Writes synthetic lines in real time (tx = now) to {node_dir}/{yyyy-mm-dd}/crude-HH_MM_SS.gz, like a measurement node.
+    #rate lines per second over all streams, flushed every flush_interval seconds so a reader sees them,
+    a new file every #rotate seconds and at midnight (utc). kwargs are passed to crude_lines()
+    """
+    start: float = time.time()
+    file = None
+    file_end: float = 0.0 # tx where the next file starts
+    end: float = start + duration if duration is not None else None
+    last_flush: float = time.monotonic()
+    try:
+        for line in crude_lines(n=sys.maxsize, streams=streams, interval=streams / rate, start_tx=start, **kwargs):
+            tx: float = float(line.split(' Tx=', 1)[1].split(' ', 1)[0])
+            if end is not None and tx >= end:
+                break
+            if file is None or tx >= file_end:
+                if file is not None:
+                    file.close()
+                opened = dt_module.datetime.fromtimestamp(tx, dt_module.timezone.utc)
+                midnight = dt_module.datetime.combine(opened.date() + dt_module.timedelta(days=1), dt_module.time(), dt_module.timezone.utc)
+                file_end = min(tx + rotate, midnight.timestamp())
+                os.makedirs(os.path.join(node_dir, opened.date().isoformat()), exist_ok=True)
+                path = os.path.join(node_dir, opened.date().isoformat(), opened.strftime('crude-%H_%M_%S.gz'))
+                file = gzip.open(path, mode='wt')
+                file.writelines(CRUDE_HEADER)
+                print(f"[write_live] {path}")
+            wait: float = tx - time.time()
+            if wait > 0 or time.monotonic() - last_flush >= flush_interval:
+                file.flush() # sync flush, everything written so far can be decompressed
+                last_flush = time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            file.write(line)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if file is not None:
+            file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic crude files")
+    commands = parser.add_subparsers(dest='command', required=True)
+    live = commands.add_parser('live', help="write lines in real time into a node directory (for follow.py)")
+    live.add_argument('node_dir')
+    live.add_argument('--rate', type=float, default=1000, help="lines per second, all streams")
+    live.add_argument('--streams', type=int, default=4)
+    live.add_argument('--rotate', type=float, default=60, help="seconds per file")
+    live.add_argument('--duration', type=float, help="stop after this many seconds")
+    live.add_argument('--gap-every', type=int, default=0, help="drop --gap-size packets every this many packets of a stream")
+    live.add_argument('--gap-size', type=int, default=20)
+    args = parser.parse_args()
+    write_live(args.node_dir, rate=args.rate, streams=args.streams, rotate=args.rotate, duration=args.duration, gap_every=args.gap_every, gap_size=args.gap_size)
@@ -0,0 +1,314 @@
+# Daily TraceRoute records (microdep_types.TraceRoute / HopStats) from the traceroute_{ip}.gz and tcptraceroute_{ip}.gz
+# files of the archive, see paths.txt.
+# usage: python traceroute.py --nodes 'ngu-mp*' --from 2021-02-07 [--to 2021-02-08] --out trace_routes.jsonl [--workers 8]
+#        python traceroute.py --files traceroute_128.39.19.150.gz ... --out trace_routes.jsonl
+#
+# Assumed file format (the output of traceroute / tcptraceroute appended run after run, plain text or gzip). A run starts
+# with a header line, its unix time first or on the line before (a line with only the time, or yyyy-mm-dd hh:mm:ss):
+#   1612656000 traceroute to 128.39.19.150 (128.39.19.150), 30 hops max, 60 byte packets
+#    1  teknobyen-gw2.uninett.no (158.38.0.221)  0.512 ms  0.498 ms *
+#    2  *  trd-gw.uninett.no (128.39.255.37)  0.712 ms  oslo-gw1.uninett.no (128.39.255.49)  1.270 ms
+#    3  * * *
+# tcptraceroute headers ("Tracing the path to host (ip) on TCP port 80, 30 hops max") are read the same way, other
+# lines (Selected device ..., !H annotations) are skipped. Hosts without a name (traceroute -n) are their ip.
+#
+# One pass per file, a running statistic per (hop, router): first_seen, last_seen, seen (runs it answered at the hop),
+# avg / min / max / sdv of the rtt in ms (Welford) and loss (% of the probes lost), so memory is constant per
+# (hop, router) whatever the number of runs. The '*' probes of a hop are split across the routers that answered it in
+# that run, by their number of answers, so every '*' is counted once. A TraceRoute per file (from node, to target) and day.
+# Files are aggregated in parallel in a process pool, like batch.py.
+# imports
+import os
+import re
+import glob
+import gzip
+import time
+import argparse
+import datetime as dt_module
+import concurrent.futures
+from typing import Iterator, Union
+
+import batch
+import constants
+import event_codecs
+import microdep_types
+# End: imports -----------------------------------------------------------------
+HEADER = re.compile(r"^(?:(?P<time>\d+(?:\.\d+)?)\s+)?(?:\S*traceroute to|Tracing the path to)\s+(?P<host>\S+)(?:\s+\((?P<ip>[^)]+)\))?")
+TIME = re.compile(r"^\s*(?:(?P<unix>\d{9,}(?:\.\d+)?)|(?P<datetime>\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d(?:\.\d+)?))\s*$")
+HOP = re.compile(r"^\s*(?P<hop>\d+)\s+(?P<probes>\S.*)$")
+KINDS: tuple = ('traceroute', 'tcptraceroute')
+
+
+class HopRunningStats():
+    """Statistics of one (hop, router) over all runs, O(1) per probe (Welford for mean/variance, like emil_types.RunningStats)"""
+    __slots__ = ('first_seen', 'last_seen', 'seen', 'n', 'mean', 'm2', 'min', 'max', 'lost')
+
+    def __init__(self):
+        self.first_seen: float = None
+        self.last_seen: float = None
+        self.seen: int = 0 # runs with an answer from the router at this hop
+        self.n: int = 0 # rtts
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+        self.min: float = None
+        self.max: float = None
+        self.lost: float = 0.0 # its share of the '*' probes of the hop, in the runs the router answered
+
+    def __len__(self) -> int:
+        return self.n
+
+    def add_run(self, timestamp: float, rtts: list[float], lost: float) -> None:
+        self.seen += 1
+        self.lost += lost
+        if timestamp is not None:
+            self.first_seen = timestamp if self.first_seen is None else min(self.first_seen, timestamp)
+            self.last_seen = timestamp if self.last_seen is None else max(self.last_seen, timestamp)
+        for rtt in rtts:
+            self.n += 1
+            diff = rtt - self.mean
+            self.mean += diff / self.n
+            self.m2 += diff * (rtt - self.mean)
+            if self.min is None or rtt < self.min:
+                self.min = rtt
+            if self.max is None or rtt > self.max:
+                self.max = rtt
+
+    def avg(self) -> Union[float, None]:
+        return self.mean if self.n else None
+
+    def sdv(self) -> Union[float, None]:
+        """Population standard deviation of the rtt"""
+        return (self.m2 / self.n) ** 0.5 if self.n else None
+
+    def loss(self) -> Union[float, None]:
+        """% of the probes"""
+        return 100.0 * self.lost / (self.n + self.lost) if self.n + self.lost else None
+
+
+def parse_time(text: str) -> Union[float, None]:
+    """Unix time or yyyy-mm-dd hh:mm:ss (GMT) of a time line, None if it isn't one"""
+    match = TIME.match(text)
+    if match is None:
+        return None
+    if match.group('unix'):
+        return float(match.group('unix'))
+    return dt_module.datetime.fromisoformat(match.group('datetime')).replace(tzinfo=dt_module.timezone.utc).timestamp()
+
+
+def parse_hop(probes: str) -> list[tuple]:
+    """'r1 (10.0.0.1)  0.5 ms  *  r2 (10.0.0.2)  0.7 ms' -> [((name, ip), rtt), (None, None), ((name, ip), rtt)], None rtt for lost probes"""
+    tokens = probes.split()
+    result: list[tuple] = []
+    router: tuple = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '*':
+            result.append((None, None))
+        elif i + 1 < len(tokens) and tokens[i + 1] == 'ms':
+            try:
+                result.append((router, float(token)))
+            except ValueError:
+                pass
+            i += 1
+        elif i + 1 < len(tokens) and tokens[i + 1].startswith('(') and tokens[i + 1].endswith(')'):
+            router = (token, tokens[i + 1][1:-1])
+            i += 1
+        elif not token.startswith('!') and (token[0].isdigit() or ':' in token): # traceroute -n, a bare ip
+            router = (token, token)
+        i += 1
+    return result
+
+
+class TraceRouteAggregator():
+    """
+    The TraceRoute of one traceroute file (a node and target, a day), one pass over its lines.
+    aggregator = TraceRouteAggregator(from_='teknobyen-mp.uninett.no', date='2021-02-07')
+    aggregator.extend(lines)
+    aggregator.trace_route() -> microdep_types.TraceRoute
+    """
+
+    def __init__(self, from_=None, to=None, date=None, kind='traceroute', *args, **kwargs):
+        self.from_: str = from_
+        self.to: str = to # target, from the headers when not given
+        self.date: str = date # yyyy-mm-dd, from the first run when not given
+        self.kind: str = kind
+        self.stats: dict[tuple, HopRunningStats] = {} # (hop, router name, ip) -> stats
+        self.runs: int = 0
+        self.lines: int = 0
+        self.skipped_lines: int = 0
+        self.silent_hops: int = 0 # hops without any answer ('* * *')
+        self._time: float = None # of the running run
+        self._pending_time: float = None # time line before a header
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] {self.kind} {self.from_} -> {self.to} {self.date}: runs={self.runs}, routers={len(self.stats)}, lines={self.lines}, skipped={self.skipped_lines}, silent_hops={self.silent_hops}"
+
+    def add_line(self, line: str) -> None:
+        self.lines += 1
+        header = HEADER.match(line) # before HOP, headers can start with the unix time
+        if header is not None:
+            self.runs += 1
+            self._time = float(header.group('time')) if header.group('time') else self._pending_time
+            self._pending_time = None
+            if self.to is None:
+                self.to = header.group('host')
+            if self.date is None and self._time is not None:
+                self.date = dt_module.datetime.fromtimestamp(self._time, tz=dt_module.timezone.utc).date().isoformat()
+            return
+        hop = HOP.match(line)
+        if hop is not None and self.runs:
+            self._add_hop(int(hop.group('hop')), parse_hop(hop.group('probes')))
+            return
+        timestamp = parse_time(line)
+        if timestamp is not None:
+            self._pending_time = timestamp
+        elif line.strip():
+            self.skipped_lines += 1
+
+    def extend(self, lines) -> None:
+        for line in lines:
+            self.add_line(line)
+
+    def _add_hop(self, hop: int, probes: list[tuple]) -> None:
+        routers: dict[tuple, list[float]] = {} # answers of the hop by router, in order
+        lost: int = 0
+        for router, rtt in probes:
+            if router is None:
+                lost += 1
+            else:
+                routers.setdefault(router, []).append(rtt)
+        if not routers:
+            self.silent_hops += 1
+            return
+        answers: int = len(probes) - lost
+        for (name, ip), rtts in routers.items():
+            key = (hop, name, ip)
+            if key not in self.stats:
+                self.stats[key] = HopRunningStats()
+            self.stats[key].add_run(self._time, rtts, lost * len(rtts) / answers)
+
+    def hop_stats(self) -> list[microdep_types.HopStats]:
+        """By hop, most seen router first"""
+        from_dict = event_codecs.codec(microdep_types.HopStats).from_dict
+        return [
+            from_dict({
+                'first_seen': stats.first_seen,
+                'last_seen': stats.last_seen,
+                'seen': stats.seen,
+                'sdv': stats.sdv(),
+                'avg': stats.avg(),
+                'min': stats.min,
+                'max': stats.max,
+                'hop': hop,
+                'loss': stats.loss(),
+                'router': name,
+                'address': ip,
+            })
+            for (hop, name, ip), stats in sorted(self.stats.items(), key=lambda item: (item[0][0], -item[1].seen, item[0][1]))
+        ]
+
+    def trace_route(self) -> microdep_types.TraceRoute:
+        day = dt_module.datetime.fromisoformat(self.date).replace(tzinfo=dt_module.timezone.utc).timestamp() if self.date else None
+        stats = self.hop_stats()
+        return microdep_types.TraceRoute(
+            from_=self.from_,
+            to=self.to,
+            timestamp_from=day,
+            timestamp_to=day + 86400 if day is not None else None,
+            tags=list(microdep_types.TraceRoute._defaults['tags']) + [self.kind],
+            stats=stats,
+            routers_used=list(dict.fromkeys(hop.router for hop in stats)),
+        )
+
+
+class TraceRouteFile():
+    """A traceroute file in the archive: {root}/{node}/{date}/traceroute_{ip}.gz (or tcptraceroute_{ip}.gz)"""
+
+    def __init__(self, path, *args, **kwargs):
+        self.path: str = str(path)
+        name = os.path.basename(self.path)
+        self.kind: str = name.split('_')[0] if name.split('_')[0] in KINDS else 'traceroute'
+        self.target: str = name.split('_', 1)[1].split('.gz')[0] if '_' in name else None # the ip of the file name
+        day_dir = os.path.dirname(os.path.abspath(self.path))
+        self.date: str = os.path.basename(day_dir)
+        try:
+            dt_module.date.fromisoformat(self.date)
+        except ValueError: # not in the archive layout
+            self.date = None
+        self.node: str = os.path.basename(os.path.dirname(day_dir)) if self.date else None
+        self.size: int = os.path.getsize(self.path)
+
+    def __str__(self) -> str:
+        return f"[{self.__class__.__name__}] {self.kind} {self.node}/{self.date} -> {self.target} ({self.size / 1024:.0f} KiB)"
+
+    def lines(self) -> Iterator[str]:
+        opener = gzip.open if self.path.endswith('.gz') else open
+        with opener(self.path, mode='rt', encoding='utf-8', errors='replace') as file:
+            yield from file
+
+    def aggregate(self) -> TraceRouteAggregator:
+        aggregator = TraceRouteAggregator(from_=self.node, date=self.date, kind=self.kind)
+        aggregator.extend(self.lines())
+        if aggregator.to is None:
+            aggregator.to = self.target
+        return aggregator
+
+
+def discover(nodes: list[str], date_from: str, date_to: str, root=constants.DATA_ROOT) -> list[TraceRouteFile]:
+    """All traceroute and tcptraceroute files for node globs and a date range, largest first"""
+    files: dict[str, TraceRouteFile] = {}
+    for date in batch.dates(date_from, date_to):
+        for node in nodes:
+            for pattern in (constants.TRACEROUTE_GLOB, constants.TCPTRACEROUTE_GLOB):
+                for path in glob.glob(os.path.join(root, pattern.format(node=node, date=date))):
+                    if path not in files:
+                        files[path] = TraceRouteFile(path)
+    return sorted(files.values(), key=lambda trace_route_file: trace_route_file.size, reverse=True)
+
+
+def aggregate(trace_route_file: TraceRouteFile) -> tuple[dict, str, float]:
+    """Runs in a pool process. Returns (TraceRoute as a dict, aggregator summary, seconds)"""
+    start = time.perf_counter()
+    aggregator = trace_route_file.aggregate()
+    return event_codecs.to_dict(aggregator.trace_route()), str(aggregator), time.perf_counter() - start
+
+
+def run(files: list[TraceRouteFile], workers=0) -> list[microdep_types.TraceRoute]:
+    """The TraceRoute of every file, aggregated in #workers processes (all cpus by default)"""
+    trace_routes: list[microdep_types.TraceRoute] = []
+    failed: int = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or None) as pool:
+        futures = {pool.submit(aggregate, trace_route_file): trace_route_file for trace_route_file in files} # largest first
+        for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                data, summary, seconds = future.result()
+                trace_routes.append(event_codecs.from_dict(data, microdep_types.TraceRoute))
+                print(f"[traceroute] {i}/{len(files)} {summary} in {seconds:.1f}s")
+            except Exception as e:
+                failed += 1
+                print(f"[traceroute] {i}/{len(files)} {futures[future]}: failed [{e}]")
+    print(f"[traceroute] done, {len(trace_routes)} trace routes, {failed} failed")
+    return sorted(trace_routes, key=lambda trace_route: (trace_route.timestamp_from or 0.0, trace_route.from_ or '', trace_route.to or ''))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily TraceRoute records from traceroute / tcptraceroute files")
+    parser.add_argument('--files', nargs='*', default=[], help="traceroute files")
+    parser.add_argument('--nodes', nargs='*', default=[], help="node globs in the archive, eg. 'ngu-mp*' '*'")
+    parser.add_argument('--from', dest='date_from', help="first day, yyyy-mm-dd")
+    parser.add_argument('--to', dest='date_to', help="last day (inclusive), default --from")
+    parser.add_argument('--root', default=constants.DATA_ROOT)
+    parser.add_argument('--out', help="trace routes as json lines, default: print")
+    parser.add_argument('--workers', type=int, default=0, help="processes, default: all cpus")
+    args = parser.parse_args()
+
+    files = [TraceRouteFile(path) for path in args.files]
+    if args.nodes:
+        files += discover(nodes=args.nodes, date_from=args.date_from, date_to=args.date_to or args.date_from, root=args.root)
+    trace_routes = run(files, workers=args.workers)
+    if args.out:
+        event_codecs.write_json_lines(trace_routes, args.out)
+    else:
+        for trace_route in trace_routes:
+            print(event_codecs.to_json(trace_route))
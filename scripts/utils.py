@@ -1,48 +1,49 @@
 import queue
 import emil_types
+import sinks
 from typing import Any, Optional
-import bisect
 
 
 class CrudeStreamAnalyzer():
     """Analyzes crude records for single stream-id"""
 
-    def __init__(self, stream_id, h_limit, t_limit, start_gap_threshold, end_gap_threshold, window_size=0, *args, **kwargs):
+    def __init__(self, stream_id, h_limit, t_limit, start_gap_threshold, end_gap_threshold, window_size=0, sink=None, baseline_size=1000, hosts=None, *args, **kwargs):
         self.stream_id: int = int(stream_id)
+        self.hosts: emil_types.HostTable = hosts if hosts is not None else emil_types.HOSTS # use the reader's table, records are then copied without interning
         self.h_limit: int = int(h_limit)
         self.t_limit: int = int(t_limit)
         self.start_gap_threshold: int = int(start_gap_threshold)
         self.end_gap_threshold: int = int(end_gap_threshold)
         self.late_threshold: int = 2000 # ms
-        self.window: list[emil_types.CrudeRecord] = []
-        self.buffer: list[emil_types.CrudeRecord] = []
+        self.window_size: int = int(window_size) or (2 * max(self.h_limit, self.end_gap_threshold))
+        self.window: emil_types.CrudeRingBuffer = emil_types.CrudeRingBuffer(capacity=self.window_size, hosts=self.hosts) # last #window_size in order records, oldest is dropped on append
+        self.buffer: emil_types.ReorderBuffer = emil_types.ReorderBuffer(hosts=self.hosts) # reorders records on seq before they enter the window
+        self.baseline: emil_types.RollingBaseline = emil_types.RollingBaseline(size=baseline_size) # least delay and sdv of the last #baseline_size records in the window
         self.small_gap_counter: int = 0
         self.big_gap_counter: int = 0
         self.record_counter: int = 0
         self.highest_seq: int = 0
-        self.window_size: int = int(window_size) or (2 * max(self.h_limit, self.end_gap_threshold))
 
         # keep track of occuring gaps
         # eg. save to file or db when gaps are finalized
         self.occuring_gap: emil_types.Gap = None
         self.unfinished_gaps: list[emil_types.Gap] = []
+        self.sink: sinks.EventSink = sink if sink is not None else sinks.PrintSink() # receives finished gaps, any callable works
 
     def __str__(self, show_records:int=0) -> str:
         s: str = f"[CrudeStreamAnalyzer #{self.stream_id}] window_size={self.window_size}, window={len(self.window)}, highest_seq={self.highest_seq}, small_gaps={self.small_gap_counter}, big_gaps={self.big_gap_counter}"
         if show_records > 0:
-            s += "".join([ f"\n\t{record.__dict__}" for record in self.window[-show_records:]])
+            s += "".join([ f"\n\t{record}" for record in self.window[-show_records:]])
         return s
 
     def _add_record_to_tail_of_unfinished_gaps(self) -> None:
         for i, gap in enumerate(self.unfinished_gaps):
             if len(gap.tail) >= self.t_limit: # Gap() is complete
                 # finalize gap (write to file/db) and pop from list
-                # print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][_update_unfinished_gaps] Gap found: {gap} ") # print gap that was detected
-                print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][_update_unfinished_gaps] Gap found: {[r.seq for r in gap.head]} - {[r.seq for r in gap.tail]} ") # print gap that was detected
-                print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][_update_unfinished_gaps] Gap found: {gap.to_json(indent=4)} ") # print gap that was detected
+                self.sink(gap)
                 del self.unfinished_gaps[i]
             else:
-                gap.tail.append(self.window[-1]) # add last record to tail of unfinished gap
+                gap.add_record_to_tail(self.window[-1]) # add last record to tail of unfinished gap
 
     def _is_start_gap(self) -> bool:
         if self.occuring_gap: # can't start new gap during another
@@ -78,9 +79,13 @@ class CrudeStreamAnalyzer():
 
         if self._is_start_gap(): # currently not occuring a gap
             # print(f"[CrudeStreamAnalyzer #{self.stream_id}][_gap_handler] last {self.start_gap_threshold*2} packets: {[(record.id, record.seq) for record in self.window[-self.start_gap_threshold*2:]]}") # print records that identifies end of gap
-            self.occuring_gap = emil_types.Gap(from_adr="", from_ip="", to_adr="", to_ip="", datetime="", timestamp=1)
+            last_record = self.window[-2] # last record before the gap
+            self.occuring_gap = emil_types.Gap(
+                from_adr="", from_ip=last_record.src, to_adr="", to_ip=last_record.dst, datetime="", timestamp=last_record.rx, stream_id=self.stream_id,
+                least_delay=self.baseline.least_delay(), delay_sdv=self.baseline.sdv(), hosts=self.hosts,
+            )
             h_start_index: int = -self.h_limit-1 # index of head start (#h_limit records before #start_gap_threshold records detected gap)
-            self.occuring_gap.head = self.window[h_start_index:-1] # #h_limit records before gap start
+            self.occuring_gap.add_records_to_head(self.window[h_start_index:-1]) # #h_limit records before gap start (copy)
             self.big_gap_counter += 1
 
         # detect end of gap
@@ -101,31 +106,31 @@ class CrudeStreamAnalyzer():
         """Do something with incomplete gaps"""
         # push last of buffer through window
         while len(self.buffer) > 0:
-            self.window.append(self.buffer.pop(0))
-            if len(self.window) > self.window_size: # window is full, pop oldest record
-                self.window.pop(0)
+            self._move_to_window()
             self._gap_handler()
 
         # handle last state before ending
         if self.occuring_gap:
-            print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][cleanup] Gap found: {[r.seq for r in self.occuring_gap.head]} - {[r.seq for r in self.occuring_gap.tail]} ") # print gap that was detected
-            print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][cleanup] Gap found: {self.occuring_gap.to_json(indent=4)} ") # print gap that was detected
+            self.sink(self.occuring_gap)
         for gap in self.unfinished_gaps:
-            print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][cleanup] Gap found: {[r.seq for r in gap.head]} - {[r.seq for r in gap.tail]} ") # print gap that was detected
-            print(f"\n[CrudeStreamAnalyzer #{self.stream_id}][cleanup] Gap found: {gap.to_json(indent=4)} ") # print gap that was detected
+            self.sink(gap)
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
 
 
+    def _move_to_window(self) -> None:
+        """Record with lowest seq from buffer to window (drops its oldest record when full)"""
+        self.buffer.pop_into(self.window)
+        if len(self.window) >= 2: # baseline is one record behind, so it only has records before a gap starting at window[-1]
+            self.baseline.add_record(self.window[-2])
+
     def _add_record(self, record: emil_types.CrudeRecord) -> None:
 
-        bisect.insort(self.buffer, record) # faster way of appending element to list while maintaining order
+        self.buffer.push(record) # O(log n), copies the record into the buffer
 
-        # buffer is full, move records to window
+        # buffer is full, move record with lowest seq to window. window drops its oldest record when full, O(1)
         if len(self.buffer) > self.window_size:
-            self.window.append(self.buffer.pop(0)) # finally add record
-
-        # window is full, pop oldest record
-        if len(self.window) > self.window_size:
-            self.window.pop(0)
+            self._move_to_window() # finally add record
 
         self.record_counter += 1
         if record.seq > self.highest_seq:
@@ -142,10 +147,14 @@ class CrudeStreamAnalyzer():
 class CrudeAnalyzer():
     """CrudeStreamAnalyzer wrapper. Handles multiple streams."""
 
-    def __init__(self, analyzer_cls=CrudeStreamAnalyzer, *args, **kwargs):
+    def __init__(self, analyzer_cls=CrudeStreamAnalyzer, sink=None, plugins=None, *args, **kwargs):
         self.kwargs: dict = kwargs
         self.analyzer_cls = analyzer_cls
         self.analyzers: dict = {}
+        self.sink: sinks.EventSink = sink if sink is not None else sinks.PrintSink() # shared by all stream analyzers
+        # plugins see every record and every finished gap in the same pass (eg. aggregators.GapSumAggregator)
+        # hooks: on_record(record), on_gap(gap), on_cleanup()
+        self.plugins: list = list(plugins or [])
 
     def __str__(self, *args, **kwargs) -> str:
         s: str = f"[CrudeAnalyzer] record_counter={self.record_count()}"
@@ -156,14 +165,42 @@ class CrudeAnalyzer():
         return sum([analyzer.record_counter for analyzer in self.analyzers.values()])
 
     def add_record(self, record: emil_types.CrudeRecord) -> None:
+        self._add_record(record)
+        for plugin in self.plugins:
+            plugin.on_record(record)
+
+    def _add_record(self, record: emil_types.CrudeRecord) -> None:
+        """add_record() without plugins"""
         id: int = record.id
         if id not in self.analyzers:
-            self.analyzers[id] = self.analyzer_cls(stream_id=id, **self.kwargs)
+            self.analyzers[id] = self.analyzer_cls(stream_id=id, sink=self._on_gap if self.plugins else self.sink, **self.kwargs)
         self.analyzers[id].add_record(record)
 
+    def _on_gap(self, gap) -> None:
+        """Stream analyzer sink when there are plugins"""
+        for plugin in self.plugins:
+            plugin.on_gap(gap)
+        self.sink(gap)
+
+    def add_batch(self, batch) -> None:
+        """Add all records of a crude_reader.CrudeBatch (or a CrudeRecordStore)"""
+        store = batch.store() if hasattr(batch, 'store') else batch
+        record_plugins = [plugin for plugin in self.plugins if not hasattr(plugin, 'on_batch')]
+        for plugin in self.plugins:
+            if hasattr(plugin, 'on_batch'): # whole batch at once, before the stream analyzers
+                plugin.on_batch(store)
+        for record in store:
+            self._add_record(record)
+            for plugin in record_plugins:
+                plugin.on_record(record)
+
     def cleanup(self, *args, **kwargs):
         for analyzer in self.analyzers.values():
             analyzer.cleanup()
+        for plugin in self.plugins:
+            plugin.on_cleanup()
+        if self.plugins and hasattr(self.sink, 'flush'): # stream analyzers only flush their own sink
+            self.sink.flush()
 
     def for_each(self, command:str, params:dict={}):
         """Runs a command (if defined) on each analyzer and returns the results"""